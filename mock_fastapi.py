@@ -65,7 +65,7 @@ if ENV_INTEGRATION:
             'CACHE_REDIS_ENCODING': 'utf-8',
 
             'CACHE_REDIS_USE_POOL': True,
-            'CACHE_REDIS_POOL_MINSIZE': 1,  # no effect
+            'CACHE_REDIS_POOL_MINSIZE': 5,  # connections opened by warm_up
             'CACHE_REDIS_POOL_MAXSIZE': 50,
 
             'CACHE_REDIS_USE_CLUSTER': False,  # for cluster not tested
@@ -171,7 +171,10 @@ async def cache_set_key(key, value, cache_backend=Depends(depends_cache_backend)
 
 @app.on_event("startup")
 async def startup_event():
-    pass
+    # 预先建立连接，避免第一批请求承担建立连接的延迟
+    stats = await cache.warm_up()
+    if stats is not None and stats["errors"]:
+        raise RuntimeError("Cache backend is not ready, errors=%s" % str(stats["errors"]))
 
 
 @app.on_event("shutdown")
@@ -1,10 +1,48 @@
-from ._decorators import async_method_in_loop
-# for cached
-from .aio_redis_backend import AIORedisBackend, AIORedisContext, AIORedisContextPool
-# for those use python < 3.4.4
-from .aio_redis_backend_py34 import AIORedisContext as AIORedisContextPy34, \
-    AIORedisContextPool as AIORedisContextPoolPy34
-from .aio_redis_backend_py34 import redis_context as redis_context_py34
-from .aredis_backend import ARedisBackend, ARedisContext, ARedisContextPool
+import importlib
+import sys
+
+from ._decorators import async_method_in_loop, async_method_inline, cached, make_cached_key
+from ._singleflight import SingleFlight
 from .async_cache_manager import AsyncCacheManager, CacheContext, CacheBackendContext
-from .backends import SimpleCacheBackend, SimpleCacheDictContext, NullCacheBackend, RedisBackend, RedisContext
+from .envelope import NOT_FOUND
+from .registry import BackendRegistry, register_backend
+
+# backend在第一次访问时才导入对应的模块，只使用simple_cache时不会加载aioredis, aredis和pydantic
+_LAZY_ATTRS = {
+    "AIORedisBackend": (".aio_redis_backend", "AIORedisBackend"),
+    "AIORedisContext": (".aio_redis_backend", "AIORedisContext"),
+    "AIORedisContextPool": (".aio_redis_backend", "AIORedisContextPool"),
+    # for those use python < 3.4.4
+    "AIORedisContextPy34": (".aio_redis_backend_py34", "AIORedisContext"),
+    "AIORedisContextPoolPy34": (".aio_redis_backend_py34", "AIORedisContextPool"),
+    "redis_context_py34": (".aio_redis_backend_py34", "redis_context"),
+    "ARedisBackend": (".aredis_backend", "ARedisBackend"),
+    "ARedisContext": (".aredis_backend", "ARedisContext"),
+    "ARedisContextPool": (".aredis_backend", "ARedisContextPool"),
+    "SimpleCacheBackend": (".backends", "SimpleCacheBackend"),
+    "SimpleCacheDictContext": (".backends", "SimpleCacheDictContext"),
+    "NullCacheBackend": (".backends", "NullCacheBackend"),
+    "RedisBackend": (".backends", "RedisBackend"),
+    "RedisContext": (".backends", "RedisContext"),
+    "TieredCacheBackend": (".tiered_backend", "TieredCacheBackend"),
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module_name, attr = _LAZY_ATTRS[name]
+    value = getattr(importlib.import_module(module_name, __name__), attr)
+    # 缓存到模块中，之后的访问不再经过__getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRS.keys()))
+
+
+if sys.version_info < (3, 7):
+    # 模块级别的__getattr__需要python 3.7
+    for _name in _LAZY_ATTRS:
+        __getattr__(_name)
@@ -17,8 +17,11 @@ limitations under the License.
 
 import asyncio
 import functools
+import hashlib
 from functools import wraps
 
+from ._singleflight import SingleFlight
+
 
 def async_method_in_loop(func):
     """
@@ -38,24 +41,78 @@ def async_method_in_loop(func):
 
     return async_method_wrapper
 
-# def cached(app, cache):
-#     """
-#     Decorator cache a function/method return to cache manger
-#     """
-#
-#     def decorator(func):
-#         @functools.wraps(func)
-#         async def _inner(*args, **kwargs):
-#             key = func.__name__
-#             res = await cache.get(key, (args, kwargs))
-#             if res:
-#                 print('using cache: {}'.format(res))
-#             else:
-#                 print('cache miss')
-#                 res = func(*args, **kwargs)
-#                 await cache.set(key, res, (args, kwargs))
-#             return res
-#
-#         return _inner
-#
-#     return decorator
+
+def async_method_inline(func):
+    """
+    Decorator for make Sync method call to Async, 在event loop所在线程直接执行，不经过executor线程池
+    适用于纯内存的轻量操作（例如dict查找），避免run_in_executor带来的future创建、线程切换和GIL竞争开销
+    注意：被装饰的方法不能有阻塞IO，否则会阻塞event loop
+    """
+
+    @wraps(func)
+    async def async_method_wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return async_method_wrapper
+
+
+def make_cached_key(prefix, args, kwargs):
+    """
+    使用函数参数生成稳定的缓存key，格式为"{prefix}:{sha1(args, kwargs)}"，kwargs与传入顺序无关
+    注意：参数的repr中包含内存地址的对象（例如方法的self）无法生成稳定的key，需要使用key_builder
+    """
+    raw = repr((args, sorted(kwargs.items())))
+    return "%s:%s" % (prefix, hashlib.sha1(raw.encode("utf-8")).hexdigest())
+
+
+def cached(cache, expire=None, pexpire=None, key_prefix=None, key_builder=None):
+    """
+    Decorator cache a function/method return to cache manger
+    同步和异步的函数都可以使用，被装饰后的函数都需要使用await调用，同步函数在executor线程池中执行
+    相同key的并发未命中只会调用一次被装饰的函数，其他调用等待并共享结果，避免缓存过期时的惊群效应
+    函数返回None时不会写入缓存
+    :cache - AsyncCacheManager or CacheBackend, 用于读写缓存
+    :expire - int default=None, 有效期，以秒为单位
+    :pexpire - int default=None, 有效期，以毫秒为单位
+    :key_prefix - str default=None, key的前缀，默认使用"{func.__module__}.{func.__qualname__}"
+    :key_builder - callable default=None, 使用函数的参数生成key，key_builder(*args, **kwargs)
+
+    使用demo举例
+    ```
+    @cached(cache, expire=60)
+    async def get_user(user_id):
+        return await db.fetch_user(user_id)
+    ```
+    """
+    ttl_kwargs = {}
+    if expire:
+        ttl_kwargs["expire"] = expire
+    if pexpire:
+        ttl_kwargs["pexpire"] = pexpire
+
+    def decorator(func):
+        prefix = key_prefix or "%s.%s" % (func.__module__, func.__qualname__)
+        loader = func if asyncio.iscoroutinefunction(func) else async_method_in_loop(func)
+        flight = SingleFlight()
+
+        async def load_and_set(key, args, kwargs):
+            value = await loader(*args, **kwargs)
+            if value is not None:
+                await cache.set(key, value, **ttl_kwargs)
+            return value
+
+        @wraps(func)
+        async def cached_wrapper(*args, **kwargs):
+            if key_builder is not None:
+                key = key_builder(*args, **kwargs)
+            else:
+                key = make_cached_key(prefix, args, kwargs)
+            value = await cache.get(key)
+            if value is not None:
+                return value
+            return await flight.do(key, load_and_set, key, args, kwargs)
+
+        cached_wrapper.single_flight = flight
+        return cached_wrapper
+
+    return decorator
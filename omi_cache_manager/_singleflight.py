@@ -0,0 +1,51 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import asyncio
+
+
+class SingleFlight(object):
+    """
+    合并同一个key的并发调用，同一时间同一个key只有一个调用在执行，其他调用等待并共享该调用的结果或异常
+    调用在独立的task中执行，发起调用的协程被取消时不会影响其他等待者
+    """
+
+    def __init__(self):
+        self._calls = dict()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        执行异步方法func(*args, **kwargs)，如果同一个key已经有调用在执行，则等待其结果
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # 所有等待者都被取消时，避免输出"exception was never retrieved"
+            task.exception()
@@ -16,11 +16,13 @@ limitations under the License.
 """
 
 import asyncio
+import time
 
 import aioredis
 from aioredis import ReplyError
 
-from .backends import RedisBackend, RedisContext
+from .async_cache_manager import make_mapping, parse_many_keys
+from .backends import RedisBackend, RedisContext, key_option, has_set_options, summarize_latencies
 
 
 class AIORedisContext(RedisContext):
@@ -38,12 +40,44 @@ class AIORedisContext(RedisContext):
         self.redis_uri = redis_uri
         self.timeout = timeout
         self.encoding = encoding
+        # 连接或连接池只在当前event loop中有效
+        self._loop = None
+        self._create_lock = None
 
     async def __aenter__(self):
-        if not self._conn_or_pool or self._conn_or_pool.closed:
-            await self.create()
+        """
+        获取长期持有的连接或连接池，只在第一次使用、被关闭或者event loop变化时创建，
+        使用连接池时每个命令从连接池中租用一个连接，执行完成后归还
+        """
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop or not self._conn_or_pool or self._conn_or_pool.closed:
+            if self._create_lock is None or self._loop is not loop:
+                self._create_lock = asyncio.Lock()
+                self._discard(loop)
+            async with self._create_lock:
+                # 等待锁期间可能已经被其他协程创建
+                if not self._conn_or_pool or self._conn_or_pool.closed:
+                    await self.create()
         return self._conn_or_pool
 
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """
+        不关闭连接或连接池，只在destroy中关闭
+        """
+
+    def _discard(self, loop):
+        """
+        丢弃在其他event loop中创建的连接或连接池
+        """
+        if self._conn_or_pool is not None and self._loop is not loop:
+            try:
+                self._conn_or_pool.close()
+            except RuntimeError:
+                # 原来的event loop已经关闭
+                pass
+            self._conn_or_pool = None
+        self._loop = loop
+
     async def create(self):
         """
         Proxy function for internal cache object.
@@ -62,8 +96,10 @@ class AIORedisContext(RedisContext):
         """
         if not self._conn_or_pool:
             return
-        self._conn_or_pool.close()
-        await self._conn_or_pool.wait_closed()
+        conn_or_pool, self._conn_or_pool = self._conn_or_pool, None
+        conn_or_pool.close()
+        if self._loop is asyncio.get_event_loop():
+            await conn_or_pool.wait_closed()
 
 
 class AIORedisContextPool(AIORedisContext):
@@ -133,7 +169,8 @@ class AIORedisBackend(RedisBackend):
             self._redis_cache_context = AIORedisContextPool(
                 redis_uri=self.redis_uri,
                 timeout=self.connection_timeout,
-                encoding=self.encoding,
+                # 使用serializer时value为bytes，不能按encoding解码
+                encoding=self.encoding if self.serializer is None else None,
                 minsize=self.pool_minsize,
                 maxsize=self.pool_maxsize
             )
@@ -141,7 +178,8 @@ class AIORedisBackend(RedisBackend):
             self._redis_cache_context = AIORedisContext(
                 redis_uri=self.redis_uri,
                 timeout=self.connection_timeout,
-                encoding=self.encoding,
+                # 使用serializer时value为bytes，不能按encoding解码
+                encoding=self.encoding if self.serializer is None else None,
             )
 
     def get_cache_context(self):
@@ -170,11 +208,54 @@ class AIORedisBackend(RedisBackend):
         """
         return self.get_cache_context()
 
+    async def warm_up(self, size=None):
+        """
+        创建连接池（预先建立CACHE_REDIS_POOL_MINSIZE个连接），然后并行租用size个连接，每个连接执行一次PING后归还，
+        返回{"connections", "ok", "errors", "latency_ms", "pool_create_ms", "elapsed_ms"}，
+        latency_ms为每个连接租用（需要时建立连接）并完成PING的延迟分布，pool_create_ms为创建连接池的耗时
+        :size - int default=None, 租用的连接数量，默认使用CACHE_REDIS_POOL_MINSIZE，不超过CACHE_REDIS_POOL_MAXSIZE
+        """
+        size = max(int(size or self.pool_minsize or 1), 1)
+        started = time.perf_counter()
+        async with self.get_async_context() as redis:
+            pool_create = time.perf_counter() - started
+            pool = redis.connection
+            if hasattr(pool, "acquire"):
+                size = min(size, pool.maxsize)
+            else:
+                # 不使用连接池时只有一个连接
+                size = 1
+
+            async def ping():
+                ping_started = time.perf_counter()
+                if hasattr(pool, "acquire"):
+                    conn = await pool.acquire()
+                    try:
+                        await conn.execute("PING")
+                    finally:
+                        pool.release(conn)
+                else:
+                    await pool.execute("PING")
+                return time.perf_counter() - ping_started
+
+            results = await asyncio.gather(*[ping() for _ in range(size)], return_exceptions=True)
+        samples = [result for result in results if not isinstance(result, BaseException)]
+        errors = [str(result) for result in results if isinstance(result, BaseException)]
+        return {
+            "connections": size,
+            "ok": len(samples),
+            "errors": errors,
+            "latency_ms": summarize_latencies(samples),
+            "pool_create_ms": pool_create * 1000,
+            "elapsed_ms": (time.perf_counter() - started) * 1000,
+        }
+
     def make_key(self, key):
         """
         生成key，使用f"{self.key_prefix}{key}"
+        @See KeyBuilder.build
         """
-        return f"{self.key_prefix}{key}"
+        return self.key_builder.build(key)
 
     async def get(self, *args, **kwargs):
         """
@@ -188,7 +269,7 @@ class AIORedisBackend(RedisBackend):
         else:
             raise TypeError("Too many or no key to get, args = %s kwargs= %s" % (str(args), str({**kwargs})))
         async with self.get_async_context() as conn:
-            return await conn.get(key)
+            return self.decode_value(await conn.get(key))
 
     async def set(self, *args, **kwargs):
         """
@@ -226,7 +307,7 @@ class AIORedisBackend(RedisBackend):
 
         async with self.get_async_context() as conn:
             result = await conn.set(key=key,
-                                    value=value,
+                                    value=self.encode_value(value),
                                     expire=expire,
                                     pexpire=pexpire,
                                     exist=exist)
@@ -256,10 +337,7 @@ class AIORedisBackend(RedisBackend):
         Implement function from CacheBackend interface
         @See CacheBackend.delete_many
         """
-        keys = []
-        for i in range(len(args)):
-            key = self.make_key(args[i])
-            keys.append(key)
+        keys = self.key_builder.build_many(args)
         async with self.get_async_context() as conn:
             if len(keys) > 0:
                 result = await conn.delete(*tuple(keys))
@@ -271,28 +349,43 @@ class AIORedisBackend(RedisBackend):
     async def get_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface
+        超过CACHE_REDIS_MGET_CHUNK_SIZE个key时拆分为多条MGET并发执行
+        传入一个key的iterable时返回{key: value}，未命中的key不包含在结果中，指定default时为default
         @See CacheBackend.get_many
         """
-        keys = []
-        for i in range(len(args)):
-            key = self.make_key(args[i])
-            keys.append(key)
+        many_keys = parse_many_keys(args)
+        if many_keys is not None and len(many_keys) == 0:
+            return {}
+        keys = self.key_builder.build_many(args if many_keys is None else many_keys)
         async with self.get_async_context() as conn:
             if len(keys) > 0:
-                result = await conn.mget(*tuple(keys))
+                result = await self.mget_chunked(conn, keys)
             else:
                 raise TypeError("No keys for get_many, args=%s" % str(args))
+        if self.serializer is not None:
+            result = [self.decode_value(value) for value in result]
+        if many_keys is not None:
+            return make_mapping(many_keys, result, kwargs)
         return result
 
     async def set_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface
+        不使用expire/pexpire/exist参数时使用MSET，返回MSET的结果
+        使用expire/pexpire/exist参数时，使用pipeline逐个执行`SET key value EX/PX NX/XX`，
+        按CACHE_REDIS_PIPELINE_CHUNK_SIZE分批发送，返回{key: bool}，条件不满足而没有写入的key为False
+        :expire - int or dict, 有效期，以秒为单位，使用dict时按key分别指定，例如{"key1": 60}
+        :pexpire - int or dict, 有效期，以毫秒为单位，使用dict时按key分别指定
+        :exist - str or dict, 可选值 "SET_IF_EXIST", "SET_IF_NOT_EXIST"，使用dict时按key分别指定
         @See CacheBackend.set_many
         """
-        kv2update = {
-            **{self.make_key(k): v for k, v in dict(args).items()},
-            **{self.make_key(k): v for k, v in kwargs.items()},
-        }
+        if has_set_options(kwargs):
+            return await self.set_many_pipelined(*args, **kwargs)
+        # 筛选除["expire","pexpire","exist"]以外的key-val
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        kv2update = {**dict(args), **filter_kv}
+        kv2update = dict(zip(self.key_builder.build_many(kv2update.keys()),
+                             [self.encode_value(v) for v in kv2update.values()]))
         async with self.get_async_context() as conn:
             if len(kv2update) > 0:
                 result = await conn.mset(kv2update)
@@ -300,6 +393,33 @@ class AIORedisBackend(RedisBackend):
                 raise TypeError("No keys for get_many, args=%s" % str(args))
         return result
 
+    async def set_many_pipelined(self, *args, **kwargs):
+        """
+        使用pipeline执行set_many，返回{key: bool}
+        @See AIORedisBackend.set_many
+        """
+        expire = kwargs.get("expire", None)
+        pexpire = kwargs.get("pexpire", None)
+        exist = kwargs.get("exist", None)
+        # 筛选除["expire","pexpire","exist"]以外的key-val
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        kv2update = {**dict(args), **filter_kv}
+        if len(kv2update) == 0:
+            raise TypeError("No keys for set_many, args=%s" % str(args))
+        results = {}
+        async with self.get_async_context() as conn:
+            for chunk in self.iter_chunks(list(kv2update.items())):
+                pipe = conn.pipeline()
+                for key, value in chunk:
+                    pipe.set(self.make_key(key), self.encode_value(value),
+                             expire=key_option(expire, key) or 0,
+                             pexpire=key_option(pexpire, key) or 0,
+                             exist=key_option(exist, key))
+                replies = await pipe.execute()
+                for (key, _), reply in zip(chunk, replies):
+                    results[key] = reply is True
+        return results
+
     async def execute(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface
@@ -359,16 +479,28 @@ class AIORedisBackend(RedisBackend):
                 result = await conn.execute(*tuple(args_to_execute), **kwargs)
             return result
 
+    async def clear_keys(self, batch_size=None, concurrency=None, progress=None):
+        """
+        使用SCAN + UNLINK分批清除全部符合`{CACHE_KEY_PREFIX}*`的key，返回统计信息
+        @See RedisBackend.scan_unlink
+        """
+        async with self.get_async_context() as conn:
+            return await self.scan_unlink(conn, self.make_key("*"), batch_size=batch_size,
+                                          concurrency=concurrency, progress=progress)
+
+    async def scan_keys(self, batch_size=None):
+        """
+        遍历全部符合`{CACHE_KEY_PREFIX}*`的key，返回去掉CACHE_KEY_PREFIX的key的list
+        @See RedisBackend.scan_prefix
+        """
+        async with self.get_async_context() as conn:
+            return await self.scan_prefix(conn, batch_size=batch_size)
+
     async def clear(self):
         """
         Implement function from CacheBackend interface
+        使用SCAN + UNLINK分批删除，统计信息保存在last_clear_stats
         @See CacheBackend.clear
         """
-        async with self.get_async_context() as conn:
-            keys = await conn.keys(self.make_key("*"))
-            if len(keys) > 0:
-                result = await conn.delete(*tuple(keys))
-            else:
-                # nothing to clear
-                return True
-        return result > 0
+        await self.clear_keys()
+        return True
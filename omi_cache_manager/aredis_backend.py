@@ -16,11 +16,15 @@ limitations under the License.
 """
 
 import asyncio
+import time
 from typing import Type
 
 from aredis import StrictRedis, StrictRedisCluster
 
-from .backends import RedisBackend, RedisContext
+from .async_cache_manager import make_mapping, parse_many_keys
+from .backends import RedisBackend, RedisContext, key_option, has_set_options, summarize_latencies
+from .cluster import group_by_slot
+from .keys import KeyBuilder
 
 
 class ARedisContext(RedisContext):
@@ -54,14 +58,27 @@ class ARedisContext(RedisContext):
         self.encoding = encoding
         self.decode_responses = decode_responses
         self._conn_or_pool = None
+        # 正在执行的操作数量，destroy时等待其完成
+        self._in_flight = 0
+        self._closing = False
 
     def __enter__(self):
+        if self._closing:
+            raise ConnectionError("Redis context is shutting down, no more connections are handed out")
         if not self._conn_or_pool:
             self.create()
+        self._in_flight += 1
         return self._conn_or_pool
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        self._in_flight -= 1
+
+    @property
+    def in_flight(self):
+        """
+        正在执行的操作数量
+        """
+        return self._in_flight
 
     def create(self):
         """
@@ -78,17 +95,47 @@ class ARedisContext(RedisContext):
             decode_responses=self.decode_responses
         )
 
-    def destroy(self):
+    async def destroy(self, timeout=5):
         """
         Proxy function for internal cache object.
+        优雅关闭，不再分配新的连接，等待正在执行的操作完成，最多等待timeout秒，然后断开连接池中的全部连接，
+        返回统计信息{"drained", "force_closed", "in_flight", "elapsed"}
+        drained为操作完成后正常关闭的连接数量，force_closed为超时后仍在使用而被强制关闭的连接数量，
+        in_flight为超时后仍未完成的操作数量
+        :timeout - float default=5, 等待正在执行的操作完成的最长时间，以秒为单位
         @See CacheContext.destroy
         """
+        stats = {"drained": 0, "force_closed": 0, "in_flight": 0, "elapsed": 0.0}
         if not self._conn_or_pool:
-            return
-        # NoOp just wait
-        # await asyncio.sleep(0.01)
-        # await self._conn_or_pool.disconnect_on_idle_time_exceeded()
-        # self._conn_or_pool.connection_pool.disconnect()
+            return stats
+        started = time.monotonic()
+        self._closing = True
+        try:
+            deadline = started + (timeout or 0)
+            while self._in_flight > 0 and time.monotonic() < deadline:
+                await asyncio.sleep(0.005)
+            pool = self._conn_or_pool.connection_pool
+            available, in_use = self.count_connections(pool)
+            stats["in_flight"] = self._in_flight
+            stats["force_closed"] = in_use
+            stats["drained"] = available
+            pool.disconnect()
+            self._conn_or_pool = None
+        finally:
+            self._closing = False
+        stats["elapsed"] = time.monotonic() - started
+        return stats
+
+    @staticmethod
+    def count_connections(pool):
+        """
+        返回连接池中(空闲的连接数量, 使用中的连接数量)，支持集群的连接池按node分组的情况
+        """
+        available = pool._available_connections
+        in_use = pool._in_use_connections
+        if isinstance(available, dict):
+            return sum(len(conns) for conns in available.values()), sum(len(conns) for conns in in_use.values())
+        return len(available), len(in_use)
 
 
 class ARedisContextPool(ARedisContext):
@@ -171,24 +218,33 @@ class ARedisBackend(RedisBackend):
             # 连接池
             self.use_pool = config.get('CACHE_REDIS_USE_POOL', True)
             self.use_cluster = config.get('CACHE_REDIS_USE_CLUSTER', False)
-            # self.pool_minsize = config.get('CACHE_REDIS_POOL_MINSIZE',1)
+            # warm_up时预先建立的连接数量
+            self.pool_minsize = config.get('CACHE_REDIS_POOL_MINSIZE', 1)
             self.pool_maxsize = config.get('CACHE_REDIS_POOL_MAXSIZE', None)
             self.max_idle_time = config.get('CACHE_REDIS_MAX_IDLE_TIME', 0)
             self.retry_on_timeout = config.get('CACHE_REDIS_RETRY_ON_TIMEOUT', False)
             self.idle_check_interval = config.get('CACHE_REDIS_IDLE_CHECK_INTERVAL', 1)
             # encoding
             self.encoding = config.get('CACHE_REDIS_ENCODING', 'utf-8')
+            # 默认的hash tag，设置后全部的key分配到同一个hash slot
+            self.hash_tag = config.get('CACHE_REDIS_HASH_TAG', None)
+            # 关闭时等待正在执行的操作完成的最长时间，以秒为单位
+            self.shutdown_timeout = config.get('CACHE_REDIS_SHUTDOWN_TIMEOUT', 5)
         else:
             self.connection_timeout = None
             self.decode_responses = True
             self.use_pool = True
             self.use_cluster = False
+            self.pool_minsize = 1
             self.pool_maxsize = None
             self.max_idle_time = 0
             self.retry_on_timeout = False
             self.idle_check_interval = 1
             self.encoding = 'utf-8'
+            self.hash_tag = None
+            self.shutdown_timeout = 5
 
+        self.last_shutdown_stats = None
         super().__init__(config=config)
 
     def create_cache_context(self):
@@ -213,7 +269,8 @@ class ARedisBackend(RedisBackend):
                 password=self.redis_password,
                 connect_timeout=self.connection_timeout,
                 encoding=self.encoding,
-                decode_responses=self.decode_responses,
+                # 使用serializer时value为bytes，不能按encoding解码
+                decode_responses=self.decode_responses and self.serializer is None,
                 max_connections=self.pool_maxsize,
                 retry_on_timeout=self.retry_on_timeout,
                 max_idle_time=self.max_idle_time,
@@ -228,7 +285,8 @@ class ARedisBackend(RedisBackend):
                 password=self.redis_password,
                 connect_timeout=self.connection_timeout,
                 encoding=self.encoding,
-                decode_responses=self.decode_responses,
+                # 使用serializer时value为bytes，不能按encoding解码
+                decode_responses=self.decode_responses and self.serializer is None,
             )
 
     def get_cache_context(self):
@@ -245,10 +303,11 @@ class ARedisBackend(RedisBackend):
         """
         if not self._redis_cache_context:
             return
-        self._redis_cache_context.destroy()
-        self._redis_cache_context = None
-        # just wait
-        return await asyncio.sleep(0.01)
+        context = self._redis_cache_context
+        self.last_shutdown_stats = await context.destroy(timeout=self.shutdown_timeout)
+        if self._redis_cache_context is context:
+            self._redis_cache_context = None
+        return self.last_shutdown_stats
 
     def get_async_context(self):
         """
@@ -257,11 +316,79 @@ class ARedisBackend(RedisBackend):
         """
         return self.get_cache_context()
 
-    def make_key(self, key):
+    async def warm_up(self, size=None):
+        """
+        预先并行建立size个连接，每个连接执行一次PING后归还到连接池，已失效的连接会被重新建立，
+        使用集群时每个master node建立size个连接
+        返回{"connections", "ok", "errors", "latency_ms", "elapsed_ms"}，latency_ms为每个连接建立连接并完成PING的延迟分布
+        :size - int default=None, 建立的连接数量，默认使用CACHE_REDIS_POOL_MINSIZE，不超过连接池的max_connections
+        """
+        size = max(int(size or self.pool_minsize or 1), 1)
+        started = time.perf_counter()
+        with self.get_async_context() as conn:
+            pool = conn.connection_pool
+
+            async def ping(connection):
+                ping_started = time.perf_counter()
+                try:
+                    await connection.send_command("PING")
+                    await connection.read_response()
+                except Exception:
+                    # 连接池中已失效的连接，断开后重新建立一次
+                    connection.disconnect()
+                    ping_started = time.perf_counter()
+                    await connection.send_command("PING")
+                    await connection.read_response()
+                return time.perf_counter() - ping_started
+
+            connections = []
+            try:
+                if self.use_cluster:
+                    await pool.initialize()
+                    masters = [node for node in pool.nodes.all_nodes() if node.get("server_type") == "master"]
+                    if pool.max_connections_per_node:
+                        size = min(size, pool.max_connections)
+                    else:
+                        # max_connections为全部node的连接总数
+                        size = min(size, max(pool.max_connections // max(len(masters), 1), 1))
+                    for node in masters:
+                        for _ in range(size):
+                            connections.append(pool.get_connection_by_node(node))
+                else:
+                    size = min(size, pool.max_connections)
+                    for _ in range(size):
+                        connections.append(pool.get_connection())
+                results = await asyncio.gather(*[ping(connection) for connection in connections],
+                                               return_exceptions=True)
+            finally:
+                for connection in connections:
+                    pool.release(connection)
+        samples = [result for result in results if not isinstance(result, BaseException)]
+        errors = [str(result) for result in results if isinstance(result, BaseException)]
+        return {
+            "connections": len(connections),
+            "ok": len(samples),
+            "errors": errors,
+            "latency_ms": summarize_latencies(samples),
+            "elapsed_ms": (time.perf_counter() - started) * 1000,
+        }
+
+    def make_key(self, key, hash_tag=None):
         """
         生成key，使用f"{self.key_prefix}{key}"
+        指定hash_tag或者CACHE_REDIS_HASH_TAG时使用f"{self.key_prefix}{{hash_tag}}{key}"，
+        相同hash_tag的key在Redis Cluster中分配到同一个hash slot
+        @See KeyBuilder.build
+        """
+        return self.key_builder.build(key, hash_tag)
+
+    def create_key_builder(self):
         """
-        return f"{self.key_prefix}{key}"
+        创建生成key的KeyBuilder，使用CACHE_REDIS_HASH_TAG作为默认的hash tag
+        @See RedisBackend.create_key_builder
+        """
+        return KeyBuilder(self.key_prefix, hash_tag=self.hash_tag, hash_min_bytes=self.key_hash_min_bytes,
+                          encoding=self.encoding)
 
     async def get(self, *args, **kwargs):
         """
@@ -275,7 +402,7 @@ class ARedisBackend(RedisBackend):
         else:
             raise TypeError("Too many or no key to get, args = %s kwargs= %s" % (str(args), str({**kwargs})))
         with self.get_async_context() as conn:
-            return await conn.get(key)
+            return self.decode_value(await conn.get(key))
 
     async def set(self, *args, **kwargs):
         """
@@ -286,8 +413,8 @@ class ARedisBackend(RedisBackend):
         pexpire = kwargs.get("pexpire", None)
 
         exist = kwargs.get("exist", None)
-        arg_xx = (exist is "SET_IF_EXIST")
-        arg_nx = (exist is "SET_IF_NOT_EXIST")
+        arg_xx = (exist == "SET_IF_EXIST")
+        arg_nx = (exist == "SET_IF_NOT_EXIST")
 
         # 筛选除["expire","pexpire","exist"]以外的key-val
         filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
@@ -317,7 +444,7 @@ class ARedisBackend(RedisBackend):
         with self.get_async_context() as conn:
             result = await conn.set(
                 key,
-                value,
+                self.encode_value(value),
                 ex=expire,
                 px=pexpire,
                 nx=arg_nx,
@@ -353,50 +480,160 @@ class ARedisBackend(RedisBackend):
         Implement function from CacheBackend interface
         @See CacheBackend.delete_many
         """
-        keys = []
-        for i in range(len(args)):
-            key = self.make_key(args[i])
-            keys.append(key)
+        keys = self.key_builder.build_many(args)
         with self.get_async_context() as conn:
-            if len(keys) > 0:
-                result = await conn.delete(*tuple(keys))
-            else:
+            if len(keys) == 0:
                 # nothing to delete
                 return True
+            elif self.use_cluster:
+                replies = await self.execute_by_slot(conn, "DEL", keys)
+                result = sum(reply for _, reply in replies)
+            else:
+                result = await conn.delete(*tuple(keys))
         return result > 0
 
     async def get_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface
+        超过CACHE_REDIS_MGET_CHUNK_SIZE个key时拆分为多条MGET并发执行
+        传入一个key的iterable时返回{key: value}，未命中的key不包含在结果中，指定default时为default
         @See CacheBackend.get_many
         """
-        keys = []
-        for i in range(len(args)):
-            key = self.make_key(args[i])
-            keys.append(key)
+        many_keys = parse_many_keys(args)
+        if many_keys is not None and len(many_keys) == 0:
+            return {}
+        keys = self.key_builder.build_many(args if many_keys is None else many_keys)
         with self.get_async_context() as conn:
-            if len(keys) > 0:
-                result = await conn.mget(*tuple(keys))
-            else:
+            if len(keys) == 0:
                 raise TypeError("No keys for get_many, args=%s" % str(args))
+            elif self.use_cluster:
+                result = [None] * len(keys)
+                for indexes, reply in await self.execute_by_slot(conn, "MGET", keys):
+                    for index, value in zip(indexes, reply):
+                        result[index] = value
+            else:
+                result = await self.mget_chunked(conn, keys)
+        if self.serializer is not None:
+            result = [self.decode_value(value) for value in result]
+        if many_keys is not None:
+            return make_mapping(many_keys, result, kwargs)
         return result
 
     async def set_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface
+        不使用expire/pexpire/exist参数时使用MSET，返回MSET的结果
+        使用expire/pexpire/exist参数时，使用pipeline逐个执行`SET key value EX/PX NX/XX`，
+        按CACHE_REDIS_PIPELINE_CHUNK_SIZE分批发送，返回{key: bool}，条件不满足而没有写入的key为False
+        :expire - int or dict, 有效期，以秒为单位，使用dict时按key分别指定，例如{"key1": 60}
+        :pexpire - int or dict, 有效期，以毫秒为单位，使用dict时按key分别指定
+        :exist - str or dict, 可选值 "SET_IF_EXIST", "SET_IF_NOT_EXIST"，使用dict时按key分别指定
         @See CacheBackend.set_many
         """
-        kv2update = {
-            **{self.make_key(k): v for k, v in dict(args).items()},
-            **{self.make_key(k): v for k, v in kwargs.items()},
-        }
+        if has_set_options(kwargs):
+            return await self.set_many_pipelined(*args, **kwargs)
+        # 筛选除["expire","pexpire","exist"]以外的key-val
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        kv2update = {**dict(args), **filter_kv}
+        kv2update = dict(zip(self.key_builder.build_many(kv2update.keys()),
+                             [self.encode_value(v) for v in kv2update.values()]))
         with self.get_async_context() as conn:
-            if len(kv2update) > 0:
-                result = await conn.mset(kv2update)
-            else:
+            if len(kv2update) == 0:
                 raise TypeError("No keys for get_many, args=%s" % str(args))
+            elif self.use_cluster:
+                keys = list(kv2update.keys())
+                replies = await self.execute_by_slot(conn, "MSET", keys, list(kv2update.values()))
+                result = all(reply for _, reply in replies)
+            else:
+                result = await conn.mset(kv2update)
         return result
 
+    async def execute_by_slot(self, conn, command, keys, values=None):
+        """
+        将多key命令按hash slot拆分，每个slot（超过CACHE_REDIS_PIPELINE_CHUNK_SIZE时再分批）发送一条命令，
+        全部命令放在同一个pipeline中，Redis Cluster的pipeline按node分组，先写入全部node再读取结果，
+        各node并行执行，并自动处理MOVED/ASK重定向
+        返回[(indexes, reply)]，indexes为该命令包含的key在keys中的位置，用于按调用顺序组装结果
+        :conn - Redis连接
+        :command - str, 多key命令，例如"MGET", "DEL", "MSET"
+        :keys - list, 完整的key
+        :values - list default=None, 与keys一一对应的value，用于"MSET"
+        """
+        groups = []
+        pipe = await conn.pipeline(transaction=False)
+        for slot_indexes in group_by_slot(keys).values():
+            for indexes in self.iter_chunks(slot_indexes):
+                command_args = []
+                for index in indexes:
+                    command_args.append(keys[index])
+                    if values is not None:
+                        command_args.append(values[index])
+                await pipe.execute_command(command, *command_args)
+                groups.append(indexes)
+        replies = await pipe.execute()
+        return list(zip(groups, replies))
+
+    async def scan_batches(self, conn, match, batch_size):
+        """
+        Redis Cluster的SCAN只在单个node上遍历，使用cluster时逐个master node执行SCAN直到cursor为0
+        @See RedisBackend.scan_batches
+        """
+        if not self.use_cluster:
+            async for keys in super().scan_batches(conn, match, batch_size):
+                yield keys
+            return
+        for node in await conn.cluster_nodes():
+            if 'master' not in node['flags']:
+                continue
+            cursor = 0
+            while True:
+                response = await conn.execute_command_on_nodes([node], 'SCAN', cursor,
+                                                               'MATCH', match, 'COUNT', batch_size)
+                cursor, keys = list(response.values())[0]
+                if keys:
+                    yield keys
+                if int(cursor) == 0:
+                    break
+
+    async def unlink_keys(self, conn, keys):
+        """
+        使用cluster时按hash slot拆分UNLINK，避免CROSSSLOT错误
+        @See RedisBackend.unlink_keys
+        """
+        if not self.use_cluster:
+            return await super().unlink_keys(conn, keys)
+        replies = await self.execute_by_slot(conn, "UNLINK", keys)
+        return sum(reply for _, reply in replies)
+
+    async def set_many_pipelined(self, *args, **kwargs):
+        """
+        使用pipeline执行set_many，返回{key: bool}
+        @See ARedisBackend.set_many
+        """
+        expire = kwargs.get("expire", None)
+        pexpire = kwargs.get("pexpire", None)
+        exist = kwargs.get("exist", None)
+        # 筛选除["expire","pexpire","exist"]以外的key-val
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        kv2update = {**dict(args), **filter_kv}
+        if len(kv2update) == 0:
+            raise TypeError("No keys for set_many, args=%s" % str(args))
+        results = {}
+        with self.get_async_context() as conn:
+            for chunk in self.iter_chunks(list(kv2update.items())):
+                pipe = await conn.pipeline(transaction=False)
+                for key, value in chunk:
+                    key_exist = key_option(exist, key)
+                    await pipe.set(self.make_key(key), self.encode_value(value),
+                                   ex=key_option(expire, key) or None,
+                                   px=key_option(pexpire, key) or None,
+                                   nx=(key_exist == "SET_IF_NOT_EXIST"),
+                                   xx=(key_exist == "SET_IF_EXIST"))
+                replies = await pipe.execute()
+                for (key, _), reply in zip(chunk, replies):
+                    results[key] = reply is True
+        return results
+
     async def execute(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface
@@ -455,16 +692,28 @@ class ARedisBackend(RedisBackend):
                 result = await conn.execute_command(*tuple(args_to_execute), **kwargs)
             return result
 
+    async def clear_keys(self, batch_size=None, concurrency=None, progress=None):
+        """
+        使用SCAN + UNLINK分批清除全部符合`{CACHE_KEY_PREFIX}*`的key，返回统计信息
+        @See RedisBackend.scan_unlink
+        """
+        with self.get_async_context() as conn:
+            return await self.scan_unlink(conn, self.make_key("*"), batch_size=batch_size,
+                                          concurrency=concurrency, progress=progress)
+
+    async def scan_keys(self, batch_size=None):
+        """
+        遍历全部符合`{CACHE_KEY_PREFIX}*`的key，返回去掉CACHE_KEY_PREFIX的key的list
+        @See RedisBackend.scan_prefix
+        """
+        with self.get_async_context() as conn:
+            return await self.scan_prefix(conn, batch_size=batch_size)
+
     async def clear(self):
         """
         Implement function from CacheBackend interface
+        使用SCAN + UNLINK分批删除，统计信息保存在last_clear_stats
         @See CacheBackend.clear
         """
-        with self.get_async_context() as conn:
-            keys = await conn.keys(self.make_key("*"))
-            if len(keys) > 0:
-                result = await conn.delete(*tuple(keys))
-            else:
-                # nothing to clear
-                return True
-        return result > 0
+        await self.clear_keys()
+        return True
@@ -15,13 +15,48 @@ limitations under the License.
 
 """
 
-import functools
+import asyncio
 import logging
+import time
 import types
 from abc import ABCMeta, abstractmethod
 
+from ._decorators import async_method_in_loop
+from ._singleflight import SingleFlight
+from .batching import BatchLoader
+from .bloom import BloomFilter
+from .envelope import Envelope, MISSING_MARK, NOT_FOUND, is_missing
+from .registry import registry
+
 logger = logging.getLogger(__name__)
 
+METHOD_TYPES = (types.MethodType, types.FunctionType)
+
+# execute中不写入key的命令，不需要加入Bloom Filter
+BLOOM_READ_COMMANDS = ("get", "mget", "del", "unlink", "ttl", "pttl", "exists", "type", "strlen",
+                       "ping", "quit", "bgsave", "dbsize", "time", "info", "lastsave", "flushdb", "sync",
+                       "bgrewriteaof")
+
+
+def parse_many_keys(args):
+    """
+    解析get_many的参数，只传入一个不是str/bytes的iterable时返回key的list，否则返回None，表示使用参数列表方式调用
+    """
+    if len(args) != 1 or isinstance(args[0], (str, bytes, bytearray, memoryview)) or not hasattr(args[0], "__iter__"):
+        return None
+    keys = args[0]
+    return keys if type(keys) is list else list(keys)
+
+
+def make_mapping(keys, values, kwargs):
+    """
+    将与keys顺序一致的values转换为{key: value}，value为None的key不包含在结果中，kwargs中指定default时为default
+    """
+    if "default" in kwargs:
+        default = kwargs["default"]
+        return {key: default if value is None else value for key, value in zip(keys, values)}
+    return {key: value for key, value in zip(keys, values) if value is not None}
+
 
 class CacheContext(object):
     __metaclass__ = ABCMeta
@@ -69,6 +104,32 @@ class CacheBackendContext(object):
 
 class CacheBackend(CacheBackendContext):
     __metaclass__ = ABCMeta
+    # value的序列化，由Backend根据CACHE_SERIALIZER设置，None表示不序列化
+    serializer = None
+    # 是否可以直接保存python对象，不能保存时需要设置serializer
+    stores_objects = False
+
+    def can_store_objects(self):
+        """
+        是否可以保存list/dict等任意python对象
+        """
+        return self.stores_objects or self.serializer is not None
+
+    def encode_value(self, value):
+        """
+        写入前序列化value，没有设置serializer时原样返回
+        """
+        if self.serializer is None:
+            return value
+        return self.serializer.dumps(value)
+
+    def decode_value(self, value):
+        """
+        读取后反序列化value，没有设置serializer或者value为None时原样返回
+        """
+        if self.serializer is None or value is None:
+            return value
+        return self.serializer.loads(value)
 
     @abstractmethod
     def clear(self):
@@ -228,11 +289,15 @@ class CacheBackend(CacheBackendContext):
         """
         获取一个多个key的value值
         注意：在不同backend下使用get_many，返回的结果顺序不一定是传入参数的顺序。
-        :* - any, 使用key传入参数，只支持使用参数列表("key1","key2","key3")，需要获取的key值,可用使用多个.
+        :* - any, 使用key传入参数，支持使用参数列表("key1","key2","key3")，需要获取的key值,可用使用多个.
+            只传入一个key的iterable（list, tuple, set, generator等）时返回{key: value}，未命中的key不包含在结果中
+        :default - any, 只用于传入iterable的方式，指定后未命中的key也包含在结果中，value为default
         使用demo举例
         ```
         cache.get_many("foo")
         cache.get_many("foo","foo1","foo2")
+        cache.get_many(["foo","foo1","foo2"])  # {"foo": "bar", "foo2": "bar2"}
+        cache.get_many(["foo","foo1"], default=None)  # {"foo": "bar", "foo1": None}
         ```
         以下操作将抛出异常
         ```
@@ -323,6 +388,20 @@ class SerializableCacheBackend(CacheBackend):
         """
 
 
+def resolve_backend(cache_backend, config):
+    """
+    解析并创建cache backend的实例，cache_backend为str时使用别名或者完整的module.class路径反射创建，
+    为CacheBackend实例时直接返回
+    @See BackendRegistry.resolve
+    """
+    # 如果http_backend是str, 那么使用别名或者完整路径反射创建一个CacheBackend的instance
+    if isinstance(cache_backend, str):
+        cache_backend_instance = registry.resolve(cache_backend)(config=config)
+    else:
+        cache_backend_instance = cache_backend
+    return cache_backend_instance
+
+
 class AsyncCacheManager:
 
     def __init__(self, app, cache_backend, config=None):
@@ -336,6 +415,22 @@ class AsyncCacheManager:
                 传入"simple_cache" 或者 "SimpleCacheBackend" 会使用"omi_cache_manager.backends.SimpleCacheBackend"
                 传入"aioredis" 或者 "AIORedisBackend" 会使用"omi_cache_manager.aio_redis_backend.AIORedisBackend"
                 传入"aredis"或者 "ARedisBackend" 会使用"omi_cache_manager.aredis_backend.ARedisBackend"
+                传入"tiered_cache"或者 "TieredCacheBackend" 会使用"omi_cache_manager.tiered_backend.TieredCacheBackend"
+                其他backend可以使用register_backend或者"omi_cache_manager.backends" entry point注册别名
+            config - Dict, 支持以下批量操作相关的配置
+                CACHE_BATCH_ENABLED - bool default=False, 将同一个tick内的单key get合并为一次get_many
+                CACHE_BATCH_WINDOW_US - int default=0, 合并的时间窗口，以微秒为单位，0表示下一个tick
+                CACHE_BATCH_MAX_SIZE - int default=100, 单批最多的key数量
+                CACHE_BATCH_WRITES - bool default=False, 同时合并不带expire/exist参数的set和delete
+                CACHE_REFRESH_LOCK_TIMEOUT - int default=30, 后台刷新过期value时锁的有效期，以秒为单位
+                CACHE_NEGATIVE_TTL - int default=None, 缓存未命中结果的有效期，以秒为单位，None表示不缓存未命中结果
+                CACHE_BLOOM_ENABLED - bool default=False, 使用进程内的Bloom Filter记录写入的key，
+                    get/get_many不再读取一定不存在的key，只适用于key全部通过当前manager写入的场景，
+                    其他进程写入的key需要使用rebuild_bloom_filter从backend重建
+                CACHE_BLOOM_CAPACITY - int default=100000, Bloom Filter预计的key数量
+                CACHE_BLOOM_ERROR_RATE - float default=0.01, Bloom Filter的误判率
+                CACHE_UNWRAP_VALUES - bool default=True, get/get_many取出soft_expire写入的value，并将缓存的未命中结果返回为None，
+                    设为False时不能使用soft_expire、set_missing和CACHE_NEGATIVE_TTL，get/get_many返回backend中的原始value
 
         """
         if not (config is None or isinstance(config, dict)):
@@ -349,6 +444,67 @@ class AsyncCacheManager:
         cache_backend_instance = self.parse_backend_from_config(cache_backend, config)
         self.cache_backend_name = cache_backend_instance.__class__.__name__
         self.cache = cache_backend_instance
+        # 设置批量操作
+        if config is not None and config.get('CACHE_BATCH_ENABLED', False):
+            self.batch_loader = BatchLoader(cache_backend_instance,
+                                            window_us=config.get('CACHE_BATCH_WINDOW_US', 0),
+                                            max_batch_size=config.get('CACHE_BATCH_MAX_SIZE', 100))
+            self.batch_writes = config.get('CACHE_BATCH_WRITES', False)
+        else:
+            self.batch_loader = None
+            self.batch_writes = False
+        # 设置stale-while-revalidate
+        if config is not None:
+            self.refresh_lock_timeout = config.get('CACHE_REFRESH_LOCK_TIMEOUT', 30)
+            self.negative_ttl = config.get('CACHE_NEGATIVE_TTL', None)
+            self.unwrap_values = config.get('CACHE_UNWRAP_VALUES', True)
+        else:
+            self.refresh_lock_timeout = 30
+            self.negative_ttl = None
+            self.unwrap_values = True
+        if self.negative_ttl and not self.unwrap_values:
+            raise ValueError("`CACHE_NEGATIVE_TTL` requires `CACHE_UNWRAP_VALUES`, negative_ttl=%s" % str(self.negative_ttl))
+        self.loader = None
+        self._refreshing = dict()
+        self._flight = SingleFlight()
+        # 设置Bloom Filter
+        if config is not None and config.get('CACHE_BLOOM_ENABLED', False):
+            self.bloom_capacity = config.get('CACHE_BLOOM_CAPACITY', 100000)
+            self.bloom_error_rate = config.get('CACHE_BLOOM_ERROR_RATE', 0.01)
+            self.bloom_filter = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+        else:
+            self.bloom_capacity = None
+            self.bloom_error_rate = None
+            self.bloom_filter = None
+        self._bloom_rebuilding = None
+        # 使用CACHE_KEY_HASH_MIN_BYTES时，被摘要的key无法通过rebuild_bloom_filter还原
+        key_builder = getattr(self.cache, "key_builder", None)
+        if key_builder is not None and key_builder.hash_min_bytes is not None:
+            self._bloom_hashed = key_builder.is_hashed
+        else:
+            self._bloom_hashed = None
+        # bytes的key与按该编码解码后的str的key对应backend中同一个key
+        self._bloom_encoding = key_builder.encoding if key_builder is not None else "utf-8"
+        self.bloom_lookups = 0
+        self.bloom_skipped = 0
+        self.bloom_passed_misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        # 在构造时选择代理方法的调用路径，没有开启Bloom Filter和批量操作时直接使用backend的方法，
+        # 不再有每次调用的判断和额外的coroutine，构造之后替换backend的方法不会影响这些代理方法
+        if self.bloom_filter is None and self.batch_loader is None:
+            self._get_impl = self.cache.get
+            self.add = self.cache.add
+            self.delete = self.cache.delete
+            self.delete_many = self.cache.delete_many
+            self.set_many = self.cache.set_many
+            self.execute = self.cache.execute
+            if not self.unwrap_values:
+                self.get = self.cache.get
+                self.get_many = self.cache.get_many
+        else:
+            self._get_impl = self.get_raw
 
     @property
     def app_ref(self):
@@ -374,42 +530,9 @@ class AsyncCacheManager:
     def parse_backend_from_config(self, cache_backend, config):
         """
         配置当前manager的cache backend的实例
+        @See resolve_backend
         """
-        # 如果http_backend是str, 那么反射创建一个CacheBackend的instance
-        if isinstance(cache_backend, str):
-            cache_backend_lower = cache_backend.lower()
-            # alias
-            if cache_backend_lower in ["null_cache", "nullcachebackend"]:
-                cache_backend = "omi_cache_manager.backends.NullCacheBackend"
-            elif cache_backend_lower in ["simple_cache", "simplecachebackend"]:
-                cache_backend = "omi_cache_manager.backends.SimpleCacheBackend"
-            elif cache_backend_lower in ["aioredis", "aioredisbackend"]:
-                cache_backend = "omi_cache_manager.aio_redis_backend.AIORedisBackend"
-            elif cache_backend_lower in ["aredis", "aredisbackend"]:
-                cache_backend = "omi_cache_manager.aredis_backend.ARedisBackend"
-            else:
-                pass
-            name = cache_backend.split('.')
-            used = name.pop(0)
-            try:
-                found = __import__(used)
-                # 查找模块下同名class_meta
-                for frag in name:
-                    used += '.' + frag
-                    try:
-                        # 使用getattr方式获取type
-                        found = getattr(found, frag)
-                    except AttributeError:
-                        # 使用__import__导入type
-                        __import__(used)
-                        found = getattr(found, frag)
-                # 实例化instance
-                cache_backend_instance = found(config=config)
-            except ImportError:
-                raise ValueError('Cannot resolve cache_backend type %s' % cache_backend)
-        else:
-            cache_backend_instance = cache_backend
-        return cache_backend_instance
+        return resolve_backend(cache_backend, config)
 
     @property
     def cache_backend(self):
@@ -437,19 +560,37 @@ class AsyncCacheManager:
         Proxy function for internal cache context object.
         代理cache context的destroy_cache_context，使用异步方式调用
         """
-        return await self.async_method_call(
-            self.cache.destroy_cache_context
-        )
+        if self.batch_loader is not None:
+            await self.batch_loader.flush()
+        if self._refreshing:
+            await asyncio.gather(*self._refreshing.values(), return_exceptions=True)
+        return await self.cache.destroy_cache_context()
+
+    async def warm_up(self, size=None):
+        """
+        预热backend的连接池，并行建立size个连接并PING，返回连接延迟的统计信息，backend不需要连接时返回None
+        可以在应用启动时调用，例如FastAPI的startup事件
+        ```
+        @app.on_event("startup")
+        async def startup_event():
+            await cache.warm_up()
+        ```
+        :size - int default=None, 建立的连接数量，默认使用CACHE_REDIS_POOL_MINSIZE
+        @See ARedisBackend.warm_up, AIORedisBackend.warm_up
+        """
+        warm_up = getattr(self.cache, "warm_up", None)
+        if warm_up is None:
+            return None
+        return await warm_up(size)
 
     @classmethod
     async def async_method_call(cls, func, *args, **kwargs):
         """
         将同步对象方法转换为异步Generator方式执行，对于异步方法，不改变其执行方式。
+        代理方法直接await backend的方法，不再经过这里，保留用于兼容已有的调用
         """
-        func_type = type(func)
-        if func_type in [types.MethodType, types.FunctionType]:
-            func_call = functools.partial(func, *args, **kwargs)
-            return await func_call()
+        if type(func) in METHOD_TYPES:
+            return await func(*args, **kwargs)
         else:
             raise TypeError(f"Function {str(func)} must be FunctionType or MethodType")
 
@@ -458,94 +599,455 @@ class AsyncCacheManager:
         Proxy function for internal cache object.
         @See CacheBackend.clear
         """
-        return await self.async_method_call(
-            self.cache.clear
-        )
+        result = await self.cache.clear()
+        if self.bloom_filter is not None:
+            self.bloom_filter.clear()
+        return result
+
+    def get_batch_stats(self):
+        """
+        获取批量操作的统计信息，没有开启CACHE_BATCH_ENABLED时返回None
+        @See BatchLoader.get_stats
+        """
+        if self.batch_loader is None:
+            return None
+        return self.batch_loader.get_stats()
+
+    def get_compression_stats(self):
+        """
+        获取value压缩的统计信息，没有设置CACHE_SERIALIZER或CACHE_COMPRESS_MIN_BYTES时返回None
+        @See Serializer.get_stats
+        """
+        serializer = getattr(self.cache, "serializer", None)
+        if serializer is None or serializer.compress_min_bytes is None:
+            return None
+        return serializer.get_stats()
+
+    def register_loader(self, loader):
+        """
+        注册后台刷新使用的loader，loader为async函数，参数为key，返回新的value
+        使用soft_expire写入的value超过软过期时间后，get立即返回旧的value，并使用loader在后台刷新一次
+        """
+        if loader is not None and not callable(loader):
+            raise TypeError("`loader` must be callable, loader=%s" % str(loader))
+        self.loader = loader
+
+    def get_refresh_stats(self):
+        """
+        获取stale-while-revalidate的统计信息，stale_hits为返回旧value的次数
+        """
+        return {
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "refreshing": len(self._refreshing),
+        }
+
+    def unwrap_value(self, key, value):
+        """
+        取出Envelope中的value，超过软过期时间时在后台刷新，缓存的未命中结果返回None
+        没有开启CACHE_UNWRAP_VALUES时直接返回value
+        """
+        if not self.unwrap_values:
+            return value
+        value_type = type(value)
+        if value_type is not str and value_type is not list:
+            # Envelope和未命中结果只会是list和str，其他value直接返回
+            return value
+        if is_missing(value):
+            return None
+        envelope = Envelope.loads(value)
+        if envelope is None:
+            return value
+        if envelope.is_stale():
+            self.stale_hits += 1
+            self.schedule_refresh(key, envelope)
+        return envelope.value
+
+    def schedule_refresh(self, key, envelope):
+        """
+        在后台刷新key，同一个key同时只有一个刷新任务
+        """
+        if self.loader is None or key in self._refreshing:
+            return
+        self._refreshing[key] = asyncio.ensure_future(self.refresh(key, envelope))
+
+    async def refresh(self, key, envelope):
+        """
+        使用loader刷新key，写入时使用原有的软过期时间和硬过期时间
+        使用`SET NX`的锁保证多个进程之间也只有一个刷新，锁在CACHE_REFRESH_LOCK_TIMEOUT后自动失效
+        """
+        lock_key = "%s:__refresh__" % key
+        try:
+            locked = await self.cache.set(lock_key, "1", expire=self.refresh_lock_timeout, exist="SET_IF_NOT_EXIST")
+            if not locked:
+                return
+            try:
+                value = await self.loader(key)
+                if envelope.ttl:
+                    await self.set(key, value, pexpire=int(envelope.ttl * 1000), soft_expire=envelope.stale_after)
+                else:
+                    await self.set(key, value, soft_expire=envelope.stale_after)
+                self.refreshes += 1
+            finally:
+                await self.cache.delete_many(lock_key)
+        except Exception:
+            self.refresh_errors += 1
+            logger.exception("Refresh key %s failed", key)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get_or_compute(self, key, loader, ttl, beta=1.0):
+        """
+        读取key，未命中或者XFetch判断需要提前重新计算时调用loader计算并写入，返回value
+        value与计算花费的时间和过期时间一起保存，接近过期时以指数增长的概率提前重新计算，
+        使重新计算分散在不同的请求和进程中，不需要锁
+        :key - str, 缓存的key
+        :loader - callable, 计算value的函数，没有参数，同步函数在executor线程池中执行
+        :ttl - float, 有效期，以秒为单位
+        :beta - float default=1.0, 大于1时更早重新计算，小于1时更晚重新计算
+        """
+        if ttl is None or ttl <= 0:
+            raise ValueError("`ttl` must be > 0, ttl=%s" % str(ttl))
+        if not self.cache.can_store_objects():
+            raise ValueError("get_or_compute requires `CACHE_SERIALIZER` for %s" % self.cache_backend_name)
+        envelope = Envelope.loads(await self.get_raw(key))
+        if envelope is not None and not envelope.should_recompute(beta):
+            return envelope.value
+        if not asyncio.iscoroutinefunction(loader):
+            loader = async_method_in_loop(loader)
+        start = time.perf_counter()
+        value = await loader()
+        delta = time.perf_counter() - start
+        await self.set(key, Envelope(value, ttl=ttl, delta=delta).dumps(), pexpire=max(int(ttl * 1000), 1))
+        return value
+
+    async def get_or_set(self, key, loader, **kwargs):
+        """
+        读取key，未命中时调用loader并写入，返回value，loader返回None时不写入，
+        设置了CACHE_NEGATIVE_TTL时缓存None结果，有效期内不再调用loader
+        同一个key的并发未命中只调用一次loader，其他调用等待并共享结果
+        :key - str, 缓存的key
+        :loader - callable, 计算value的函数，没有参数，同步函数在executor线程池中执行
+        :kwargs - 写入时使用的参数，例如expire, pexpire, soft_expire
+        """
+        value = await self.lookup(key)
+        if value is not NOT_FOUND:
+            return value
+        if not asyncio.iscoroutinefunction(loader):
+            loader = async_method_in_loop(loader)
+
+        async def load_and_set():
+            loaded = await loader()
+            if loaded is not None:
+                await self.set(key, loaded, **kwargs)
+            elif self.negative_ttl:
+                await self.set_missing(key)
+            return loaded
+
+        return await self._flight.do(key, load_and_set)
+
+    async def get_many_or_set(self, keys, batch_loader, **kwargs):
+        """
+        使用一次get_many读取全部key，使用未命中的key调用一次batch_loader，再使用一次set_many写入，
+        返回按keys顺序的{key: value}，batch_loader没有返回的key或者返回None的key的value为None，
+        设置了CACHE_NEGATIVE_TTL时使用第二次set_many缓存这些key的未命中结果，否则不写入
+        :keys - list, 缓存的key
+        :batch_loader - callable, 参数为未命中的key的list，返回{key: value}，同步函数在executor线程池中执行
+        :kwargs - 写入时使用的参数，例如expire, pexpire
+        """
+        keys = list(dict.fromkeys(keys))
+        if len(keys) == 0:
+            return {}
+        found = await self.get_many_raw(keys)
+        results = {}
+        missing = []
+        for key in keys:
+            value = found.get(key)
+            if value is None:
+                missing.append(key)
+            results[key] = self.unwrap_value(key, value)
+        if len(missing) == 0:
+            return results
+        if not asyncio.iscoroutinefunction(batch_loader):
+            batch_loader = async_method_in_loop(batch_loader)
+        loaded = await batch_loader(missing)
+        if not isinstance(loaded, dict):
+            raise TypeError("`batch_loader` must return a dict, result=%s" % str(loaded))
+        kv2update = {key: loaded[key] for key in missing if loaded.get(key) is not None}
+        if len(kv2update) > 0:
+            await self.set_many(*kv2update.items(), **kwargs)
+            results.update(kv2update)
+        if self.negative_ttl:
+            absent = [key for key in missing if key not in kv2update]
+            if len(absent) > 0:
+                await self.set_many(*[(key, MISSING_MARK) for key in absent], expire=self.negative_ttl)
+        return results
+
+    @staticmethod
+    def parse_write_keys(args, kwargs):
+        """
+        解析set/set_many参数中写入的key
+        """
+        keys = [key for key in kwargs.keys() if key not in ["expire", "pexpire", "exist", "soft_expire"]]
+        if len(args) == 2 and not isinstance(args[0], tuple):
+            keys.append(args[0])
+        else:
+            keys.extend(arg[0] for arg in args if isinstance(arg, tuple) and len(arg) == 2)
+        return keys
+
+    @classmethod
+    def parse_execute_keys(cls, args, kwargs):
+        """
+        解析execute参数中可能写入的key
+        """
+        cmd = str(args[0]).lower()
+        if cmd in ["set", "mset"]:
+            return cls.parse_write_keys(args[1:], kwargs)
+        if cmd in BLOOM_READ_COMMANDS or len(args) < 2:
+            return []
+        return [args[1]]
+
+    def bloom_key(self, key):
+        """
+        Bloom Filter中使用的key，bytes的key按backend的编码解码为str，其他类型的key使用str(key)，
+        与KeyBuilder.build生成同一个backend key的str/bytes的key对应同一个位置
+        """
+        if type(key) is str:
+            return key
+        if isinstance(key, (bytes, bytearray, memoryview)):
+            return bytes(key).decode(self._bloom_encoding, "surrogateescape")
+        return str(key)
+
+    def bloom_add(self, *keys):
+        """
+        将写入的key加入Bloom Filter，重建期间同时加入新的Bloom Filter
+        """
+        for key in keys:
+            key = self.bloom_key(key)
+            self.bloom_filter.add(key)
+            if self._bloom_rebuilding is not None:
+                self._bloom_rebuilding.add(key)
+
+    def bloom_contains(self, key):
+        """
+        key是否可能存在，没有开启CACHE_BLOOM_ENABLED时返回True，
+        会被摘要的key重建后不在Bloom Filter中，始终视为可能存在
+        """
+        if self.bloom_filter is None:
+            return True
+        self.bloom_lookups += 1
+        if self.bloom_key(key) in self.bloom_filter:
+            return True
+        if self._bloom_hashed is not None and self._bloom_hashed(key):
+            return True
+        self.bloom_skipped += 1
+        return False
+
+    async def rebuild_bloom_filter(self, batch_size=None):
+        """
+        使用backend的scan_keys遍历全部key重建Bloom Filter，清除已删除和已过期的key，
+        也可以加入其他进程写入的key，重建期间写入的key同时加入新的Bloom Filter，返回遍历的key数量
+        使用CACHE_KEY_HASH_MIN_BYTES时被摘要的key无法还原，get/get_many不会跳过这些key
+        没有开启CACHE_BLOOM_ENABLED时返回None
+        :batch_size - int default=None, SCAN的COUNT参数
+        @See ARedisBackend.scan_keys, SimpleCacheBackend.scan_keys
+        """
+        if self.bloom_filter is None:
+            return None
+        rebuilt = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+        self._bloom_rebuilding = rebuilt
+        try:
+            keys = await self.cache.scan_keys(batch_size=batch_size)
+            for key in keys:
+                rebuilt.add(self.bloom_key(key))
+        finally:
+            self._bloom_rebuilding = None
+        self.bloom_filter = rebuilt
+        return len(keys)
+
+    def get_bloom_stats(self):
+        """
+        获取Bloom Filter的统计信息，skipped为跳过的backend读取次数，
+        passed_misses为通过Bloom Filter但backend未命中的次数，除了误判以外，还包括已删除、已过期
+        和被摘要的key，没有开启CACHE_BLOOM_ENABLED时返回None
+        @See BloomFilter.get_stats
+        """
+        if self.bloom_filter is None:
+            return None
+        return {
+            **self.bloom_filter.get_stats(),
+            "lookups": self.bloom_lookups,
+            "skipped": self.bloom_skipped,
+            "passed_misses": self.bloom_passed_misses,
+        }
+
+    async def get_raw(self, *args, **kwargs):
+        """
+        读取backend中保存的原始value
+        开启CACHE_BATCH_ENABLED时，使用单个位置参数的get会合并为get_many执行
+        """
+        if self.bloom_filter is not None:
+            if not self.bloom_contains(args[0] if len(args) > 0 else kwargs.get("key")):
+                return None
+        if self.batch_loader is not None and len(args) == 1 and not kwargs:
+            value = await self.batch_loader.load(args[0])
+        else:
+            value = await self.cache.get(*args, **kwargs)
+        if value is None and self.bloom_filter is not None:
+            self.bloom_passed_misses += 1
+        return value
+
+    async def get_many_raw(self, *args, **kwargs):
+        """
+        读取backend中保存的原始value，开启CACHE_BLOOM_ENABLED时只读取可能存在的key
+        传入一个key的iterable时返回{key: value}，未命中的key不包含在结果中
+        """
+        keys = parse_many_keys(args)
+        if keys is not None:
+            lookup = keys if self.bloom_filter is None else [key for key in keys if self.bloom_contains(key)]
+            if len(lookup) == 0:
+                return {}
+            found = await self.cache.get_many(lookup)
+            if self.bloom_filter is not None:
+                self.bloom_passed_misses += len(lookup) - len(found)
+            return found
+        if self.bloom_filter is None or kwargs:
+            return await self.cache.get_many(*args, **kwargs)
+        indexes = [i for i, key in enumerate(args) if self.bloom_contains(key)]
+        results = [None] * len(args)
+        if len(indexes) == 0:
+            return results
+        values = await self.cache.get_many(*[args[i] for i in indexes])
+        for i, value in zip(indexes, values or [None] * len(indexes)):
+            if value is None:
+                self.bloom_passed_misses += 1
+            results[i] = value
+        return results
 
     async def get(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
+        开启CACHE_BATCH_ENABLED时，使用单个位置参数的get会合并为get_many执行
+        使用soft_expire写入的value返回其中保存的value，缓存的未命中结果返回None
         @See CacheBackend.get
         """
-        return await self.async_method_call(
-            self.cache.get,
-            *args,
-            **kwargs
-        )
+        value = await self._get_impl(*args, **kwargs)
+        if value is None:
+            return None
+        return self.unwrap_value(args[0] if len(args) > 0 else kwargs.get("key"), value)
+
+    async def lookup(self, key):
+        """
+        读取key，与get的区别是key不在缓存中时返回NOT_FOUND，缓存的未命中结果返回None
+        """
+        value = await self.get_raw(key)
+        if value is None:
+            return NOT_FOUND
+        return self.unwrap_value(key, value)
+
+    async def set_missing(self, key, **kwargs):
+        """
+        缓存key的未命中结果，之后get返回None，lookup返回None而不是NOT_FOUND
+        :kwargs - expire/pexpire，默认使用CACHE_NEGATIVE_TTL
+        """
+        if not self.unwrap_values:
+            raise ValueError("set_missing requires `CACHE_UNWRAP_VALUES`, key=%s" % str(key))
+        if not kwargs.get("expire", None) and not kwargs.get("pexpire", None) and self.negative_ttl:
+            kwargs["expire"] = self.negative_ttl
+        return await self.set(key, MISSING_MARK, **kwargs)
 
     async def set(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
+        开启CACHE_BATCH_WRITES时，使用("key","value")参数的set会合并为set_many执行
+        :soft_expire - float, 软过期时间，以秒为单位，只支持set("key", "value")方式调用，
+            超过后get仍然返回旧的value，并使用register_loader注册的loader在后台刷新，
+            expire/pexpire为硬过期时间，超过后key被删除，value需要保存为list，Redis需要设置CACHE_SERIALIZER
         @See CacheBackend.set
         """
-        return await self.async_method_call(
-            self.cache.set,
-            *args,
-            **kwargs
-        )
+        soft_expire = kwargs.pop("soft_expire", None)
+        if soft_expire is not None:
+            if len(args) != 2:
+                raise TypeError("set with soft_expire requires (key, value), args = %s" % str(args))
+            if not self.unwrap_values:
+                raise ValueError("soft_expire requires `CACHE_UNWRAP_VALUES`, args = %s" % str(args))
+            if not self.cache.can_store_objects():
+                raise ValueError("soft_expire requires `CACHE_SERIALIZER` for %s" % self.cache_backend_name)
+            if kwargs.get("pexpire", None):
+                ttl = kwargs["pexpire"] / 1000
+            else:
+                ttl = kwargs.get("expire", None)
+            args = (args[0], Envelope(args[1], stale_after=soft_expire, ttl=ttl).dumps())
+        if self.bloom_filter is not None:
+            # 写入前加入Bloom Filter，写入后的读取不会被跳过
+            self.bloom_add(*self.parse_write_keys(args, kwargs))
+        if self.batch_writes and len(args) == 2 and not kwargs:
+            return await self.batch_loader.store(args[0], args[1])
+        return await self.cache.set(*args, **kwargs)
 
     async def add(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
         @See CacheBackend.add
         """
-        return await self.async_method_call(
-            self.cache.add,
-            *args,
-            **kwargs
-        )
+        if self.bloom_filter is not None:
+            self.bloom_add(*self.parse_write_keys(args, kwargs))
+        return await self.cache.add(*args, **kwargs)
 
     async def delete(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
+        开启CACHE_BATCH_WRITES时，使用单个位置参数的delete会合并为delete_many执行，返回delete_many的结果
         @See CacheBackend.delete
         """
-        return await self.async_method_call(
-            self.cache.delete,
-            *args,
-            **kwargs
-        )
+        if self.batch_writes and len(args) == 1 and not kwargs:
+            return await self.batch_loader.remove(args[0])
+        # Bloom Filter不支持移除，删除的key保留在Bloom Filter中，只会多一次读取，由rebuild_bloom_filter清除
+        return await self.cache.delete(*args, **kwargs)
 
     async def delete_many(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
         @See CacheBackend.delete_many
         """
-        return await self.async_method_call(
-            self.cache.delete_many,
-            *args,
-            **kwargs
-        )
+        return await self.cache.delete_many(*args, **kwargs)
 
     async def get_many(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
+        使用soft_expire写入的value返回其中保存的value
+        传入一个key的iterable时返回{key: value}，缓存的未命中结果与未命中的key相同
         @See CacheBackend.get_many
         """
-        return await self.async_method_call(
-            self.cache.get_many,
-            *args,
-            **kwargs
-        )
+        keys = parse_many_keys(args)
+        if keys is not None:
+            found = await self.get_many_raw(keys)
+            return make_mapping(keys, [self.unwrap_value(key, found.get(key)) for key in keys], kwargs)
+        if self.bloom_filter is None:
+            values = await self.cache.get_many(*args, **kwargs)
+        else:
+            values = await self.get_many_raw(*args, **kwargs)
+        if values is None:
+            return values
+        return [self.unwrap_value(key, value) for key, value in zip(args, values)]
 
     async def set_many(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
         @See CacheBackend.set_many
         """
-        return await self.async_method_call(
-            self.cache.set_many,
-            *args,
-            **kwargs
-        )
+        if self.bloom_filter is not None:
+            self.bloom_add(*self.parse_write_keys(args, kwargs))
+        return await self.cache.set_many(*args, **kwargs)
 
     async def execute(self, *args, **kwargs):
         """
         Proxy function for internal cache object.
+        开启CACHE_BLOOM_ENABLED时，SET/MSET写入的key加入Bloom Filter，
+        其他不是只读的命令，backend只为第一个参数加上前缀作为key，将其作为可能写入的key加入Bloom Filter
         @See CacheBackend.execute
         """
-        return await self.async_method_call(
-            self.cache.execute,
-            *args,
-            **kwargs
-        )
+        if self.bloom_filter is not None and len(args) > 0:
+            self.bloom_add(*self.parse_execute_keys(args, kwargs))
+        return await self.cache.execute(*args, **kwargs)
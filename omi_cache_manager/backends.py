@@ -16,15 +16,68 @@ limitations under the License.
 """
 
 import asyncio
+import time
 from abc import ABCMeta, abstractmethod
 
-from pydantic import RedisDsn
+from ._decorators import async_method_inline
+from .async_cache_manager import CacheBackend, CacheContext, make_mapping, parse_many_keys
+from .eviction import create_eviction_policy, resolve_sizer
+from .expiry import ExpiryHeap
+from .keys import KeyBuilder
+from .serializers import create_serializer
+
+
+def key_option(option, key):
+    """
+    set_many的expire/pexpire/exist参数，使用dict时按key分别指定，dict中没有的key返回None，否则所有key使用同一个值
+    """
+    if isinstance(option, dict):
+        return option.get(key, None)
+    return option
+
+
+def exist_allows(exist, present):
+    """
+    exist参数是否允许写入，"SET_IF_NOT_EXIST"只写入不存在的key，"SET_IF_EXIST"只写入已存在的key，其他值不限制
+    """
+    if exist == "SET_IF_NOT_EXIST":
+        return not present
+    if exist == "SET_IF_EXIST":
+        return present
+    return True
+
+
+def has_set_options(kwargs):
+    """
+    set_many是否使用了expire/pexpire/exist参数
+    """
+    return any(kwargs.get(name, None) is not None for name in ["expire", "pexpire", "exist"])
+
+
+def summarize_latencies(samples):
+    """
+    汇总延迟样本，samples以秒为单位，返回以毫秒为单位的{"min", "p50", "p90", "p99", "max", "mean"}，没有样本时返回None
+    """
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def percentile(pct):
+        return samples[min(int(len(samples) * pct / 100), len(samples) - 1)] * 1000
 
-from ._decorators import async_method_in_loop
-from .async_cache_manager import CacheBackend, CacheContext
+    return {
+        "min": samples[0] * 1000,
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": samples[-1] * 1000,
+        "mean": sum(samples) / len(samples) * 1000,
+    }
 
 
 class NullCacheBackend(CacheBackend):
+    stores_objects = True
+
     def __init__(self, config=None):
         """
         __init__构造函数，使用参数创建一个SimpleCacheBackend实例对象，，抽象类不能被实例化
@@ -66,7 +119,7 @@ class NullCacheBackend(CacheBackend):
         # noop just wait
         return await asyncio.sleep(0.01)
 
-    @async_method_in_loop
+    @async_method_inline
     def get(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return None.
@@ -74,7 +127,14 @@ class NullCacheBackend(CacheBackend):
         """
         return None
 
-    @async_method_in_loop
+    @async_method_inline
+    def scan_keys(self, batch_size=None):
+        """
+        遍历全部key，always return []
+        """
+        return []
+
+    @async_method_inline
     def set(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return True.
@@ -82,7 +142,7 @@ class NullCacheBackend(CacheBackend):
         """
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def add(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return True.
@@ -90,7 +150,7 @@ class NullCacheBackend(CacheBackend):
         """
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def delete(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return True.
@@ -98,7 +158,7 @@ class NullCacheBackend(CacheBackend):
         """
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def delete_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return True.
@@ -106,7 +166,7 @@ class NullCacheBackend(CacheBackend):
         """
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def clear(self):
         """
         Implement function from CacheBackend interface, always return None.
@@ -114,15 +174,19 @@ class NullCacheBackend(CacheBackend):
         """
         return None
 
-    @async_method_in_loop
+    @async_method_inline
     def get_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return None.
+        传入一个key的iterable时返回{}，指定default时每个key的value为default
         @See CacheBackend.get_many
         """
+        keys = parse_many_keys(args)
+        if keys is not None:
+            return make_mapping(keys, [None] * len(keys), kwargs)
         return None
 
-    @async_method_in_loop
+    @async_method_inline
     def set_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return True.
@@ -130,7 +194,7 @@ class NullCacheBackend(CacheBackend):
         """
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def execute(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface, always return None.
@@ -140,8 +204,44 @@ class NullCacheBackend(CacheBackend):
 
 
 class SimpleCacheDictContext(CacheContext):
-    def __init__(self):
+    def __init__(self,
+                 sweep_interval=0.1,
+                 sweep_limit=200,
+                 sweep_budget=0.001,
+                 max_entries=None,
+                 eviction_policy="lru",
+                 max_bytes=None,
+                 sizer=None):
+        """
+        __init__构造函数，使用参数创建一个SimpleCacheDictContext实例对象，并返回
+        :sweep_interval - float default=0.1, 后台清理过期key的间隔时间，以秒为单位
+        :sweep_limit - int default=200, 每次清理最多处理的key数量
+        :sweep_budget - float default=0.001, 每次清理最多占用event loop的时间（实际经过时间），以秒为单位
+        :max_entries - int default=None, 最多缓存的key数量，None表示不限制
+        :eviction_policy - str or EvictionPolicy default='lru', 超出容量时的淘汰策略，可选值"lru", "lfu", "w-tinylfu"
+        :max_bytes - int default=None, 最多缓存的value字节数，None表示不限制
+        :sizer - callable or str default=None, 计算value字节数的方法，只在写入时计算一次，默认使用序列化后的长度
+        """
         self._cache_dict = dict({"": "", "*": ""})
+        self._expiry = ExpiryHeap()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if max_entries or max_bytes:
+            self._policy = create_eviction_policy(eviction_policy, max_entries)
+        else:
+            self._policy = None
+        self.sizer = resolve_sizer(sizer)
+        self._sizes = dict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._sweeper = None
+        self._sweeper_loop = None
+        self.sweep_interval = sweep_interval
+        self.sweep_limit = sweep_limit
+        self.sweep_budget = sweep_budget
 
     def __enter__(self):
         if not self._cache_dict:
@@ -168,6 +268,12 @@ class SimpleCacheDictContext(CacheContext):
         Implement function from CacheContext interface
         @See CacheContext.destroy
         """
+        self.stop_sweeper()
+        self._expiry.clear()
+        if self._policy is not None:
+            self._policy.clear()
+        self._sizes.clear()
+        self.total_bytes = 0
         if not self._cache_dict:
             return
         self._cache_dict.clear()
@@ -184,8 +290,198 @@ class SimpleCacheDictContext(CacheContext):
     def cache_dict(self):
         return self._cache_dict
 
+    def get_item(self, key):
+        """
+        获取key的value，已过期的key会被惰性删除并返回None
+        """
+        with self as cache:
+            if key in self._expiry and self._expiry.is_expired(key):
+                self.expire_item(key)
+            elif key in cache:
+                self.hits += 1
+                if self._policy is not None:
+                    self._policy.on_access(key)
+                return cache[key]
+            self.misses += 1
+            if self._policy is not None:
+                self._policy.on_miss(key)
+            return None
+
+    def contains_item(self, key):
+        """
+        判断key是否存在且未过期
+        """
+        with self as cache:
+            if key in self._expiry and self._expiry.is_expired(key):
+                self.expire_item(key)
+                return False
+            return key in cache
+
+    def set_item(self, key, value, ttl=None):
+        """
+        设置key的value，超出max_entries或max_bytes时按照淘汰策略淘汰其他的key，
+        value的字节数超过max_bytes时无法被缓存，删除key原有的value并返回False
+        :ttl - float default=None, 有效期，以秒为单位，None表示永不过期，会清除key原有的有效期
+        """
+        size = 0
+        if self.max_bytes:
+            size = self.sizer(value)
+            if size > self.max_bytes:
+                self.pop_item(key, None)
+                return False
+        with self as cache:
+            if self._policy is not None:
+                tracked = key in self._policy
+                if tracked:
+                    self._policy.on_access(key)
+                    self.total_bytes -= self._sizes.pop(key, 0)
+                elif self.max_entries:
+                    while len(self._policy) >= self.max_entries:
+                        if self.evict_item() is None:
+                            break
+                if self.max_bytes:
+                    while self.total_bytes + size > self.max_bytes:
+                        evicted = self.evict_item()
+                        if evicted is None:
+                            break
+                        if evicted == key:
+                            tracked = False
+                    self._sizes[key] = size
+                    self.total_bytes += size
+                if not tracked:
+                    self._policy.on_insert(key)
+            cache[key] = value
+        if ttl:
+            self._expiry.push(key, time.monotonic() + ttl)
+            self.start_sweeper()
+        elif key in self._expiry:
+            self._expiry.discard(key)
+        return True
+
+    def pop_item(self, key, *default):
+        """
+        删除key并返回value，key不存在时如果没有提供default则抛出KeyError
+        """
+        self._expiry.discard(key)
+        if self._policy is not None:
+            self._policy.on_remove(key)
+            self.total_bytes -= self._sizes.pop(key, 0)
+        with self as cache:
+            return cache.pop(key, *default)
+
+    def expire_item(self, key):
+        """
+        删除已经过期的key
+        """
+        self.expirations += 1
+        self.pop_item(key, None)
+
+    def evict_item(self):
+        """
+        按照淘汰策略淘汰一个key，返回被淘汰的key，没有可淘汰的key返回None
+        """
+        key = self._policy.evict()
+        if key is None:
+            return None
+        self.evictions += 1
+        self._expiry.discard(key)
+        self.total_bytes -= self._sizes.pop(key, 0)
+        with self as cache:
+            cache.pop(key, None)
+        return key
+
+    def clear_items(self):
+        """
+        清除全部key
+        """
+        self.stop_sweeper()
+        self._expiry.clear()
+        if self._policy is not None:
+            self._policy.clear()
+        self._sizes.clear()
+        self.total_bytes = 0
+        with self as cache:
+            cache.clear()
+
+    def get_stats(self):
+        """
+        获取缓存的命中、未命中、淘汰、过期的统计数据
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._policy) if self._policy is not None else len(self._cache_dict or ()),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_item(self, key):
+        """
+        获取key剩余的有效期，以秒为单位，没有设置有效期返回None
+        """
+        deadline = self._expiry.get(key)
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0)
+
+    def sweep(self):
+        """
+        主动清理已经过期的key，单次处理的数量和耗时受sweep_limit和sweep_budget限制，返回清理的key数量
+        """
+        expired = self._expiry.pop_expired(limit=self.sweep_limit, budget=self.sweep_budget)
+        for key in expired:
+            self.expire_item(key)
+        return len(expired)
+
+    def start_sweeper(self):
+        """
+        在当前运行的event loop中使用call_later定时清理，没有运行的event loop时只进行惰性删除
+        定时器不是task，event loop关闭时不会遗留pending的task
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._sweeper is not None and self._sweeper_loop is loop:
+            return
+        self.stop_sweeper()
+        self._sweeper_loop = loop
+        self._sweeper = loop.call_later(self.sweep_interval, self._sweep_tick)
+
+    def stop_sweeper(self):
+        """
+        停止后台清理，取消定时器后不会再执行清理
+        """
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        self._sweeper = None
+        self._sweeper_loop = None
+
+    def _sweep_tick(self):
+        self._sweeper = None
+        self.sweep()
+        # 没有需要过期的key时停止，下次设置有效期时重新启动
+        loop = self._sweeper_loop
+        if len(self._expiry) > 0 and loop is not None and not loop.is_closed():
+            self._sweeper = loop.call_later(self.sweep_interval, self._sweep_tick)
+        else:
+            self._sweeper_loop = None
+
 
 class SimpleCacheBackend(CacheBackend):
+    stores_objects = True
+
     def __init__(self, config=None):
         """
         __init__构造函数，使用参数创建一个SimpleCacheBackend实例对象，并返回
@@ -199,17 +495,58 @@ class SimpleCacheBackend(CacheBackend):
         self._cache_context = None
         if config is not None:
             self.key_prefix = config.get('CACHE_KEY_PREFIX', str(self.__class__.__name__).upper())
+            # 过期key的后台清理
+            self.sweep_interval = config.get('CACHE_EXPIRE_SWEEP_INTERVAL', 0.1)
+            self.sweep_limit = config.get('CACHE_EXPIRE_SWEEP_LIMIT', 200)
+            self.sweep_budget = config.get('CACHE_EXPIRE_SWEEP_BUDGET', 0.001)
+            # 容量限制和淘汰策略
+            self.max_entries = config.get('CACHE_MAX_ENTRIES', None)
+            self.eviction_policy = config.get('CACHE_EVICTION_POLICY', 'lru')
+            self.max_bytes = config.get('CACHE_MAX_BYTES', None)
+            self.sizer = config.get('CACHE_SIZER', None)
+            # 超过该字节数的key使用SHA-1摘要代替
+            self.key_hash_min_bytes = config.get('CACHE_KEY_HASH_MIN_BYTES', None)
+            # 设置后value序列化后保存，读取时返回新的对象，不再保存对象的引用
+            self.serializer = create_serializer(config.get('CACHE_SERIALIZER', None),
+                                                compress_min_bytes=config.get('CACHE_COMPRESS_MIN_BYTES', None),
+                                                compressor=config.get('CACHE_COMPRESSOR', 'zlib'))
         else:
             # 使用self.__class__.__name__做为prefix
             self.key_prefix = str(self.__class__.__name__).upper()
+            self.sweep_interval = 0.1
+            self.sweep_limit = 200
+            self.sweep_budget = 0.001
+            self.max_entries = None
+            self.eviction_policy = 'lru'
+            self.max_bytes = None
+            self.sizer = None
+            self.key_hash_min_bytes = None
+            self.serializer = None
+        self.key_builder = KeyBuilder(self.key_prefix, hash_min_bytes=self.key_hash_min_bytes)
         # setup
         self.setup_config(config)
 
     def make_key(self, key):
         """
         生成key，使用f"{self.key_prefix}{key}"
+        @See KeyBuilder.build
         """
-        return f"{self.key_prefix}{key}"
+        return self.key_builder.build(key)
+
+    @staticmethod
+    def make_ttl(expire=None, pexpire=None):
+        """
+        将expire(秒)和pexpire(毫秒)转换为以秒为单位的有效期，两者同时存在时pexpire优先，None或0表示永不过期
+        """
+        if pexpire:
+            if pexpire < 0:
+                raise ValueError("invalid pexpire time, pexpire=%s" % str(pexpire))
+            return pexpire / 1000.0
+        if expire:
+            if expire < 0:
+                raise ValueError("invalid expire time, expire=%s" % str(expire))
+            return float(expire)
+        return None
 
     def setup_config(self, config=None):
         """
@@ -232,7 +569,15 @@ class SimpleCacheBackend(CacheBackend):
         Implement function from CacheBackendContext interface.
         @See CacheBackendContext.create_cache_context
         """
-        self._cache_context = SimpleCacheDictContext()
+        self._cache_context = SimpleCacheDictContext(
+            sweep_interval=self.sweep_interval,
+            sweep_limit=self.sweep_limit,
+            sweep_budget=self.sweep_budget,
+            max_entries=self.max_entries,
+            eviction_policy=self.eviction_policy,
+            max_bytes=self.max_bytes,
+            sizer=self.sizer
+        )
 
     async def destroy_cache_context(self):
         """
@@ -250,7 +595,14 @@ class SimpleCacheBackend(CacheBackend):
         with self.get_cache_context() as cache_dict:
             return cache_dict
 
-    @async_method_in_loop
+    def get_stats(self):
+        """
+        获取缓存的命中、未命中、淘汰、过期的统计数据
+        @See SimpleCacheDictContext.get_stats
+        """
+        return self.get_cache_context().get_stats()
+
+    @async_method_inline
     def get(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface.
@@ -263,28 +615,29 @@ class SimpleCacheBackend(CacheBackend):
         else:
             raise TypeError("Too many or no key to get, args = %s kwargs= %s" % (str(args), str({**kwargs})))
         try:
-            return self.get_cache().get(key)
+            return self.decode_value(self.get_cache_context().get_item(key))
         except Exception:
             raise KeyError("Get Key Error, key=%s" % key)
 
-    @async_method_in_loop
+    @async_method_inline
     def set(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface.
+        exist为"SET_IF_NOT_EXIST"/"SET_IF_EXIST"时与Redis的NX/XX相同，条件不满足时不写入并返回False，
+        检查和写入在event loop所在线程中连续执行，不会被其他coroutine打断
         @See CacheBackend.set
         """
+        ttl = self.make_ttl(kwargs.get("expire", None), kwargs.get("pexpire", None))
+        exist = kwargs.get("exist", None)
+
         # 筛选除["expire","pexpire","exist"]以外的key-val
         filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
-        cache = self.get_cache()
         if len(args) == 0:
             if len(filter_kv) == 0:
                 raise TypeError("Mapping for set might missing, kwargs = %s" % str({**kwargs}))
             elif len(filter_kv) == 1:
-                kv2update = {self.make_key(k): v for k, v in kwargs.items()}
-                try:
-                    cache.update(kv2update)
-                except KeyError:
-                    raise KeyError("Set Key Error, key=%s" % kv2update.keys)
+                (key, value) = list(filter_kv.items())[0]
+                key = self.make_key(key)
             else:
                 raise TypeError(
                     "Too many mappings to set, Use set_many method instead of set method, kwargs = %s" % str(
@@ -295,28 +648,26 @@ class SimpleCacheBackend(CacheBackend):
                 key = self.make_key(key)
             else:
                 raise TypeError("Value is required to set key: %s, or paired tuple (key, value)" % str(args[0]))
-            try:
-                cache[key] = value
-            except KeyError:
-                raise KeyError("Set Key Error, key=%s" % key)
         elif len(args) == 2:
             key = self.make_key(args[0])
             value = args[1]
-            try:
-                cache[key] = value
-            except KeyError:
-                raise KeyError("Set Key Error, key=%s" % key)
         else:
             raise TypeError("Too many keys to set, Use set_many method instead of set method, keys = %s" % str(args))
-        return True
+        try:
+            context = self.get_cache_context()
+            if exist is not None and not exist_allows(exist, context.contains_item(key)):
+                return False
+            return context.set_item(key, self.encode_value(value), ttl)
+        except KeyError:
+            raise KeyError("Set Key Error, key=%s" % key)
 
-    @async_method_in_loop
+    @async_method_inline
     def delete(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface.
         @See CacheBackend.delete
         """
-        cache = self.get_cache()
+        context = self.get_cache_context()
         if len(args) == 1 and len(kwargs) == 0:
             key = self.make_key(args[0])
         elif len(args) == 0 and len(kwargs) == 1:
@@ -324,65 +675,77 @@ class SimpleCacheBackend(CacheBackend):
         else:
             raise TypeError("Too many or no key to delete, args = %s kwargs= %s" % (str(args), str({**kwargs})))
         try:
-            # 查找并删除
-            cache.get(key)
-            cache.pop(key)
+            # 查找并删除，已过期的key视为不存在
+            if not context.contains_item(key):
+                raise KeyError(key)
+            context.pop_item(key)
         except Exception:
             raise KeyError("Delete Key Error, key=%s" % key)
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def get_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface.
         @See CacheBackend.get_many
         """
         results = []
-        cache = self.get_cache()
-        if len(args) == 0:
+        context = self.get_cache_context()
+        keys = parse_many_keys(args)
+        if keys is None and len(args) == 0:
             raise TypeError("No keys for delete_many, args=%s" % str(args))
-        for i in range(len(args)):
-            key = self.make_key(args[i])
+        for key in self.key_builder.build_many(args if keys is None else keys):
             try:
-                val = cache.get(key)
+                val = context.get_item(key)
             except KeyError:
                 raise KeyError("Get Key Error, key=%s" % key)
-            results.append(val)
+            results.append(self.decode_value(val))
+        if keys is not None:
+            return make_mapping(keys, results, kwargs)
         return results
 
-    @async_method_in_loop
+    @async_method_inline
     def delete_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface.
         @See CacheBackend.delete_many
         """
-        cache = self.get_cache()
+        context = self.get_cache_context()
         if len(args) == 0:
             raise TypeError("No keys for delete_many, keys=%s" % str(args))
-        for i in range(len(args)):
-            key = self.make_key(args[i])
+        for key in self.key_builder.build_many(args):
             try:
-                val = cache.get(key)
-                if val:
-                    cache.pop(key)
+                context.pop_item(key, None)
             except KeyError:
                 raise KeyError("Delete Key Error, key=%s" % key)
         return True
 
-    @async_method_in_loop
+    @async_method_inline
     def set_many(self, *args, **kwargs):
         """
         Implement function from CacheBackend interface.
+        expire/pexpire/exist可以使用dict按key分别指定，
+        使用exist参数时与Redis backend相同返回{key: bool}，条件不满足而没有写入的key为False
         @See CacheBackend.set_many
         """
-        kv2update = {
-            **{self.make_key(k): v for k, v in dict(args).items()},
-            **{self.make_key(k): v for k, v in kwargs.items()},
-        }
+        expire = kwargs.get("expire", None)
+        pexpire = kwargs.get("pexpire", None)
+        exist = kwargs.get("exist", None)
+        # 筛选除["expire","pexpire","exist"]以外的key-val
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        kv2update = {**dict(args), **filter_kv}
+        results = {}
         try:
-            cache = self.get_cache()
+            context = self.get_cache_context()
             if len(kv2update) > 0:
-                cache.update(kv2update)
+                for key, value in kv2update.items():
+                    full_key = self.make_key(key)
+                    key_exist = key_option(exist, key)
+                    if key_exist is not None and not exist_allows(key_exist, context.contains_item(full_key)):
+                        results[key] = False
+                        continue
+                    ttl = self.make_ttl(key_option(expire, key), key_option(pexpire, key))
+                    results[key] = context.set_item(full_key, self.encode_value(value), ttl) is not False
             else:
                 raise TypeError("No keys for get_many, keys=%s" % kv2update.keys)
         except KeyError:
@@ -390,6 +753,8 @@ class SimpleCacheBackend(CacheBackend):
         except ValueError as ex:
             raise ValueError("Error while converting args to dictionary, set_many supports tuple, but not strings",
                              str(ex))
+        if exist is not None:
+            return results
         return True
 
     async def add(self, *args, **kwargs):
@@ -422,18 +787,47 @@ class SimpleCacheBackend(CacheBackend):
             return await self.set_many(*args_ex_cmd, **kwargs)
         elif cmd == "del":
             return await self.delete(*args_ex_cmd, **kwargs)
+        elif cmd == "ttl":
+            return await self.ttl(*args_ex_cmd, **kwargs)
         else:
             raise TypeError("Unimplemented command %s", cmd)
 
-    @async_method_in_loop
+    @async_method_inline
     def clear(self):
-        cache = self.get_cache()
-        if len(cache) > 0:
-            cache.clear()
-        else:
-            return True
+        """
+        Implement function from CacheBackend interface.
+        @See CacheBackend.clear
+        """
+        self.get_cache_context().clear_items()
         return True
 
+    @async_method_inline
+    def scan_keys(self, batch_size=None):
+        """
+        遍历全部未过期的key，返回去掉CACHE_KEY_PREFIX的key的list
+        """
+        context = self.get_cache_context()
+        strip = self.key_builder.strip
+        return [strip(key) for key in list(context.cache_dict.keys())
+                if key not in ("", "*") and strip(key) is not None and context.contains_item(key)]
+
+    @async_method_inline
+    def ttl(self, *args, **kwargs):
+        """
+        获取key剩余的有效期，以秒为单位，key不存在返回-2，没有设置有效期返回-1，与Redis的`TTL`命令保持一致
+        """
+        if len(args) == 1 and len(kwargs) == 0:
+            key = self.make_key(args[0])
+        elif len(args) == 0 and len(kwargs) == 1:
+            key = self.make_key(kwargs["key"])
+        else:
+            raise TypeError("Too many or no key to ttl, args = %s kwargs= %s" % (str(args), str({**kwargs})))
+        context = self.get_cache_context()
+        if not context.contains_item(key):
+            return -2
+        remaining = context.ttl_item(key)
+        return -1 if remaining is None else remaining
+
 
 class RedisContext(CacheContext):
     __metaclass__ = ABCMeta
@@ -495,6 +889,20 @@ class RedisBackend(CacheBackend):
             # 默认使用self.__class__.__name__做为prefix
             self.key_prefix = config.get('CACHE_KEY_PREFIX', str(self.__class__.__name__).upper())
             self.redis_uri = config.get('CACHE_SCHEME_URI', None)
+            # clear使用SCAN + UNLINK分批删除
+            self.clear_batch_size = config.get('CACHE_REDIS_CLEAR_BATCH_SIZE', 1000)
+            self.clear_concurrency = config.get('CACHE_REDIS_CLEAR_CONCURRENCY', 1)
+            # pipeline中每批最多的命令数量
+            self.pipeline_chunk_size = config.get('CACHE_REDIS_PIPELINE_CHUNK_SIZE', 1000)
+            # get_many拆分的每条MGET最多的key数量，以及同时执行的MGET数量
+            self.mget_chunk_size = config.get('CACHE_REDIS_MGET_CHUNK_SIZE', 1000)
+            self.mget_concurrency = config.get('CACHE_REDIS_MGET_CONCURRENCY', 4)
+            # 超过该字节数的key使用SHA-1摘要代替
+            self.key_hash_min_bytes = config.get('CACHE_KEY_HASH_MIN_BYTES', None)
+            # 设置后value序列化为bytes写入，连接不再解码返回值
+            self.serializer = create_serializer(config.get('CACHE_SERIALIZER', None),
+                                                compress_min_bytes=config.get('CACHE_COMPRESS_MIN_BYTES', None),
+                                                compressor=config.get('CACHE_COMPRESSOR', 'zlib'))
         else:
             self.redis_scheme = 'redis'
             self.redis_host = 'localhost'
@@ -505,14 +913,33 @@ class RedisBackend(CacheBackend):
             # 使用self.__class__.__name__做为prefix
             self.key_prefix = str(self.__class__.__name__).upper()
             self.redis_uri = None
+            self.clear_batch_size = 1000
+            self.clear_concurrency = 1
+            self.pipeline_chunk_size = 1000
+            self.mget_chunk_size = 1000
+            self.mget_concurrency = 4
+            self.key_hash_min_bytes = None
+            self.serializer = None
+        self.last_clear_stats = None
+        self.key_builder = self.create_key_builder()
 
         self.setup_config(config)
 
+    def create_key_builder(self):
+        """
+        创建生成key的KeyBuilder
+        @See KeyBuilder
+        """
+        return KeyBuilder(self.key_prefix, hash_min_bytes=self.key_hash_min_bytes,
+                          encoding=getattr(self, "encoding", None) or "utf-8")
+
     def setup_config(self, config=None):
         # do something to setup
         if self.redis_uri:
             pass
         else:
+            # 只有Redis backend使用pydantic，导入omi_cache_manager时不加载
+            from pydantic import RedisDsn
             self.redis_uri = RedisDsn.build(
                 scheme=self.redis_scheme,
                 host=self.redis_host,
@@ -551,6 +978,133 @@ class RedisBackend(CacheBackend):
         # just wait
         return await asyncio.sleep(0.01)
 
+    def iter_chunks(self, items):
+        """
+        按CACHE_REDIS_PIPELINE_CHUNK_SIZE拆分items，限制单个pipeline的缓冲区大小
+        """
+        size = max(int(self.pipeline_chunk_size), 1)
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    async def scan_unlink(self, conn, match, batch_size=None, concurrency=None, progress=None):
+        """
+        使用`SCAN MATCH match COUNT batch_size`逐步遍历key，每凑满batch_size个key使用`UNLINK`删除一批，
+        同时最多有concurrency批正在删除，内存中最多保留concurrency批key，不会阻塞Redis服务器，
+        返回统计信息{"scanned", "deleted", "batches", "elapsed"}
+        注意：UNLINK需要Redis 4.0以上版本，SCAN期间新写入的key不保证被删除
+        :conn - Redis连接或者连接池
+        :match - str, SCAN的MATCH参数，需要包含key_prefix
+        :batch_size - int default=None, 每批删除的key数量，默认使用CACHE_REDIS_CLEAR_BATCH_SIZE
+        :concurrency - int default=None, 同时进行的UNLINK数量，默认使用CACHE_REDIS_CLEAR_CONCURRENCY
+        :progress - callable default=None, 每批删除完成后使用统计信息调用
+        """
+        batch_size = batch_size or self.clear_batch_size
+        concurrency = concurrency or self.clear_concurrency
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("`batch_size` and `concurrency` must be >= 1, batch_size=%s concurrency=%s"
+                             % (str(batch_size), str(concurrency)))
+        stats = {"scanned": 0, "deleted": 0, "batches": 0, "elapsed": 0.0}
+        started = time.perf_counter()
+        pending = set()
+
+        async def unlink(keys):
+            deleted = await self.unlink_keys(conn, keys)
+            stats["deleted"] += deleted
+            stats["batches"] += 1
+            stats["elapsed"] = time.perf_counter() - started
+            if progress is not None:
+                progress(dict(stats))
+
+        async def wait_pending(limit):
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+
+        buffer = []
+        try:
+            async for keys in self.scan_batches(conn, match, batch_size):
+                stats["scanned"] += len(keys)
+                buffer.extend(keys)
+                while len(buffer) >= batch_size:
+                    batch, buffer = buffer[:batch_size], buffer[batch_size:]
+                    await wait_pending(concurrency - 1)
+                    pending.add(asyncio.ensure_future(unlink(batch)))
+            if buffer:
+                await wait_pending(concurrency - 1)
+                pending.add(asyncio.ensure_future(unlink(buffer)))
+            await wait_pending(0)
+        finally:
+            for task in pending:
+                task.cancel()
+        stats["elapsed"] = time.perf_counter() - started
+        self.last_clear_stats = stats
+        return stats
+
+    async def mget_chunked(self, conn, keys):
+        """
+        按CACHE_REDIS_MGET_CHUNK_SIZE将MGET拆分为多条命令，同时最多执行CACHE_REDIS_MGET_CONCURRENCY条，
+        限制单条命令请求和返回的大小，返回与keys顺序一致的value的list
+        :conn - Redis连接或者连接池
+        :keys - list, 完整的key
+        """
+        chunk_size = max(int(self.mget_chunk_size), 1)
+        if len(keys) <= chunk_size:
+            return await conn.mget(*keys)
+        semaphore = asyncio.Semaphore(max(int(self.mget_concurrency), 1))
+
+        async def mget_chunk(chunk):
+            async with semaphore:
+                return await conn.mget(*chunk)
+
+        replies = await asyncio.gather(*[mget_chunk(keys[i:i + chunk_size])
+                                         for i in range(0, len(keys), chunk_size)])
+        return [value for reply in replies for value in reply]
+
+    async def scan_prefix(self, conn, batch_size=None):
+        """
+        使用与clear_keys相同的`SCAN MATCH make_key("*") COUNT batch_size`遍历key，
+        返回去掉完整前缀（包括CACHE_REDIS_HASH_TAG）的key的list，与get/set使用的key一致
+        注意：SCAN期间新写入或删除的key不保证被返回
+        :conn - Redis连接或者连接池
+        :batch_size - int default=None, SCAN的COUNT参数，默认使用CACHE_REDIS_CLEAR_BATCH_SIZE
+        """
+        batch_size = batch_size or self.clear_batch_size
+        results = []
+        async for keys in self.scan_batches(conn, self.make_key("*"), batch_size):
+            for key in keys:
+                if isinstance(key, bytes):
+                    key = key.decode(self.key_builder.encoding, "surrogateescape")
+                key = self.key_builder.strip(key)
+                if key is not None:
+                    results.append(key)
+        return results
+
+    async def scan_batches(self, conn, match, batch_size):
+        """
+        使用`SCAN MATCH match COUNT batch_size`遍历key，每次SCAN返回的key作为一批yield，
+        Redis Cluster等需要按节点遍历的后端可以覆盖该方法
+        :conn - Redis连接或者连接池
+        :match - str, SCAN的MATCH参数
+        :batch_size - int, SCAN的COUNT参数
+        """
+        cursor = 0
+        while True:
+            cursor, keys = await conn.scan(cursor=cursor, match=match, count=batch_size)
+            if keys:
+                yield keys
+            if cursor == 0:
+                break
+
+    async def unlink_keys(self, conn, keys):
+        """
+        使用`UNLINK`删除一批key，返回删除的数量，Redis Cluster等需要按slot拆分命令的后端可以覆盖该方法
+        :conn - Redis连接或者连接池
+        :keys - list, 完整的key
+        """
+        return await conn.unlink(*keys)
+
     @abstractmethod
     def clear(self):
         """
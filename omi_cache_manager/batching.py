@@ -0,0 +1,198 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import asyncio
+import time
+
+
+class BatchLoader(object):
+    """
+    DataLoader方式的自动批量操作，将同一个事件循环tick（或者指定的微秒窗口）内的单key操作
+    合并为一次get_many/set_many/delete_many调用，再将结果分发给各自等待的future
+    操作按照提交顺序分段执行，连续的同类操作合并为一批，不同类操作之间保持原有的先后顺序
+    每次批量执行都等待上一次执行完成，达到max_batch_size立即执行的批次与之后的批次之间同样保持提交顺序
+    """
+    GET = "get"
+    SET = "set"
+    DELETE = "delete"
+
+    def __init__(self, backend, window_us=0, max_batch_size=100):
+        """
+        __init__构造函数，使用参数创建一个BatchLoader实例对象，并返回
+            backend - CacheBackend, 执行批量操作的backend
+            window_us - int default=0, 收集操作的时间窗口，以微秒为单位，0表示在下一个tick执行
+            max_batch_size - int default=100, 单批最多的key数量，达到后立即执行
+        """
+        if window_us < 0:
+            raise ValueError("`window_us` must be >= 0, window_us=%s" % str(window_us))
+        if max_batch_size < 1:
+            raise ValueError("`max_batch_size` must be >= 1, max_batch_size=%s" % str(max_batch_size))
+        self.backend = backend
+        self.window_us = window_us
+        self.max_batch_size = max_batch_size
+        self._queue = []
+        self._handle = None
+        self._opened_at = None
+        # 最近一次批量执行的task，下一次执行等待其完成
+        self._flushing = None
+        # metrics
+        self.batches = 0
+        self.batched = 0
+        self.calls = 0
+        self.max_size = 0
+        self.windows = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def load(self, key):
+        """
+        提交一个get操作，返回future
+        """
+        return self._submit(self.GET, key)
+
+    def store(self, key, value):
+        """
+        提交一个不带过期时间和存在性条件的set操作，返回future，结果为set_many的返回值
+        """
+        return self._submit(self.SET, key, value)
+
+    def remove(self, key):
+        """
+        提交一个delete操作，返回future，结果为delete_many的返回值
+        """
+        return self._submit(self.DELETE, key)
+
+    def _submit(self, op, key, value=None):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._queue.append((op, key, value, future))
+        self.calls += 1
+        if len(self._queue) >= self.max_batch_size:
+            self._cancel_schedule()
+            self._dispatch()
+        elif self._handle is None:
+            self._opened_at = time.perf_counter()
+            if self.window_us > 0:
+                self._handle = loop.call_later(self.window_us / 1000000, self._dispatch)
+            else:
+                self._handle = loop.call_soon(self._dispatch)
+        return future
+
+    def _cancel_schedule(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _dispatch(self):
+        self._handle = None
+        queue, self._queue = self._queue, []
+        if not queue:
+            return
+        if self._opened_at is not None:
+            wait = time.perf_counter() - self._opened_at
+            self.windows += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._opened_at = None
+        self._flushing = asyncio.ensure_future(self._flush_after(self._flushing, queue))
+
+    async def flush(self):
+        """
+        立即执行当前收集的全部操作，并等待之前已经开始的批量执行完成
+        """
+        self._cancel_schedule()
+        queue, self._queue = self._queue, []
+        self._opened_at = None
+        if queue:
+            self._flushing = asyncio.ensure_future(self._flush_after(self._flushing, queue))
+        if self._flushing is not None:
+            await self._flushing
+
+    async def _flush_after(self, previous, queue):
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        await self._flush(queue)
+
+    async def _flush(self, queue):
+        # 连续的同类操作合并为一批
+        start = 0
+        while start < len(queue):
+            op = queue[start][0]
+            end = start + 1
+            while end < len(queue) and queue[end][0] == op:
+                end += 1
+            await self._run_batch(op, queue[start:end])
+            start = end
+
+    async def _run_batch(self, op, entries):
+        self.batches += 1
+        self.batched += len(entries)
+        self.max_size = max(self.max_size, len(entries))
+        try:
+            if op == self.GET:
+                keys = list(dict.fromkeys(entry[1] for entry in entries))
+                values = await self.backend.get_many(*keys)
+                if values is None:
+                    values = [None] * len(keys)
+                found = dict(zip(keys, values))
+                for _, key, _, future in entries:
+                    if not future.done():
+                        future.set_result(found.get(key))
+                return
+            elif op == self.SET:
+                # 同一批中重复的key以最后一次写入为准
+                kv2update = {key: value for _, key, value, _ in entries}
+                result = await self.backend.set_many(*kv2update.items())
+            else:
+                keys = list(dict.fromkeys(entry[1] for entry in entries))
+                result = await self.backend.delete_many(*keys)
+        except Exception as e:
+            for entry in entries:
+                if not entry[3].done():
+                    entry[3].set_exception(e)
+            return
+        for entry in entries:
+            if not entry[3].done():
+                entry[3].set_result(result)
+
+    def get_stats(self):
+        """
+        获取批量操作的统计信息，wait为从第一个操作提交到批量执行之间的实际等待时间，以微秒为单位
+        """
+        return {
+            "window_us": self.window_us,
+            "max_batch_size": self.max_batch_size,
+            "pending": len(self._queue),
+            "calls": self.calls,
+            "batches": self.batches,
+            "avg_batch_size": self.batched / self.batches if self.batches else 0.0,
+            "max_seen_batch_size": self.max_size,
+            "avg_wait_us": self.total_wait * 1000000 / self.windows if self.windows else 0.0,
+            "max_wait_us": self.max_wait * 1000000,
+        }
+
+    def reset_stats(self):
+        self.batches = 0
+        self.batched = 0
+        self.calls = 0
+        self.max_size = 0
+        self.windows = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
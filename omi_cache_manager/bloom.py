@@ -0,0 +1,96 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import math
+
+
+class BloomFilter(object):
+    """
+    使用bit数组的Bloom Filter，每个位置占用1个bit
+    判断为不存在的key一定没有被add，判断为存在的key有error_rate的概率没有被add
+    不支持删除，删除的key需要通过重建清除
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.01):
+        """
+        __init__构造函数，使用参数创建一个BloomFilter实例对象，并返回
+            capacity - int default=100000, 预计的key数量，超过后误判率升高
+            error_rate - float default=0.01, key数量不超过capacity时的误判率
+        """
+        if capacity < 1:
+            raise ValueError("`capacity` must be >= 1, capacity=%s" % str(capacity))
+        if not 0 < error_rate < 1:
+            raise ValueError("`error_rate` must be between 0 and 1, error_rate=%s" % str(error_rate))
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # m = -n * ln(p) / ln(2)^2, k = m / n * ln(2)
+        self.size = max(int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))), 1)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        bits = self._bits
+        for index in self._indexes(key):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def _indexes(self, key):
+        # 使用splitmix64打散str(key)的hash值，再使用double hashing生成k个位置
+        h = (hash(str(key)) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+        h1 = h >> 32
+        h2 = (h & 0xFFFFFFFF) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        bits = self._bits
+        for index in self._indexes(key):
+            bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def clear(self):
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @property
+    def memory_bytes(self):
+        return len(self._bits)
+
+    def estimated_error_rate(self):
+        """
+        按当前add的次数估算的误判率，(1 - e^(-k * n / m))^k，同一个key多次add时偏高
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def get_stats(self):
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "size": self.size,
+            "hashes": self.hashes,
+            "count": self.count,
+            "memory_bytes": self.memory_bytes,
+            "estimated_error_rate": self.estimated_error_rate(),
+        }
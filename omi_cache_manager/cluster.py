@@ -0,0 +1,85 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+from collections import OrderedDict
+
+# Redis Cluster的hash slot数量
+CLUSTER_SLOTS = 16384
+
+
+def _make_crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+
+_CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data):
+    """
+    CRC16-CCITT (XMODEM)，Redis Cluster计算hash slot使用的校验算法
+    """
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def hash_tag(key):
+    """
+    返回key中参与hash slot计算的部分，key中第一个`{`和之后第一个`}`之间不为空时只使用其中的内容
+    """
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    start = key.find(b"{")
+    if start > -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def key_hash_slot(key):
+    """
+    计算key所在的hash slot，与Redis的`CLUSTER KEYSLOT`结果一致
+    """
+    return crc16(hash_tag(key)) % CLUSTER_SLOTS
+
+
+def tagged(tag, key):
+    """
+    使用hash tag生成key，相同tag的key会被分配到同一个hash slot，例如tagged("user:1", "profile")返回"{user:1}profile"
+    """
+    return "{%s}%s" % (tag, key)
+
+
+def group_by_slot(keys):
+    """
+    按hash slot分组，返回OrderedDict{slot: [index]}，index为key在keys中的位置，保持keys的原有顺序
+    """
+    groups = OrderedDict()
+    for index, key in enumerate(keys):
+        groups.setdefault(key_hash_slot(key), []).append(index)
+    return groups
@@ -0,0 +1,97 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import math
+import random
+import time
+
+# 带有过期信息的value保存为list，第一个元素为标记，pickle/json/msgpack都可以保存
+ENVELOPE_MARK = "__omi_cache_envelope__"
+# 缓存的未命中结果保存为该字符串，不需要serializer也可以保存
+MISSING_MARK = "__omi_cache_missing__"
+
+
+class NotFound(object):
+    """
+    AsyncCacheManager.lookup返回的key不在缓存中的标记，与缓存的None结果区分
+    """
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "NOT_FOUND"
+
+
+NOT_FOUND = NotFound()
+
+
+def is_missing(value):
+    """
+    value是否为缓存的未命中结果
+    """
+    return type(value) is str and value == MISSING_MARK
+
+
+class Envelope(object):
+    """
+    保存value和写入时间，以及软过期时间(stale_after)和硬过期时间(ttl)，都以秒为单位
+    超过软过期时间的value仍然可以读取，但需要刷新，超过硬过期时间的key由backend删除
+    delta为计算value花费的时间，用于XFetch提前重新计算
+    写入时间使用time.time()，多个进程之间可以比较
+    """
+    __slots__ = ["value", "created_at", "stale_after", "ttl", "delta"]
+
+    def __init__(self, value, stale_after=None, ttl=None, created_at=None, delta=None):
+        self.value = value
+        self.stale_after = stale_after
+        self.ttl = ttl
+        self.delta = delta
+        self.created_at = time.time() if created_at is None else created_at
+
+    def is_stale(self, now=None):
+        """
+        是否已经超过软过期时间
+        """
+        if self.stale_after is None:
+            return False
+        return (time.time() if now is None else now) - self.created_at >= self.stale_after
+
+    def should_recompute(self, beta=1.0, now=None):
+        """
+        XFetch，越接近过期时间，计算越慢(delta越大)，提前重新计算的概率越高，
+        每次读取独立判断，多个进程之间不需要协调，beta越大越早重新计算
+        @See Vattani et al., Optimal Probabilistic Cache Stampede Prevention, VLDB 2015
+        """
+        if self.ttl is None:
+            return False
+        now = time.time() if now is None else now
+        # 1 - random()的范围为(0, 1]，log的结果不大于0
+        return now - (self.delta or 0) * beta * math.log(1.0 - random.random()) >= self.created_at + self.ttl
+
+    def dumps(self):
+        return [ENVELOPE_MARK, self.value, self.created_at, self.stale_after, self.ttl, self.delta]
+
+    @classmethod
+    def loads(cls, data):
+        """
+        从backend读取的value中解析Envelope，不是Envelope时返回None
+        """
+        if type(data) is not list or len(data) < 5 or data[0] != ENVELOPE_MARK:
+            return None
+        return cls(data[1], stale_after=data[3], ttl=data[4], created_at=data[2],
+                   delta=data[5] if len(data) > 5 else None)
@@ -0,0 +1,370 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import importlib
+import pickle
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+
+class EvictionPolicy(object):
+    """
+    内存缓存的淘汰策略，只维护key的顺序和访问频率，不保存value
+    由缓存在容量不足时调用evict()获取需要淘汰的key，所有操作都是O(1)
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def __len__(self):
+        """
+        当前策略中跟踪的key数量
+        """
+
+    @abstractmethod
+    def __contains__(self, key):
+        """
+        key是否被当前策略跟踪
+        """
+
+    @abstractmethod
+    def on_insert(self, key):
+        """
+        新的key写入缓存
+        """
+
+    @abstractmethod
+    def on_access(self, key):
+        """
+        key被读取命中或被覆盖写入
+        """
+
+    def on_miss(self, key):
+        """
+        读取key未命中，默认不处理
+        """
+
+    @abstractmethod
+    def on_remove(self, key):
+        """
+        key被删除或者过期
+        """
+
+    @abstractmethod
+    def evict(self):
+        """
+        选择并移除一个需要淘汰的key，返回该key，没有可淘汰的key时返回None
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        清除全部key
+        """
+
+
+class LRUPolicy(EvictionPolicy):
+    """
+    Least Recently Used，淘汰最久没有被访问的key
+    """
+
+    def __init__(self, max_entries=None):
+        self._order = OrderedDict()
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, key):
+        return key in self._order
+
+    def on_insert(self, key):
+        self._order[key] = None
+
+    def on_access(self, key):
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def on_remove(self, key):
+        self._order.pop(key, None)
+
+    def evict(self):
+        if not self._order:
+            return None
+        key, _ = self._order.popitem(last=False)
+        return key
+
+    def clear(self):
+        self._order.clear()
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    Least Frequently Used，淘汰访问次数最少的key，访问次数相同时淘汰最久没有被访问的key
+    使用频率分桶实现O(1)的访问和淘汰
+    """
+
+    def __init__(self, max_entries=None):
+        self._freqs = dict()
+        self._buckets = dict()
+        self._min_freq = None
+
+    def __len__(self):
+        return len(self._freqs)
+
+    def __contains__(self, key):
+        return key in self._freqs
+
+    def on_insert(self, key):
+        self._freqs[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._min_freq = 1
+
+    def on_access(self, key):
+        freq = self._freqs.get(key)
+        if freq is None:
+            return
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freqs[key] = freq + 1
+        self._buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def on_remove(self, key):
+        freq = self._freqs.pop(key, None)
+        if freq is None:
+            return
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = None
+
+    def evict(self):
+        if not self._freqs:
+            return None
+        if self._min_freq not in self._buckets:
+            # 最小频率的桶被删除后延迟重新计算
+            self._min_freq = min(self._buckets)
+        bucket = self._buckets[self._min_freq]
+        key, _ = bucket.popitem(last=False)
+        del self._freqs[key]
+        if not bucket:
+            del self._buckets[self._min_freq]
+            self._min_freq = None
+        return key
+
+    def clear(self):
+        self._freqs.clear()
+        self._buckets.clear()
+        self._min_freq = None
+
+
+class CountMinSketch(object):
+    """
+    TinyLFU使用的频率估计，4行计数器，每个计数器占用1个byte，最大为15，
+    累计记录次数达到sample_size后全部计数器减半，使历史频率逐渐老化
+    """
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, max_entries):
+        # 每行宽度取不小于4倍容量的2的幂，降低4行同时碰撞的概率，容量很小时至少256，避免碰撞高估频率
+        width = 256
+        while width < 4 * max_entries:
+            width <<= 1
+        self._width = width
+        self._mask = width - 1
+        self._table = bytearray(width * self.DEPTH)
+        self._additions = 0
+        self.sample_size = 10 * max(max_entries, 1)
+
+    def _indexes(self, key):
+        # 使用splitmix64打散hash值，int类型的key的hash值就是自身
+        h = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+        width = self._width
+        mask = self._mask
+        if width <= 0x10000:
+            # 每行使用独立的16位，两个key在4行同时碰撞的概率为1/width^4
+            return [row * width + ((h >> (16 * row)) & mask) for row in range(self.DEPTH)]
+        h1 = h >> 32
+        h2 = (h & 0xFFFFFFFF) | 1
+        return [row * width + ((h1 + row * h2) & mask) for row in range(self.DEPTH)]
+
+    def increment(self, key):
+        table = self._table
+        for index in self._indexes(key):
+            if table[index] < self.MAX_COUNT:
+                table[index] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self.reset()
+
+    def frequency(self, key):
+        table = self._table
+        return min(table[index] for index in self._indexes(key))
+
+    def reset(self):
+        self._table = bytearray(count >> 1 for count in self._table)
+        self._additions //= 2
+
+    def clear(self):
+        self._table = bytearray(len(self._table))
+        self._additions = 0
+
+
+class TinyLFUPolicy(EvictionPolicy):
+    """
+    W-TinyLFU，新的key先进入容量约1%的LRU窗口，窗口溢出的key作为候选者进入主区域的probation段，
+    候选者与主区域中最久没有被访问的key比较TinyLFU估计的访问频率，频率低的一方被淘汰。
+    主区域为Segmented LRU，probation段中再次被访问的key晋升到protected段（约80%）
+    """
+
+    def __init__(self, max_entries, window_ratio=0.01, protected_ratio=0.8):
+        # 只限制容量字节数时，无法得知key的数量，使用1024估算窗口和频率计数器的大小
+        max_entries = max(int(max_entries or 1024), 1)
+        self.window_max = max(int(max_entries * window_ratio), 1)
+        self.protected_max = max(int((max_entries - self.window_max) * protected_ratio), 1)
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._sketch = CountMinSketch(max_entries)
+
+    def __len__(self):
+        return len(self._window) + len(self._probation) + len(self._protected)
+
+    def __contains__(self, key):
+        return key in self._window or key in self._probation or key in self._protected
+
+    def on_insert(self, key):
+        self._sketch.increment(key)
+        self._window[key] = None
+        # 主区域还有空间时，窗口溢出的key直接进入probation
+        while len(self._window) > self.window_max:
+            overflow, _ = self._window.popitem(last=False)
+            self._probation[overflow] = None
+
+    def on_access(self, key):
+        self._sketch.increment(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self.protected_max:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+
+    def on_miss(self, key):
+        self._sketch.increment(key)
+
+    def on_remove(self, key):
+        for segment in (self._window, self._probation, self._protected):
+            if key in segment:
+                del segment[key]
+                return
+
+    def evict(self):
+        candidate = None
+        if self._window and len(self._window) >= self.window_max:
+            # 窗口已满，即将被新的key挤出窗口的key作为候选者进入probation
+            candidate, _ = self._window.popitem(last=False)
+            self._probation[candidate] = None
+        victim = None
+        for segment in (self._probation, self._protected):
+            for key in segment:
+                if key != candidate:
+                    victim = key
+                break
+            if victim is not None:
+                break
+        if victim is None:
+            if candidate is not None:
+                evicted = candidate
+            elif self._window:
+                evicted = next(iter(self._window))
+            else:
+                return None
+        elif candidate is None:
+            evicted = victim
+        elif self._sketch.frequency(candidate) > self._sketch.frequency(victim):
+            evicted = victim
+        else:
+            evicted = candidate
+        self.on_remove(evicted)
+        return evicted
+
+    def clear(self):
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+        self._sketch.clear()
+
+
+EVICTION_POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "tinylfu": TinyLFUPolicy,
+    "w-tinylfu": TinyLFUPolicy,
+    "wtinylfu": TinyLFUPolicy,
+}
+
+
+def create_eviction_policy(policy, max_entries):
+    """
+    根据名称创建淘汰策略，不区分大小写，可选值"lru", "lfu", "w-tinylfu"，也可以直接传入EvictionPolicy实例
+    """
+    if isinstance(policy, EvictionPolicy):
+        return policy
+    if not isinstance(policy, str) or policy.lower() not in EVICTION_POLICIES:
+        raise ValueError("Unknown eviction policy %s, supports %s" % (str(policy), list(EVICTION_POLICIES.keys())))
+    return EVICTION_POLICIES[policy.lower()](max_entries)
+
+
+def serialized_size(value):
+    """
+    默认的value大小计算方法，str使用utf-8编码后的长度，bytes使用自身长度，其他类型使用pickle序列化后的长度
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def resolve_sizer(sizer):
+    """
+    解析value大小的计算方法，可以传入callable或者"module.function"格式的str，None使用serialized_size
+    """
+    if sizer is None:
+        return serialized_size
+    if callable(sizer):
+        return sizer
+    if isinstance(sizer, str) and "." in sizer:
+        module_name, func_name = sizer.rsplit(".", 1)
+        try:
+            return getattr(importlib.import_module(module_name), func_name)
+        except (ImportError, AttributeError):
+            raise ValueError("Cannot resolve sizer %s" % sizer)
+    raise ValueError("`sizer` must be callable or a dotted path str, sizer=%s" % str(sizer))
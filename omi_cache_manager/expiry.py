@@ -0,0 +1,107 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import heapq
+import itertools
+import time
+
+
+class ExpiryHeap(object):
+    """
+    key过期时间的最小堆索引，push/discard为O(log n)/O(1)，弹出已过期key为O(k log n)
+    key被重新设置或删除后，堆中遗留的旧记录采用惰性删除，弹出时与当前deadline比对后丢弃
+    堆中的记录为(deadline, seq, key)，deadline相同时按写入顺序比较seq，不会比较str和bytes等不同类型的key
+    """
+
+    def __init__(self):
+        self._deadlines = dict()
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def get(self, key):
+        """
+        获取key的过期时间，没有设置过期时间返回None
+        """
+        return self._deadlines.get(key)
+
+    def push(self, key, deadline):
+        """
+        设置key的过期时间，deadline使用time.monotonic()的时间基准
+        """
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        # 旧记录过多时重建堆，避免反复设置同一个key导致堆无限增长
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, next(self._seq), k) for k, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, key):
+        """
+        移除key的过期时间，堆中的记录惰性删除
+        """
+        self._deadlines.pop(key, None)
+
+    def clear(self):
+        self._deadlines.clear()
+        self._heap = []
+
+    def is_expired(self, key, now=None):
+        deadline = self._deadlines.get(key)
+        if deadline is None:
+            return False
+        return deadline <= (time.monotonic() if now is None else now)
+
+    def next_deadline(self):
+        """
+        最近的一个过期时间，没有返回None
+        """
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_expired(self, now=None, limit=None, budget=None):
+        """
+        弹出已经过期的key并返回列表
+        :now - float default=None, 当前时间，默认使用time.monotonic()
+        :limit - int default=None, 本次最多处理的堆记录数量
+        :budget - float default=None, 本次最多占用的时间（time.perf_counter测量的实际经过时间），以秒为单位
+        """
+        now = time.monotonic() if now is None else now
+        started = time.perf_counter()
+        expired = []
+        popped = 0
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(heap)
+            popped += 1
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                expired.append(key)
+            if limit is not None and popped >= limit:
+                break
+            if budget is not None and time.perf_counter() - started >= budget:
+                break
+        return expired
@@ -0,0 +1,134 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import hashlib
+
+from .cluster import hash_tag as find_hash_tag
+
+# 被摘要代替的key的标记，摘要后的key为f"{prefix}#sha1:{hexdigest}"
+HASHED_MARK = b"#sha1:"
+
+
+class KeyBuilder(object):
+    """
+    backend共用的key生成，格式为f"{prefix}{key}"，指定hash_tag时为f"{prefix}{{hash_tag}}{key}"
+    str的key返回str，bytes的key直接与缓存的prefix bytes拼接后返回bytes，不经过decode/encode
+    设置hash_min_bytes后，编码后不少于该字节数的key使用SHA-1摘要代替，减少长key占用的内存，
+    key中的hash tag会被保留，摘要后的key无法还原，scan_keys返回的是摘要后的key
+    """
+
+    def __init__(self, prefix="", hash_tag=None, hash_min_bytes=None, encoding="utf-8"):
+        """
+        __init__构造函数，使用参数创建一个KeyBuilder实例对象，并返回
+            prefix - str default="", key的前缀
+            hash_tag - str default=None, 默认的hash tag，相同hash tag的key在Redis Cluster中分配到同一个hash slot
+            hash_min_bytes - int default=None, 使用SHA-1摘要代替key的最小字节数，None表示不使用摘要
+            encoding - str default="utf-8", 计算key的字节数和拼接bytes的key时使用的编码
+        """
+        if hash_min_bytes is not None and hash_min_bytes < 1:
+            raise ValueError("`hash_min_bytes` must be >= 1, hash_min_bytes=%s" % str(hash_min_bytes))
+        self.prefix = prefix
+        self.hash_tag = hash_tag
+        self.hash_min_bytes = hash_min_bytes
+        self.encoding = encoding
+        self.prefix_bytes = prefix.encode(encoding)
+        # 使用默认hash tag的完整前缀
+        self.full_prefix = self.tagged_prefix(hash_tag)
+        self.full_prefix_bytes = self.full_prefix.encode(encoding)
+
+    def tagged_prefix(self, hash_tag):
+        """
+        返回带hash tag的前缀，hash_tag为空时返回prefix
+        """
+        if hash_tag:
+            return "%s{%s}" % (self.prefix, hash_tag)
+        return self.prefix
+
+    def digest(self, raw):
+        """
+        使用SHA-1摘要代替编码后的key，保留key中的hash tag，返回bytes
+        """
+        tag = find_hash_tag(raw)
+        digest = hashlib.sha1(raw).hexdigest().encode("ascii")
+        if tag is raw:
+            return HASHED_MARK + digest
+        return b"{" + tag + b"}" + HASHED_MARK + digest
+
+    def should_hash(self, key):
+        """
+        str的key是否需要摘要，UTF-8每个字符最多4个字节，只有长度无法判断时才编码
+        """
+        limit = self.hash_min_bytes
+        if limit is None or len(key) * 4 < limit:
+            return False
+        return len(key) >= limit or len(key.encode(self.encoding)) >= limit
+
+    def is_hashed(self, key):
+        """
+        key是否会被build摘要，摘要后的key无法从scan_keys还原
+        """
+        if self.hash_min_bytes is None:
+            return False
+        if isinstance(key, (bytes, bytearray, memoryview)):
+            return len(bytes(key)) >= self.hash_min_bytes
+        return self.should_hash(str(key))
+
+    def build(self, key, hash_tag=None):
+        """
+        生成单个key，hash_tag为None时使用默认的hash tag，为""时不使用hash tag
+        """
+        if hash_tag is None:
+            prefix = self.full_prefix
+            prefix_bytes = self.full_prefix_bytes
+        else:
+            prefix = self.tagged_prefix(hash_tag)
+            prefix_bytes = None
+        if type(key) is not str:
+            if isinstance(key, (bytes, bytearray, memoryview)):
+                raw = bytes(key)
+                if self.hash_min_bytes is not None and len(raw) >= self.hash_min_bytes:
+                    raw = self.digest(raw)
+                return (prefix_bytes or prefix.encode(self.encoding)) + raw
+            key = str(key)
+        if self.should_hash(key):
+            return prefix + self.digest(key.encode(self.encoding)).decode(self.encoding)
+        return prefix + key
+
+    def build_many(self, keys, hash_tag=None):
+        """
+        批量生成key，返回list，不使用hash_tag参数和摘要时str的key直接拼接前缀
+        """
+        build = self.build
+        if hash_tag is not None or self.hash_min_bytes is not None:
+            return [build(key, hash_tag) for key in keys]
+        prefix = self.full_prefix
+        return [prefix + key if type(key) is str else build(key) for key in keys]
+
+    def strip(self, key, hash_tag=None):
+        """
+        去掉build生成的前缀，str和bytes的key分别返回str和bytes，不是以该前缀开头的key返回None，
+        hash_tag为None时去掉带默认hash tag的前缀，为""时只去掉prefix
+        """
+        if hash_tag is None:
+            prefix = self.full_prefix if isinstance(key, str) else self.full_prefix_bytes
+        else:
+            prefix = self.tagged_prefix(hash_tag)
+            if not isinstance(key, str):
+                prefix = prefix.encode(self.encoding)
+        if not key.startswith(prefix):
+            return None
+        return key[len(prefix):]
@@ -0,0 +1,166 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import importlib
+
+# 第三方backend通过该entry point group注册别名，例如在setup.py中
+# entry_points={"omi_cache_manager.backends": ["sharded = my_package.sharded:ShardedBackend"]}
+ENTRY_POINT_GROUP = "omi_cache_manager.backends"
+
+BUILTIN_BACKENDS = {
+    "null_cache": "omi_cache_manager.backends:NullCacheBackend",
+    "nullcachebackend": "omi_cache_manager.backends:NullCacheBackend",
+    "simple_cache": "omi_cache_manager.backends:SimpleCacheBackend",
+    "simplecachebackend": "omi_cache_manager.backends:SimpleCacheBackend",
+    "aioredis": "omi_cache_manager.aio_redis_backend:AIORedisBackend",
+    "aioredisbackend": "omi_cache_manager.aio_redis_backend:AIORedisBackend",
+    "aredis": "omi_cache_manager.aredis_backend:ARedisBackend",
+    "aredisbackend": "omi_cache_manager.aredis_backend:ARedisBackend",
+    "tiered_cache": "omi_cache_manager.tiered_backend:TieredCacheBackend",
+    "tieredcachebackend": "omi_cache_manager.tiered_backend:TieredCacheBackend",
+}
+
+
+def import_path(path):
+    """
+    导入"module:Class"或者"module.Class"格式的路径，返回对应的对象
+    """
+    if ":" in path:
+        module_name, attr = path.split(":", 1)
+        module = importlib.import_module(module_name)
+        found = module
+        for frag in attr.split("."):
+            found = getattr(found, frag)
+        return found
+    # 从最长的模块路径开始尝试导入
+    frags = path.split(".")
+    for i in range(len(frags) - 1, 0, -1):
+        try:
+            module = importlib.import_module(".".join(frags[:i]))
+        except ImportError:
+            if i == 1:
+                raise
+            continue
+        found = module
+        for frag in frags[i:]:
+            found = getattr(found, frag)
+        return found
+    raise ImportError("Cannot import %s" % path)
+
+
+def iter_entry_points(group):
+    """
+    遍历已安装的包中指定group的entry point，返回[(name, value)]
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        # python < 3.8
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return [(ep.name, "%s:%s" % (ep.module_name, ".".join(ep.attrs)))
+                for ep in pkg_resources.iter_entry_points(group)]
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        selected = entry_points.select(group=group)
+    else:
+        selected = entry_points.get(group, [])
+    return [(ep.name, ep.value) for ep in selected]
+
+
+class BackendRegistry(object):
+    """
+    backend的别名注册表，别名不区分大小写，值为backend的class或者"module:Class"格式的路径，
+    路径在第一次使用时才导入，解析结果被缓存，之后创建manager不再导入和查找
+    未注册的名称先查找entry point，再作为完整的module.Class路径导入
+    """
+
+    def __init__(self, backends=None, group=ENTRY_POINT_GROUP):
+        self.group = group
+        self._backends = dict()
+        self._resolved = dict()
+        self._entry_points_loaded = False
+        for alias, backend in (backends or {}).items():
+            self.register(alias, backend)
+
+    def __contains__(self, alias):
+        return isinstance(alias, str) and alias.lower() in self._backends
+
+    def register(self, alias, backend):
+        """
+        注册backend的别名，已有的别名会被覆盖
+        :alias - str, 别名
+        :backend - type or str, backend的class或者"module:Class"格式的路径
+        """
+        if not isinstance(alias, str) or not alias:
+            raise ValueError("`alias` must be a non-empty str, alias=%s" % str(alias))
+        if not (isinstance(backend, (str, type))):
+            raise ValueError("`backend` must be a class or a dotted path, backend=%s" % str(backend))
+        alias = alias.lower()
+        self._backends[alias] = backend
+        self._resolved.pop(alias, None)
+
+    def unregister(self, alias):
+        alias = alias.lower()
+        self._backends.pop(alias, None)
+        self._resolved.pop(alias, None)
+
+    def load_entry_points(self, reload=False):
+        """
+        从已安装的包中加载ENTRY_POINT_GROUP中的backend，不覆盖已经注册的别名
+        """
+        if self._entry_points_loaded and not reload:
+            return
+        self._entry_points_loaded = True
+        for name, value in iter_entry_points(self.group):
+            if name.lower() not in self._backends:
+                self._backends[name.lower()] = value
+
+    def aliases(self):
+        self.load_entry_points()
+        return sorted(self._backends.keys())
+
+    def resolve(self, name):
+        """
+        根据别名或者完整的module.Class路径获取backend的class
+        """
+        key = name.lower()
+        found = self._resolved.get(key)
+        if found is not None:
+            return found
+        if key not in self._backends:
+            self.load_entry_points()
+        backend = self._backends.get(key, name)
+        try:
+            found = import_path(backend) if isinstance(backend, str) else backend
+        except (ImportError, AttributeError, ValueError):
+            raise ValueError('Cannot resolve cache_backend type %s' % name)
+        self._resolved[key] = found
+        return found
+
+
+registry = BackendRegistry(BUILTIN_BACKENDS)
+
+
+def register_backend(alias, backend):
+    """
+    注册backend的别名，注册后可以使用AsyncCacheManager(app, cache_backend=alias)创建
+    @See BackendRegistry.register
+    """
+    registry.register(alias, backend)
@@ -0,0 +1,279 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import json
+import pickle
+import time
+import zlib
+
+# 序列化后的value第一个byte为header，格式为0b101F_CCCC，F为压缩标记，CCCC为codec编号
+# 压缩后header之后的第一个byte为压缩算法编号，之后为压缩后的数据
+# 0xA0-0xBF是UTF-8的后续字节，不会出现在合法UTF-8文本的开头，未序列化的旧数据可以被区分出来
+HEADER_MASK = 0xE0
+HEADER_MARK = 0xA0
+FLAG_COMPRESSED = 0x10
+CODEC_MASK = 0x0F
+
+# pickle protocol 5需要python 3.8
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+
+
+class Codec(object):
+    """
+    value的编码方式，codec_id写入header，用于读取时选择解码方式
+    """
+
+    def __init__(self, name, codec_id, dumps, loads):
+        self.name = name
+        self.codec_id = codec_id
+        self.dumps = dumps
+        self.loads = loads
+
+
+def _json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data):
+    return json.loads(bytes(data).decode("utf-8"))
+
+
+CODEC_BYTES = Codec("bytes", 0, bytes, bytes)
+CODEC_STR = Codec("str", 1, lambda value: value.encode("utf-8"), lambda data: bytes(data).decode("utf-8"))
+CODEC_PICKLE = Codec("pickle", 2,
+                     lambda value: pickle.dumps(value, protocol=PICKLE_PROTOCOL),
+                     pickle.loads)
+CODEC_JSON = Codec("json", 3, _json_dumps, _json_loads)
+
+CODECS = {codec.name: codec for codec in [CODEC_BYTES, CODEC_STR, CODEC_PICKLE, CODEC_JSON]}
+
+# 可选的codec，安装后才可以使用
+try:
+    import msgpack
+
+    CODECS["msgpack"] = Codec("msgpack", 4,
+                              lambda value: msgpack.packb(value, use_bin_type=True),
+                              lambda data: msgpack.unpackb(data, raw=False))
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+
+    CODECS["orjson"] = Codec("orjson", 5, orjson.dumps, orjson.loads)
+except ImportError:
+    orjson = None
+
+# codec编号和名称的对应关系是存储格式的一部分，不能修改
+CODEC_NAMES = {0: "bytes", 1: "str", 2: "pickle", 3: "json", 4: "msgpack", 5: "orjson"}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+COMPRESSOR_ZLIB = Codec("zlib", 0, zlib.compress, zlib.decompress)
+
+COMPRESSORS = {COMPRESSOR_ZLIB.name: COMPRESSOR_ZLIB}
+
+# 可选的压缩算法，安装后才可以使用
+try:
+    import lz4.frame
+
+    COMPRESSORS["lz4"] = Codec("lz4", 1, lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+
+    COMPRESSORS["zstd"] = Codec("zstd", 2,
+                                lambda data: zstandard.ZstdCompressor().compress(data),
+                                lambda data: zstandard.ZstdDecompressor().decompress(data))
+except ImportError:
+    zstandard = None
+
+# 压缩算法编号和名称的对应关系是存储格式的一部分，不能修改
+COMPRESSOR_NAMES = {0: "zlib", 1: "lz4", 2: "zstd"}
+COMPRESSORS_BY_ID = {compressor.codec_id: compressor for compressor in COMPRESSORS.values()}
+
+
+def resolve_compressor(compressor):
+    """
+    根据名称获取压缩算法，"auto"按lz4, zstd, zlib的顺序选择已安装的算法
+    """
+    if not isinstance(compressor, str) or compressor.lower() not in list(COMPRESSOR_NAMES.values()) + ["auto"]:
+        raise ValueError("Unknown compressor %s, supports %s"
+                         % (str(compressor), list(COMPRESSOR_NAMES.values()) + ["auto"]))
+    if compressor.lower() == "auto":
+        for name in ["lz4", "zstd", "zlib"]:
+            if name in COMPRESSORS:
+                return COMPRESSORS[name]
+    if compressor.lower() not in COMPRESSORS:
+        raise ValueError("Compressor %s is not installed" % compressor)
+    return COMPRESSORS[compressor.lower()]
+
+
+class Serializer(object):
+    """
+    value的序列化，str和bytes使用自身编码，其他类型使用指定的codec，
+    每个value的第一个byte记录使用的codec，读取时按header解码，更换codec后旧的value仍然可以读取
+    设置compress_min_bytes后，序列化后超过该大小的value被压缩，压缩后没有变小时不压缩
+    """
+
+    def __init__(self, codec="pickle", compress_min_bytes=None, compressor="zlib"):
+        """
+        __init__构造函数，使用参数创建一个Serializer实例对象，并返回
+            codec - str default="pickle", 可选值"pickle", "json"，安装后可以使用"msgpack", "orjson"
+            compress_min_bytes - int default=None, 压缩的最小字节数，None表示不压缩
+            compressor - str default="zlib", 压缩算法，安装后可以使用"lz4", "zstd"，"auto"选择最快的已安装算法
+        """
+        if not isinstance(codec, str) or codec.lower() not in CODEC_NAMES.values():
+            raise ValueError("Unknown serializer %s, supports %s" % (str(codec), list(CODEC_NAMES.values())))
+        if codec.lower() not in CODECS:
+            raise ValueError("Serializer %s is not installed" % codec)
+        if compress_min_bytes is not None and compress_min_bytes < 0:
+            raise ValueError("`compress_min_bytes` must be >= 0, compress_min_bytes=%s" % str(compress_min_bytes))
+        self.codec = CODECS[codec.lower()]
+        self.compress_min_bytes = compress_min_bytes
+        self.compressor = resolve_compressor(compressor)
+        # metrics
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompressed = 0
+        self.decompress_time = 0.0
+
+    def dumps(self, value):
+        """
+        序列化value，返回带header的bytes
+        """
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            codec = CODEC_BYTES
+        elif isinstance(value, str):
+            codec = CODEC_STR
+        else:
+            codec = self.codec
+        payload = codec.dumps(value)
+        if self.compress_min_bytes is not None and len(payload) >= self.compress_min_bytes:
+            start = time.thread_time()
+            compressed = self.compressor.dumps(payload)
+            self.compress_time += time.thread_time() - start
+            # 压缩后增加了一个byte的算法编号
+            if len(compressed) + 1 < len(payload):
+                self.compressed += 1
+                self.bytes_in += len(payload)
+                self.bytes_out += len(compressed) + 1
+                return bytes((HEADER_MARK | FLAG_COMPRESSED | codec.codec_id, self.compressor.codec_id)) + compressed
+            self.skipped += 1
+        return bytes((HEADER_MARK | codec.codec_id,)) + payload
+
+    def loads(self, data):
+        """
+        反序列化value，没有header的数据是序列化之前写入的旧数据，bytes按UTF-8解码为str，无法解码时原样返回，
+        以0xA0-0xBF开头但header中的codec或压缩算法编号未定义的旧二进制数据同样作为旧数据返回，
+        header有效时按header解码，codec未安装或数据无法解码时抛出异常
+        """
+        if data is None or isinstance(data, str):
+            return data
+        if not self.is_framed(data):
+            return self.loads_raw(data)
+        return self.loads_framed(data)
+
+    @staticmethod
+    def is_framed(data):
+        """
+        data是否以有效的header开头，header中的codec编号和压缩算法编号必须已定义
+        """
+        if len(data) == 0 or data[0] & HEADER_MASK != HEADER_MARK:
+            return False
+        if data[0] & CODEC_MASK not in CODEC_NAMES:
+            return False
+        if data[0] & FLAG_COMPRESSED:
+            return len(data) > 1 and data[1] in COMPRESSOR_NAMES
+        return True
+
+    def loads_framed(self, data):
+        """
+        按header反序列化value，codec或压缩算法未安装、数据无法解码时抛出异常
+        """
+        header = data[0]
+        codec = CODECS_BY_ID.get(header & CODEC_MASK)
+        if codec is None:
+            raise ValueError("Serializer %s is not installed, header=0x%02x"
+                             % (CODEC_NAMES[header & CODEC_MASK], header))
+        if header & FLAG_COMPRESSED:
+            compressor = COMPRESSORS_BY_ID.get(data[1])
+            if compressor is None:
+                raise ValueError("Compressor %s is not installed" % COMPRESSOR_NAMES[data[1]])
+            start = time.thread_time()
+            payload = compressor.loads(memoryview(data)[2:])
+            self.decompress_time += time.thread_time() - start
+            self.decompressed += 1
+            return codec.loads(payload)
+        return codec.loads(memoryview(data)[1:])
+
+    @staticmethod
+    def loads_raw(data):
+        """
+        没有header的旧数据，bytes按UTF-8解码为str，无法解码时原样返回
+        """
+        try:
+            return bytes(data).decode("utf-8")
+        except UnicodeDecodeError:
+            return data
+
+    def get_stats(self):
+        """
+        获取压缩的统计信息，ratio为压缩前后的大小之比，时间为time.thread_time测量的当前线程的CPU时间，
+        不受event loop中其他任务的影响，以微秒为单位，avg_compress_us包含压缩后没有变小而放弃压缩的value
+        """
+        attempts = self.compressed + self.skipped
+        return {
+            "compress_min_bytes": self.compress_min_bytes,
+            "compressor": self.compressor.name,
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.bytes_in / self.bytes_out if self.bytes_out else 0.0,
+            "avg_compress_us": self.compress_time * 1000000 / attempts if attempts else 0.0,
+            "decompressed": self.decompressed,
+            "avg_decompress_us": self.decompress_time * 1000000 / self.decompressed if self.decompressed else 0.0,
+        }
+
+    def reset_stats(self):
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompressed = 0
+        self.decompress_time = 0.0
+
+
+def create_serializer(serializer, compress_min_bytes=None, compressor="zlib"):
+    """
+    根据CACHE_SERIALIZER创建Serializer，None表示不序列化，也可以直接传入Serializer实例
+    压缩的是序列化后的数据，设置CACHE_COMPRESS_MIN_BYTES时必须同时设置CACHE_SERIALIZER
+    """
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer is None:
+        if compress_min_bytes is not None:
+            raise ValueError("`CACHE_COMPRESS_MIN_BYTES` requires `CACHE_SERIALIZER`, compress_min_bytes=%s"
+                             % str(compress_min_bytes))
+        return None
+    return Serializer(serializer, compress_min_bytes=compress_min_bytes, compressor=compressor)
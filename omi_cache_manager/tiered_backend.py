@@ -0,0 +1,348 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import asyncio
+
+from .async_cache_manager import CacheBackend, make_mapping, parse_many_keys, resolve_backend
+from .backends import SimpleCacheBackend, key_option
+
+
+class TieredCacheBackend(CacheBackend):
+    def __init__(self, config=None):
+        """
+        __init__构造函数，使用参数创建一个TieredCacheBackend实例对象，并返回
+        两级缓存，L1为进程内有容量限制的SimpleCacheBackend，L2为任意的CacheBackend，例如ARedisBackend
+        读取时L1未命中则读取L2并回填L1，写入和删除时先操作L2，再写入或失效L1
+        回填L1的有效期不超过key在L2中剩余的有效期，L2中过期的key不会继续从L1读取
+        注意：L1只能感知当前进程的写入，其他进程的覆盖或删除最长在CACHE_TIERED_L1_TTL后可见
+            config - Backend配置相关的Dict，必须通过CACHE_TIERED_BACKEND指定L2的backend，
+                L2使用同一个config创建
+        """
+        super().__init__()
+
+        if not (config is None or isinstance(config, dict)):
+            raise ValueError("`config` must be an instance of dict or None")
+        if config is None or not config.get('CACHE_TIERED_BACKEND', None):
+            raise ValueError("`CACHE_TIERED_BACKEND` is required for TieredCacheBackend")
+        self.config = config
+        # L1配置
+        self.l1_ttl = config.get('CACHE_TIERED_L1_TTL', 5)
+        self.l1_max_entries = config.get('CACHE_TIERED_L1_MAX_ENTRIES', 10000)
+        self.l1_eviction_policy = config.get('CACHE_TIERED_L1_EVICTION_POLICY', 'lru')
+        # L2
+        self.l2 = resolve_backend(config.get('CACHE_TIERED_BACKEND'), config)
+        self.key_prefix = getattr(self.l2, "key_prefix", str(self.__class__.__name__).upper())
+        # scan_keys遍历L2，返回的key由L2的key_builder生成
+        self.key_builder = getattr(self.l2, "key_builder", None)
+        self.l1 = SimpleCacheBackend(config={
+            "CACHE_KEY_PREFIX": self.key_prefix,
+            "CACHE_MAX_ENTRIES": self.l1_max_entries,
+            "CACHE_EVICTION_POLICY": self.l1_eviction_policy,
+        })
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+    def get_cache_context(self):
+        """
+        Implement function from CacheBackendContext interface, 返回L2的context
+        @See CacheBackendContext.get_cache_context
+        """
+        return self.l2.get_cache_context()
+
+    def create_cache_context(self):
+        """
+        Implement function from CacheBackendContext interface
+        @See CacheBackendContext.create_cache_context
+        """
+        self.l1.create_cache_context()
+        self.l2.create_cache_context()
+
+    async def destroy_cache_context(self):
+        """
+        Implement function from CacheBackendContext interface
+        @See CacheBackendContext.destroy_cache_context
+        """
+        await self.l1.destroy_cache_context()
+        return await self.l2.destroy_cache_context()
+
+    async def warm_up(self, size=None):
+        """
+        预热L2的连接，L2不支持warm_up时返回None
+        @See ARedisBackend.warm_up
+        """
+        warm_up = getattr(self.l2, "warm_up", None)
+        if warm_up is None:
+            return None
+        return await warm_up(size)
+
+    def can_store_objects(self):
+        """
+        L1保存对象的引用，是否可以保存python对象取决于L2
+        @See CacheBackend.can_store_objects
+        """
+        return self.l2.can_store_objects()
+
+    def make_l1_ttl(self, expire=None, pexpire=None):
+        """
+        L1的有效期，以毫秒为单位，不超过写入L2时指定的有效期
+        """
+        l1_pexpire = int(self.l1_ttl * 1000)
+        ttl = SimpleCacheBackend.make_ttl(expire, pexpire)
+        if ttl is not None:
+            l1_pexpire = min(l1_pexpire, max(int(ttl * 1000), 1))
+        return l1_pexpire
+
+    async def l2_pttl(self, key):
+        """
+        获取key在L2中剩余的有效期，以毫秒为单位，key不存在返回-2，没有设置有效期返回-1，与Redis的`PTTL`命令保持一致
+        """
+        ttl = getattr(self.l2, "ttl", None)
+        if ttl is not None:
+            remaining = await ttl(key)
+            return remaining if remaining < 0 else int(remaining * 1000)
+        pttl = await self.l2.execute("PTTL", key)
+        return pttl if isinstance(pttl, int) else -1
+
+    def cap_l1_ttl(self, pttl):
+        """
+        回填L1的有效期，以毫秒为单位，不超过key在L2中剩余的有效期，key在L2中已经不存在时返回None，不回填L1
+        :pttl - int, l2_pttl的结果
+        """
+        l1_pexpire = int(self.l1_ttl * 1000)
+        if pttl == -1:
+            return l1_pexpire
+        if pttl <= 0:
+            return None
+        return min(l1_pexpire, pttl)
+
+    @staticmethod
+    def parse_set_args(args, kwargs):
+        """
+        解析set方法的参数，返回(key, value)
+        """
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        if len(args) == 0 and len(filter_kv) == 1:
+            return list(filter_kv.items())[0]
+        elif len(args) == 1 and isinstance(args[0], tuple):
+            return args[0]
+        elif len(args) == 2:
+            return args[0], args[1]
+        raise TypeError("Invalid arguments to set, args = %s kwargs= %s" % (str(args), str({**kwargs})))
+
+    async def invalidate(self, *keys):
+        """
+        从L1中删除key，不影响L2
+        """
+        if len(keys) > 0:
+            await self.l1.delete_many(*keys)
+        return True
+
+    async def get(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        L1未命中时同时读取L2的value和剩余有效期，回填L1的有效期不超过L2中剩余的有效期
+        @See CacheBackend.get
+        """
+        value = await self.l1.get(*args, **kwargs)
+        if value is not None:
+            self.l1_hits += 1
+            return value
+        key = args[0] if len(args) > 0 else kwargs["key"]
+        value, pttl = await asyncio.gather(self.l2.get(*args, **kwargs), self.l2_pttl(key))
+        if value is None:
+            self.misses += 1
+            return None
+        self.l2_hits += 1
+        l1_pexpire = self.cap_l1_ttl(pttl)
+        if l1_pexpire is not None:
+            await self.l1.set(key, value, pexpire=l1_pexpire)
+        return value
+
+    async def set(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        @See CacheBackend.set
+        """
+        key, value = self.parse_set_args(args, kwargs)
+        result = await self.l2.set(*args, **kwargs)
+        if result and kwargs.get("exist", None) is None:
+            await self.l1.set(key, value,
+                              pexpire=self.make_l1_ttl(kwargs.get("expire", None), kwargs.get("pexpire", None)))
+        else:
+            # 条件写入的结果未知，直接失效L1
+            await self.invalidate(key)
+        return result
+
+    async def add(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        @See CacheBackend.add
+        """
+        kwargs["exist"] = "SET_IF_NOT_EXIST"
+        return await self.set(*args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        L2删除失败时同样失效L1
+        @See CacheBackend.delete
+        """
+        try:
+            return await self.l2.delete(*args, **kwargs)
+        finally:
+            await self.invalidate(args[0] if len(args) > 0 else kwargs["key"])
+
+    async def delete_many(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        L2删除失败时同样失效L1
+        @See CacheBackend.delete_many
+        """
+        try:
+            return await self.l2.delete_many(*args, **kwargs)
+        finally:
+            await self.invalidate(*args)
+
+    async def get_many(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        @See CacheBackend.get_many
+        """
+        keys = parse_many_keys(args)
+        if keys is not None:
+            return await self.get_mapping(keys, kwargs)
+        results = await self.l1.get_many(*args, **kwargs)
+        missing = [i for i, value in enumerate(results) if value is None]
+        self.l1_hits += len(args) - len(missing)
+        if len(missing) == 0:
+            return results
+        values, pttls = await asyncio.gather(self.l2.get_many(*[args[i] for i in missing]),
+                                             asyncio.gather(*[self.l2_pttl(args[i]) for i in missing]))
+        if values is None:
+            values = [None] * len(missing)
+        for i, value, pttl in zip(missing, values, pttls):
+            if value is None:
+                self.misses += 1
+                continue
+            self.l2_hits += 1
+            results[i] = value
+            l1_pexpire = self.cap_l1_ttl(pttl)
+            if l1_pexpire is not None:
+                await self.l1.set(args[i], value, pexpire=l1_pexpire)
+        return results
+
+    async def get_mapping(self, keys, kwargs):
+        """
+        使用key的list调用get_many，L1未命中的key使用一次get_many从L2读取，并使用一次set_many回填L1
+        @See TieredCacheBackend.get_many
+        """
+        found = await self.l1.get_many(keys)
+        self.l1_hits += len(found)
+        missing = [key for key in keys if key not in found]
+        if len(missing) > 0:
+            loaded, pttls = await asyncio.gather(self.l2.get_many(missing),
+                                                 asyncio.gather(*[self.l2_pttl(key) for key in missing]))
+            self.l2_hits += len(loaded)
+            self.misses += len(missing) - len(loaded)
+            if len(loaded) > 0:
+                found.update(loaded)
+                l1_pexpire = {key: self.cap_l1_ttl(pttl) for key, pttl in zip(missing, pttls)}
+                fill = [(key, value) for key, value in loaded.items() if l1_pexpire[key] is not None]
+                if len(fill) > 0:
+                    await self.l1.set_many(*fill, pexpire={key: l1_pexpire[key] for key, _ in fill})
+        return make_mapping(keys, [found.get(key) for key in keys], kwargs)
+
+    async def set_many(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        @See CacheBackend.set_many
+        """
+        result = await self.l2.set_many(*args, **kwargs)
+        filter_kv = {k: v for k, v in kwargs.items() if k not in ["expire", "pexpire", "exist"]}
+        kv2update = {**dict(args), **filter_kv}
+        if result and kwargs.get("exist", None) is None:
+            expire = kwargs.get("expire", None)
+            pexpire = kwargs.get("pexpire", None)
+            if isinstance(expire, dict) or isinstance(pexpire, dict):
+                # 按key分别指定的有效期
+                l1_pexpire = {key: self.make_l1_ttl(key_option(expire, key), key_option(pexpire, key))
+                              for key in kv2update.keys()}
+            else:
+                l1_pexpire = self.make_l1_ttl(expire, pexpire)
+            await self.l1.set_many(*kv2update.items(), pexpire=l1_pexpire)
+        else:
+            await self.invalidate(*kv2update.keys())
+        return result
+
+    async def execute(self, *args, **kwargs):
+        """
+        Implement function from CacheBackend interface
+        GET/MGET/SET/MSET/DEL使用两级缓存，其他命令直接在L2执行，并失效L1中对应的key
+        @See CacheBackend.execute
+        """
+        if len(args) > 0:
+            cmd = args[0]
+            args_ex_cmd = args[1:]
+        else:
+            raise TypeError("Execute command can not empty")
+
+        cmd = str.lower(cmd)
+        if cmd == "get":
+            return await self.get(*args_ex_cmd, **kwargs)
+        elif cmd == "mget":
+            return await self.get_many(*args_ex_cmd, **kwargs)
+        elif cmd == "set":
+            return await self.set(*args_ex_cmd, **kwargs)
+        elif cmd == "mset":
+            return await self.set_many(*args_ex_cmd, **kwargs)
+        elif cmd == "del":
+            return await self.delete(*args_ex_cmd, **kwargs)
+        result = await self.l2.execute(*args, **kwargs)
+        if len(args_ex_cmd) > 0:
+            await self.invalidate(args_ex_cmd[0])
+        return result
+
+    async def scan_keys(self, batch_size=None):
+        """
+        遍历L2中的key
+        @See ARedisBackend.scan_keys
+        """
+        return await self.l2.scan_keys(batch_size=batch_size)
+
+    async def clear(self):
+        """
+        Implement function from CacheBackend interface
+        @See CacheBackend.clear
+        """
+        result, _ = await asyncio.gather(self.l2.clear(), self.l1.clear())
+        return result
+
+    def get_stats(self):
+        """
+        获取L1和L2分别的命中率，l2_hit_ratio为L1未命中的请求中L2命中的比例
+        """
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        l2_lookups = self.l2_hits + self.misses
+        return {
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "l1_hit_ratio": self.l1_hits / lookups if lookups else 0.0,
+            "l2_hit_ratio": self.l2_hits / l2_lookups if l2_lookups else 0.0,
+            "l1": self.l1.get_stats(),
+        }
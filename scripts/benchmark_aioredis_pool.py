@@ -0,0 +1,86 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+# AIORedisBackend每次get的延迟对比，每个操作后关闭连接池 vs 长期持有连接池
+# usage: python scripts/benchmark_aioredis_pool.py [redis_host] [ops]
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from omi_cache_manager.aio_redis_backend import AIORedisBackend, AIORedisContextPool
+
+
+class TeardownContextPool(AIORedisContextPool):
+    """
+    旧的行为，每个操作结束后关闭连接池，下一个操作重新建立连接
+    """
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.destroy()
+
+
+def make_backend(host, teardown):
+    backend = AIORedisBackend(config={
+        "CACHE_REDIS_HOST": host,
+        "CACHE_REDIS_PORT": 6379,
+        "CACHE_REDIS_DATABASE": 8,
+        "CACHE_KEY_PREFIX": "BENCH_AIOREDIS_POOL:",
+    })
+    if teardown:
+        backend._redis_cache_context = TeardownContextPool(
+            redis_uri=backend.redis_uri,
+            timeout=backend.connection_timeout,
+            encoding=backend.encoding,
+            minsize=backend.pool_minsize,
+            maxsize=backend.pool_maxsize
+        )
+    return backend
+
+
+def percentile(samples, pct):
+    index = min(int(len(samples) * pct / 100), len(samples) - 1)
+    return samples[index]
+
+
+async def run(backend, ops):
+    await backend.set("foo", "bar")
+    samples = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        await backend.get("foo")
+        samples.append((time.perf_counter() - start) * 1000000)
+    await backend.delete("foo")
+    await backend.destroy_cache_context()
+    return sorted(samples)
+
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else "localhost"
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    loop = asyncio.get_event_loop()
+    for mode, teardown in [("teardown", True), ("persistent", False)]:
+        samples = loop.run_until_complete(run(make_backend(host, teardown), ops))
+        print("%-12s p50 %8.1f us  p99 %8.1f us  mean %8.1f us" % (
+            mode, percentile(samples, 50), percentile(samples, 99), sum(samples) / len(samples)))
+
+
+if __name__ == '__main__':
+    main()
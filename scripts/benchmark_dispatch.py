@@ -0,0 +1,62 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+# AsyncCacheManager代理方法的开销，manager.get/set_many vs 直接调用NullCacheBackend的get/set_many，
+# raw_manager没有开启CACHE_UNWRAP_VALUES，get直接使用backend的get
+# usage: python scripts/benchmark_dispatch.py [ops]
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from omi_cache_manager.async_cache_manager import AsyncCacheManager
+
+
+async def run(func, ops, *args):
+    start = time.perf_counter()
+    for _ in range(ops):
+        await func(*args)
+    return (time.perf_counter() - start) * 1000000000 / ops
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    loop = asyncio.get_event_loop()
+    manager = AsyncCacheManager(None, cache_backend="null_cache", config={})
+    backend = manager.cache_backend
+    raw_manager = AsyncCacheManager(None, cache_backend=backend, config={"CACHE_UNWRAP_VALUES": False})
+    cases = [
+        ("backend.get", backend.get, ("foo",)),
+        ("manager.get", manager.get, ("foo",)),
+        ("raw_manager.get", raw_manager.get, ("foo",)),
+        ("async_method_call", manager.async_method_call, (backend.get, "foo")),
+        ("backend.set_many", backend.set_many, (("foo", "bar"),)),
+        ("manager.set_many", manager.set_many, (("foo", "bar"),)),
+    ]
+    # 预热
+    for _, func, args in cases:
+        loop.run_until_complete(run(func, ops // 10, *args))
+    for name, func, args in cases:
+        cost = loop.run_until_complete(run(func, ops, *args))
+        print("%-18s %8.0f ns/op" % (name, cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+# 使用`python -X importtime`测量`import omi_cache_manager`的耗时，并检查没有加载Redis客户端和pydantic
+# 加载了这些模块或者耗时中位数超过max_ms时返回1
+# usage: python scripts/benchmark_import_time.py [runs] [max_ms]
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ["aredis", "aioredis", "pydantic"]
+
+
+def import_time(statement):
+    """
+    在新的进程中执行statement，返回{module: 累计耗时(微秒)}
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure(statement, runs):
+    samples = []
+    modules = {}
+    for _ in range(runs):
+        modules = import_time(statement)
+        samples.append(modules.get("omi_cache_manager", 0) / 1000)
+    return statistics.median(samples), modules
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    max_ms = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    median, modules = measure("import omi_cache_manager", runs)
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    print("%-40s %10.2f ms  heavy modules: %s" % ("import omi_cache_manager", median, heavy or "none"))
+    for statement in ["import omi_cache_manager.aredis_backend", "import omi_cache_manager.aio_redis_backend"]:
+        try:
+            backend_median, _ = measure(statement, runs)
+        except subprocess.CalledProcessError:
+            print("%-40s %13s" % (statement, "unavailable"))
+            continue
+        print("%-40s %10.2f ms" % (statement, backend_median))
+    if heavy or (max_ms is not None and median > max_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+# 各codec在常见value上的序列化/反序列化耗时（微秒）和序列化后的大小，以及各压缩算法的压缩比和耗时，未安装的codec跳过
+# usage: python scripts/benchmark_serializers.py [ops]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from omi_cache_manager.serializers import CODECS, COMPRESSORS, Serializer
+
+VALUES = {
+    "int": 1234567,
+    "short_str": "session:7f3a9c",
+    "small_dict": {"id": 42, "name": "foo", "active": True, "score": 3.5},
+    "list_100": list(range(100)),
+    "user_rows": [{"id": i, "name": "user%d" % i, "email": "user%d@example.com" % i, "tags": ["a", "b"]}
+                  for i in range(50)],
+    "large_dict": {"key%d" % i: {"value": "x" * 20, "index": i} for i in range(1000)},
+}
+
+
+def measure(serializer, value, ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        data = serializer.dumps(value)
+    encode = (time.perf_counter() - start) * 1000000 / ops
+    start = time.perf_counter()
+    for _ in range(ops):
+        serializer.loads(data)
+    decode = (time.perf_counter() - start) * 1000000 / ops
+    return encode, decode, len(data)
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    codecs = [name for name in ["pickle", "json", "msgpack", "orjson"] if name in CODECS]
+    print("%-12s %-8s %12s %12s %10s" % ("value", "codec", "encode(us)", "decode(us)", "bytes"))
+    for shape, value in VALUES.items():
+        # 大的value减少循环次数
+        shape_ops = max(ops // 100, 10) if shape == "large_dict" else ops
+        for codec in codecs:
+            encode, decode, size = measure(Serializer(codec), value, shape_ops)
+            print("%-12s %-8s %12.2f %12.2f %10d" % (shape, codec, encode, decode, size))
+    print()
+    print("%-12s %-8s %12s %12s %10s" % ("value", "compress", "encode(us)", "decode(us)", "ratio"))
+    for shape in ["user_rows", "large_dict"]:
+        value = VALUES[shape]
+        shape_ops = max(ops // 100, 10) if shape == "large_dict" else ops
+        raw_size = len(Serializer("json").dumps(value))
+        for compressor in COMPRESSORS:
+            encode, decode, size = measure(Serializer("json", compress_min_bytes=0, compressor=compressor),
+                                           value, shape_ops)
+            print("%-12s %-8s %12.2f %12.2f %10.2f" % (shape, compressor, encode, decode, raw_size / size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+# SimpleCacheBackend的ops/sec对比，executor线程池执行 vs event loop线程内联执行
+# usage: python scripts/benchmark_simple_backend.py [ops]
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from omi_cache_manager._decorators import async_method_in_loop, async_method_inline
+from omi_cache_manager.backends import SimpleCacheBackend
+
+
+def make_backend(decorator):
+    """
+    使用指定的decorator重新包装SimpleCacheBackend的get/set方法
+    """
+    backend = SimpleCacheBackend(config={"CACHE_KEY_PREFIX": "BENCH:"})
+    for name in ["get", "set"]:
+        raw = getattr(SimpleCacheBackend, name).__wrapped__
+        setattr(backend, name, decorator(raw).__get__(backend, SimpleCacheBackend))
+    return backend
+
+
+async def run(backend, ops):
+    await backend.set("foo", "bar")
+    start = time.perf_counter()
+    for i in range(ops):
+        await backend.set("foo", i)
+        await backend.get("foo")
+    elapsed = time.perf_counter() - start
+    return ops * 2 / elapsed
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    loop = asyncio.get_event_loop()
+    for mode, decorator in [("executor", async_method_in_loop), ("inline", async_method_inline)]:
+        rate = loop.run_until_complete(run(make_backend(decorator), ops))
+        print("%-10s %12.0f ops/sec" % (mode, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,5 +21,14 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     platforms="any",
-    install_requires=["pydantic"]
+    install_requires=["pydantic"],
+    entry_points={
+        "omi_cache_manager.backends": [
+            "null_cache = omi_cache_manager.backends:NullCacheBackend",
+            "simple_cache = omi_cache_manager.backends:SimpleCacheBackend",
+            "aioredis = omi_cache_manager.aio_redis_backend:AIORedisBackend",
+            "aredis = omi_cache_manager.aredis_backend:ARedisBackend",
+            "tiered_cache = omi_cache_manager.tiered_backend:TieredCacheBackend",
+        ]
+    }
 )
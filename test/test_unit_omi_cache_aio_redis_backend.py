@@ -177,7 +177,8 @@ async def test_backend_set_redis(event_loop):
     assert val is True
     val = await get_cache().get("redis")
     assert val == "redis"  # this key exsit
-    time.sleep(1)
+    # 连接池常驻后get不再重新建立连接，留出余量避免恰好在过期边界读取
+    time.sleep(1.5)
     val = await get_cache().get("redis")
     assert val is None  # this key is gone
     val = await get_cache().set("redis", "redis", pexpire=5)  # set a very short expire in millseconds
@@ -459,5 +460,110 @@ async def test_backend_clear(event_loop):
     assert val == [None]
 
 
+@pytest.mark.asyncio
+async def test_backend_clear_keys(event_loop):
+    val = await get_cache().set_many(*[("clear_key%d" % i, i) for i in range(250)])
+    assert val is True
+    progress = []
+    stats = await get_cache().clear_keys(batch_size=40, concurrency=3, progress=progress.append)
+    assert stats["deleted"] == 250
+    assert stats["scanned"] >= 250
+    assert stats["batches"] >= 7
+    assert len(progress) == stats["batches"]
+    assert progress[-1]["deleted"] == 250
+    assert get_cache().last_clear_stats == stats
+    val = await get_cache().get_many("clear_key0", "clear_key249")
+    assert val == [None, None]
+    stats = await get_cache().clear_keys()
+    assert stats["deleted"] == 0
+    assert stats["batches"] == 0
+    try:
+        await get_cache().clear_keys(batch_size=-1)
+    except Exception as ex:
+        assert isinstance(ex, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_backend_set_many_pipelined(event_loop):
+    get_cache().pipeline_chunk_size = 2
+    try:
+        await get_cache().delete_many("pipe1", "pipe2", "pipe3")
+        val = await get_cache().set_many(("pipe1", "v1"), ("pipe2", "v2"), ("pipe3", "v3"),
+                                         expire={"pipe1": 10}, pexpire={"pipe2": 5000})
+        assert val == {"pipe1": True, "pipe2": True, "pipe3": True}
+        val = await get_cache().execute("TTL", "pipe1")
+        assert 0 < val <= 10
+        val = await get_cache().execute("PTTL", "pipe2")
+        assert 0 < val <= 5000
+        val = await get_cache().execute("TTL", "pipe3")
+        assert val == -1
+        val = await get_cache().set_many(("pipe1", "x1"), ("pipe4", "x4"), pexpire=5000, exist="SET_IF_NOT_EXIST")
+        assert val == {"pipe1": False, "pipe4": True}
+        val = await get_cache().set_many(pipe2="y2", pipe5="y5", exist={"pipe2": "SET_IF_EXIST", "pipe5": "SET_IF_EXIST"})
+        assert val == {"pipe2": True, "pipe5": False}
+        val = await get_cache().get_many("pipe1", "pipe2", "pipe4", "pipe5")
+        assert val == ["v1", "y2", "x4", None]
+    finally:
+        get_cache().pipeline_chunk_size = 1000
+        await get_cache().delete_many("pipe1", "pipe2", "pipe3", "pipe4")
+
+
+@pytest.mark.asyncio
+async def test_backend_serializer(event_loop):
+    await get_cache().set("legacy", "legacy")
+    for codec in ["pickle", "json"]:
+        backend = AIORedisBackend(
+            config={
+                "CACHE_REDIS_HOST": "192.168.201.169",
+                "CACHE_REDIS_PORT": 6379,
+                "CACHE_REDIS_DATABASE": 8,
+                "CACHE_SERIALIZER": codec,
+                "CACHE_KEY_PREFIX": get_cache().key_prefix
+            }
+        )
+        value = {"foo": [1, 2, 3], "bar": {"baz": None}}
+        val = await backend.set("serialized", value)
+        assert val is True
+        val = await backend.get("serialized")
+        assert val == value
+        val = await backend.set_many(("serialized1", [1, "a"]), ("serialized2", 2.5))
+        assert val is True
+        val = await backend.set_many(("serialized3", {"foo": "bar"}), expire=10)
+        assert val == {"serialized3": True}
+        val = await backend.get_many("serialized1", "serialized2", "serialized3", "legacy", "serialized_miss")
+        assert val == [[1, "a"], 2.5, {"foo": "bar"}, "legacy", None]
+        await backend.delete_many("serialized", "serialized1", "serialized2", "serialized3")
+        await backend.destroy_cache_context()
+    await get_cache().delete("legacy")
+
+
+@pytest.mark.asyncio
+async def test_backend_scan_keys(event_loop):
+    await get_cache().set_many(("scan1", "v1"), ("scan2", "v2"))
+    keys = await get_cache().scan_keys(batch_size=2)
+    assert "scan1" in keys
+    assert "scan2" in keys
+    await get_cache().delete_many("scan1", "scan2")
+
+
+@pytest.mark.asyncio
+async def test_backend_get_many_mapping(event_loop):
+    backend = get_cache()
+    assert await backend.set_many(*[("mapping%d" % i, "value%d" % i) for i in range(10)]) is True
+    keys = ["mapping%d" % i for i in range(12)]
+    chunk_size, backend.mget_chunk_size = backend.mget_chunk_size, 3
+    try:
+        # 按3个key一批拆分为4条MGET并发执行
+        val = await backend.get_many(key for key in keys)
+        assert list(val.items()) == [("mapping%d" % i, "value%d" % i) for i in range(10)]
+        val = await backend.get_many(keys, default=None)
+        assert list(val.keys()) == keys
+        assert val["mapping11"] is None
+        assert await backend.get_many(*keys) == ["value%d" % i for i in range(10)] + [None, None]
+    finally:
+        backend.mget_chunk_size = chunk_size
+    assert await backend.get_many([]) == {}
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__)])
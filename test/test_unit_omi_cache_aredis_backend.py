@@ -15,6 +15,8 @@ limitations under the License.
 
 """
 
+import asyncio
+import json
 import os
 import sys
 
@@ -483,5 +485,201 @@ async def test_backend_clear(event_loop):
     assert val == [None]
 
 
+@pytest.mark.asyncio
+async def test_backend_clear_keys(event_loop):
+    val = await get_cache().set_many(*[("clear_key%d" % i, i) for i in range(250)])
+    assert val is True
+    progress = []
+    stats = await get_cache().clear_keys(batch_size=40, concurrency=3, progress=progress.append)
+    assert stats["deleted"] == 250
+    assert stats["scanned"] >= 250
+    assert stats["batches"] >= 7
+    assert len(progress) == stats["batches"]
+    assert progress[-1]["deleted"] == 250
+    assert get_cache().last_clear_stats == stats
+    val = await get_cache().get_many("clear_key0", "clear_key249")
+    assert val == [None, None]
+    stats = await get_cache().clear_keys()
+    assert stats["deleted"] == 0
+    assert stats["batches"] == 0
+    try:
+        await get_cache().clear_keys(batch_size=-1)
+    except Exception as ex:
+        assert isinstance(ex, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_backend_set_many_pipelined(event_loop):
+    get_cache().pipeline_chunk_size = 2
+    try:
+        await get_cache().delete_many("pipe1", "pipe2", "pipe3")
+        val = await get_cache().set_many(("pipe1", "v1"), ("pipe2", "v2"), ("pipe3", "v3"),
+                                         expire={"pipe1": 10}, pexpire={"pipe2": 5000})
+        assert val == {"pipe1": True, "pipe2": True, "pipe3": True}
+        val = await get_cache().execute("TTL", "pipe1")
+        assert 0 < val <= 10
+        val = await get_cache().execute("PTTL", "pipe2")
+        assert 0 < val <= 5000
+        val = await get_cache().execute("TTL", "pipe3")
+        assert val == -1
+        val = await get_cache().set_many(("pipe1", "x1"), ("pipe4", "x4"), pexpire=5000, exist="SET_IF_NOT_EXIST")
+        assert val == {"pipe1": False, "pipe4": True}
+        val = await get_cache().set_many(pipe2="y2", pipe5="y5", exist={"pipe2": "SET_IF_EXIST", "pipe5": "SET_IF_EXIST"})
+        assert val == {"pipe2": True, "pipe5": False}
+        val = await get_cache().get_many("pipe1", "pipe2", "pipe4", "pipe5")
+        assert val == ["v1", "y2", "x4", None]
+    finally:
+        get_cache().pipeline_chunk_size = 1000
+        await get_cache().delete_many("pipe1", "pipe2", "pipe3", "pipe4")
+
+
+def make_shutdown_backend():
+    return ARedisBackend(
+        config={
+            "CACHE_REDIS_HOST": "192.168.201.169",
+            "CACHE_REDIS_PORT": 6379,
+            "CACHE_REDIS_DATABASE": 8,
+            'CACHE_REDIS_USE_POOL': True,
+            'CACHE_REDIS_SHUTDOWN_TIMEOUT': 2,
+            "CACHE_KEY_PREFIX": "A_REDIS_BACKEND_UNIT_TEST_SHUTDOWN:"
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_backend_shutdown_drain(event_loop):
+    backend = make_shutdown_backend()
+    await backend.set("foo", "bar")
+    # BLPOP在0.2秒后超时返回，关闭时等待其完成
+    task = asyncio.ensure_future(backend.execute("BLPOP", "empty_list", 0.2))
+    await asyncio.sleep(0.05)
+    assert backend.get_cache_context().in_flight == 1
+    stats = await backend.destroy_cache_context()
+    assert stats["force_closed"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["drained"] == 1
+    assert 0.1 < stats["elapsed"] < 2
+    assert await task is None
+    assert backend.last_shutdown_stats == stats
+    assert backend.get_cache_context() is None
+
+
+@pytest.mark.asyncio
+async def test_backend_shutdown_force_close(event_loop):
+    backend = make_shutdown_backend()
+    backend.shutdown_timeout = 0.05
+    context = backend.get_cache_context()
+    task = asyncio.ensure_future(backend.execute("BLPOP", "empty_list", 5))
+    await asyncio.sleep(0.05)
+    destroying = asyncio.ensure_future(backend.destroy_cache_context())
+    await asyncio.sleep(0)
+    # 关闭期间不再分配连接
+    try:
+        with context:
+            pass
+    except Exception as ex:
+        assert isinstance(ex, ConnectionError)
+    stats = await destroying
+    assert stats["force_closed"] == 1
+    assert stats["in_flight"] == 1
+    assert stats["elapsed"] < 1
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_backend_serializer(event_loop):
+    await get_cache().set("legacy", "legacy")
+    for codec in ["pickle", "json"]:
+        backend = ARedisBackend(
+            config={
+                "CACHE_REDIS_HOST": "192.168.201.169",
+                "CACHE_REDIS_PORT": 6379,
+                "CACHE_REDIS_DATABASE": 8,
+                "CACHE_SERIALIZER": codec,
+                "CACHE_KEY_PREFIX": get_cache().key_prefix
+            }
+        )
+        value = {"foo": [1, 2, 3], "bar": {"baz": None}}
+        val = await backend.set("serialized", value)
+        assert val is True
+        val = await backend.get("serialized")
+        assert val == value
+        val = await backend.set_many(("serialized1", [1, "a"]), ("serialized2", 2.5))
+        assert val is True
+        val = await backend.set_many(("serialized3", {"foo": "bar"}), expire=10)
+        assert val == {"serialized3": True}
+        val = await backend.get_many("serialized1", "serialized2", "serialized3", "legacy", "serialized_miss")
+        assert val == [[1, "a"], 2.5, {"foo": "bar"}, "legacy", None]
+        await backend.delete_many("serialized", "serialized1", "serialized2", "serialized3")
+        await backend.destroy_cache_context()
+    await get_cache().delete("legacy")
+
+
+@pytest.mark.asyncio
+async def test_backend_compression(event_loop):
+    backend = ARedisBackend(
+        config={
+            "CACHE_REDIS_HOST": "192.168.201.169",
+            "CACHE_REDIS_PORT": 6379,
+            "CACHE_REDIS_DATABASE": 8,
+            "CACHE_SERIALIZER": "json",
+            "CACHE_COMPRESS_MIN_BYTES": 1024,
+            "CACHE_KEY_PREFIX": get_cache().key_prefix
+        }
+    )
+    value = {"rows": [{"id": i, "name": "user%d" % i} for i in range(200)]}
+    val = await backend.set("compressed", value)
+    assert val is True
+    val = await backend.get("compressed")
+    assert val == value
+    val = await backend.execute("STRLEN", "compressed")
+    assert val < len(json.dumps(value)) / 2
+    assert backend.serializer.get_stats()["compressed"] == 1
+    await backend.delete("compressed")
+    await backend.destroy_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_backend_scan_keys(event_loop):
+    await get_cache().set_many(("scan1", "v1"), ("scan2", "v2"))
+    keys = await get_cache().scan_keys(batch_size=2)
+    assert "scan1" in keys
+    assert "scan2" in keys
+    assert all(not key.startswith(get_cache().key_prefix) for key in keys)
+    await get_cache().delete_many("scan1", "scan2")
+    # CACHE_REDIS_HASH_TAG的前缀同样被去掉，返回的key与set使用的key一致
+    backend = ARedisBackend(config={
+        "CACHE_REDIS_HOST": "192.168.201.169",
+        "CACHE_REDIS_DATABASE": 8,
+        "CACHE_REDIS_HASH_TAG": "all",
+        "CACHE_KEY_PREFIX": "A_REDIS_SCAN_TAG:"
+    })
+    await backend.set_many(("scan1", "v1"), ("scan2", "v2"))
+    assert sorted(await backend.scan_keys(batch_size=2)) == ["scan1", "scan2"]
+    await backend.clear()
+    assert await backend.scan_keys() == []
+    await backend.destroy_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_backend_get_many_mapping(event_loop):
+    backend = get_cache()
+    assert await backend.set_many(*[("mapping%d" % i, "value%d" % i) for i in range(10)]) is True
+    keys = ["mapping%d" % i for i in range(12)]
+    chunk_size, backend.mget_chunk_size = backend.mget_chunk_size, 3
+    try:
+        # 按3个key一批拆分为4条MGET并发执行
+        val = await backend.get_many(key for key in keys)
+        assert list(val.items()) == [("mapping%d" % i, "value%d" % i) for i in range(10)]
+        val = await backend.get_many(keys, default=None)
+        assert list(val.keys()) == keys
+        assert val["mapping11"] is None
+        assert await backend.get_many(*keys) == ["value%d" % i for i in range(10)] + [None, None]
+    finally:
+        backend.mget_chunk_size = chunk_size
+    assert await backend.get_many([]) == {}
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__)])
@@ -0,0 +1,191 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import fnmatch
+import os
+import sys
+
+import pytest
+
+sys.path.append("../")
+
+from omi_cache_manager.aredis_backend import ARedisBackend
+from omi_cache_manager.cluster import crc16, group_by_slot, hash_tag, key_hash_slot, tagged
+
+# =======================================
+# install nest_asyncio for unit test when
+# RuntimeError: This event loop is already running
+# pip install nest_asyncio
+import nest_asyncio
+
+nest_asyncio.apply()
+# =======================================
+
+# 单机Redis上模拟按slot拆分的执行路径
+aredis_slot_backend = ARedisBackend(
+    config={
+        "CACHE_REDIS_SCHEME": "redis",
+        "CACHE_REDIS_HOST": "192.168.201.169",
+        "CACHE_REDIS_PORT": 6379,
+        "CACHE_REDIS_PASSWORD": "",
+        "CACHE_REDIS_DATABASE": 8,
+        'CACHE_REDIS_USE_POOL': True,
+        "CACHE_REDIS_PIPELINE_CHUNK_SIZE": 2,
+        "CACHE_KEY_PREFIX": "A_REDIS_CLUSTER_UNIT_TEST:"
+    }
+)
+
+
+@pytest.fixture(scope='module')
+def setup_module(request):
+    def teardown_module():
+        print("teardown_module called.")
+
+    request.addfinalizer(teardown_module)
+    print('setup_module called.')
+
+
+def get_cache():
+    return aredis_slot_backend
+
+
+def test_key_hash_slot(setup_module):
+    assert crc16(b"123456789") == 0x31C3
+    assert key_hash_slot("123456789") == 12739
+    assert key_hash_slot("foo") == 12182
+    assert key_hash_slot(b"bar") == 5061
+    assert hash_tag("{user1000}.following") == b"user1000"
+    assert hash_tag("foo{}{bar}") == b"foo{}{bar}"
+    assert hash_tag("foo{{bar}}zap") == b"{bar"
+    assert key_hash_slot("{user1000}.following") == key_hash_slot("{user1000}.followers")
+    assert tagged("user:1", "profile") == "{user:1}profile"
+
+
+def test_group_by_slot(setup_module):
+    keys = ["foo", "bar", "{foo}1", "{bar}2", "foo"]
+    groups = group_by_slot(keys)
+    assert list(groups.keys()) == [12182, 5061]
+    assert groups[12182] == [0, 2, 4]
+    assert groups[5061] == [1, 3]
+
+
+def test_make_key_hash_tag(setup_module):
+    assert get_cache().make_key("foo") == "A_REDIS_CLUSTER_UNIT_TEST:foo"
+    assert get_cache().make_key("foo", hash_tag="g1") == "A_REDIS_CLUSTER_UNIT_TEST:{g1}foo"
+    backend = ARedisBackend(config={"CACHE_KEY_PREFIX": "P:", "CACHE_REDIS_HASH_TAG": "all"})
+    assert backend.make_key("foo") == "P:{all}foo"
+    assert key_hash_slot(backend.make_key("foo")) == key_hash_slot(backend.make_key("bar"))
+
+
+@pytest.mark.asyncio
+async def test_backend_slot_grouping(event_loop):
+    keys = ["alpha", "bravo", "charlie", "{tag}delta", "{tag}echo", "{tag}foxtrot"]
+    get_cache().use_cluster = True
+    try:
+        val = await get_cache().set_many(*[(key, key.upper()) for key in keys])
+        assert val is True
+        val = await get_cache().get_many("missing", *reversed(keys))
+        assert val == [None] + [key.upper() for key in reversed(keys)]
+        with get_cache().get_async_context() as conn:
+            replies = await get_cache().execute_by_slot(conn, "MGET", [get_cache().make_key(k) for k in keys])
+        # {tag}的3个key在同一个slot，按chunk size拆分为2条命令
+        assert sorted(len(indexes) for indexes, _ in replies) == [1, 1, 1, 1, 2]
+        val = await get_cache().delete_many(*keys)
+        assert val is True
+        val = await get_cache().get_many(*keys)
+        assert val == [None] * len(keys)
+    finally:
+        get_cache().use_cluster = False
+
+
+class MockClusterConnection(object):
+    """
+    模拟StrictRedisCluster：SCAN只遍历单个node，多key命令跨slot时抛出CROSSSLOT
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.commands = []
+
+    async def cluster_nodes(self):
+        return [{"name": name, "flags": ["master"] if master else ["slave"]}
+                for name, (master, _) in self.nodes.items()]
+
+    async def scan(self, cursor=0, match=None, count=None):
+        raise AssertionError("SCAN must be sent to each master node")
+
+    async def unlink(self, *keys):
+        raise AssertionError("UNLINK must be grouped by slot")
+
+    async def execute_command_on_nodes(self, nodes, *args):
+        _, cursor, _, match, _, count = args
+        keys = [key for key in self.nodes[nodes[0]["name"]][1] if fnmatch.fnmatchcase(key, match)]
+        batch = keys[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        return {nodes[0]["name"]: (next_cursor, batch)}
+
+    async def pipeline(self, transaction=False):
+        return MockClusterPipeline(self)
+
+
+class MockClusterPipeline(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.stack = []
+
+    async def execute_command(self, *args):
+        if len(set(key_hash_slot(key) for key in args[1:])) > 1:
+            raise Exception("CROSSSLOT Keys in request don't hash to the same slot")
+        self.stack.append(args)
+
+    async def execute(self):
+        replies = []
+        for command, *keys in self.stack:
+            self.conn.commands.append((command, keys))
+            deleted = 0
+            for _, node_keys in self.conn.nodes.values():
+                for key in keys:
+                    if key in node_keys:
+                        node_keys.remove(key)
+                        deleted += 1
+            replies.append(deleted)
+        return replies
+
+
+@pytest.mark.asyncio
+async def test_cluster_scan_unlink(event_loop):
+    backend = ARedisBackend(config={"CACHE_KEY_PREFIX": "P:", "CACHE_REDIS_PIPELINE_CHUNK_SIZE": 100})
+    backend.use_cluster = True
+    conn = MockClusterConnection({
+        "node1": (True, ["P:alpha", "P:bravo", "P:charlie", "OTHER:alpha"]),
+        "node2": (True, ["P:delta", "P:echo"]),
+        "node3": (False, ["P:replica"]),
+    })
+    keys = await backend.scan_prefix(conn, batch_size=2)
+    assert sorted(keys) == ["alpha", "bravo", "charlie", "delta", "echo"]
+    stats = await backend.scan_unlink(conn, backend.make_key("*"), batch_size=2, concurrency=1)
+    assert stats["scanned"] == 5
+    assert stats["deleted"] == 5
+    assert all(command == "UNLINK" and len(set(key_hash_slot(k) for k in keys)) == 1
+               for command, keys in conn.commands)
+    assert conn.nodes["node1"][1] == ["OTHER:alpha"]
+    assert conn.nodes["node2"][1] == []
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__)])
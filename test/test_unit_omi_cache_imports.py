@@ -0,0 +1,60 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append("../")
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ["aredis", "aioredis", "pydantic"]
+
+
+def loaded_modules(statement):
+    """
+    在新的进程中执行statement，返回已加载的HEAVY_MODULES
+    """
+    code = "import sys\n%s\nprint(','.join(m for m in %r if m in sys.modules))" % (statement, HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def test_import_is_lazy():
+    assert loaded_modules("import omi_cache_manager") == []
+    assert loaded_modules("from omi_cache_manager import AsyncCacheManager, SimpleCacheBackend, cached") == []
+    assert loaded_modules("from omi_cache_manager import AsyncCacheManager\n"
+                          "AsyncCacheManager(None, cache_backend='simple_cache')") == []
+    assert "aredis" in loaded_modules("from omi_cache_manager import ARedisBackend")
+
+
+def test_lazy_attrs():
+    import omi_cache_manager
+    from omi_cache_manager.aredis_backend import ARedisBackend
+    assert omi_cache_manager.ARedisBackend is ARedisBackend
+    assert "TieredCacheBackend" in dir(omi_cache_manager)
+    try:
+        omi_cache_manager.UnknownBackend
+    except AttributeError as err:
+        assert isinstance(err, AttributeError)
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__)])
@@ -0,0 +1,131 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.append("../")
+
+from omi_cache_manager.aredis_backend import ARedisBackend
+from omi_cache_manager.backends import SimpleCacheBackend
+from omi_cache_manager.cluster import key_hash_slot
+from omi_cache_manager.keys import KeyBuilder
+
+# =======================================
+# install nest_asyncio for unit test when
+# RuntimeError: This event loop is already running
+# pip install nest_asyncio
+import nest_asyncio
+
+nest_asyncio.apply()
+# =======================================
+
+aredis_hash_backend = ARedisBackend(
+    config={
+        "CACHE_REDIS_SCHEME": "redis",
+        "CACHE_REDIS_HOST": "192.168.201.169",
+        "CACHE_REDIS_PORT": 6379,
+        "CACHE_REDIS_PASSWORD": "",
+        "CACHE_REDIS_DATABASE": 8,
+        "CACHE_KEY_HASH_MIN_BYTES": 32,
+        "CACHE_KEY_PREFIX": "A_REDIS_KEYS_UNIT_TEST:"
+    }
+)
+
+
+def test_build():
+    builder = KeyBuilder("P:")
+    assert builder.build("foo") == "P:foo"
+    assert builder.build(1) == "P:1"
+    assert builder.build(b"foo") == b"P:foo"
+    assert builder.build(bytearray(b"foo")) == b"P:foo"
+    assert builder.build("foo", hash_tag="g1") == "P:{g1}foo"
+    assert builder.build_many(["foo", b"bar", 2]) == ["P:foo", b"P:bar", "P:2"]
+    assert builder.build_many(("foo", "bar"), hash_tag="g1") == ["P:{g1}foo", "P:{g1}bar"]
+    assert builder.strip("P:foo") == "foo"
+    assert builder.strip(b"P:foo") == b"foo"
+    assert builder.strip("Q:foo") is None
+    tagged = KeyBuilder("P:", hash_tag="all")
+    assert tagged.build("foo") == "P:{all}foo"
+    assert tagged.build(b"foo") == b"P:{all}foo"
+    assert tagged.build("foo", hash_tag="") == "P:foo"
+    assert tagged.strip("P:{all}foo") == "foo"
+    assert tagged.strip(b"P:{all}foo") == b"foo"
+    assert tagged.strip("P:{g1}foo") is None
+    assert tagged.strip("P:{g1}foo", hash_tag="g1") == "foo"
+    assert tagged.strip("P:foo", hash_tag="") == "foo"
+    try:
+        KeyBuilder("P:", hash_min_bytes=0)
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+def test_build_hashed():
+    builder = KeyBuilder("P:", hash_min_bytes=8)
+    assert builder.build("short") == "P:short"
+    long_key = "long_composite_key"
+    digest = hashlib.sha1(long_key.encode("utf-8")).hexdigest()
+    assert builder.build(long_key) == "P:#sha1:" + digest
+    assert builder.build(long_key.encode("utf-8")) == ("P:#sha1:" + digest).encode("utf-8")
+    # 按编码后的字节数判断，3个汉字为9个字节
+    assert builder.build("缓存键").startswith("P:#sha1:")
+    assert builder.build_many(["short", long_key]) == ["P:short", "P:#sha1:" + digest]
+    assert builder.is_hashed(long_key) is True
+    assert builder.is_hashed(long_key.encode("utf-8")) is True
+    assert builder.is_hashed("short") is False
+    assert KeyBuilder("P:").is_hashed(long_key) is False
+    # 保留key中的hash tag
+    hashed = builder.build("{user:1}profile_and_settings")
+    assert hashed.startswith("P:{user:1}#sha1:")
+    assert key_hash_slot(hashed) == key_hash_slot("{user:1}")
+
+
+@pytest.mark.asyncio
+async def test_simple_backend_keys(event_loop):
+    backend = SimpleCacheBackend(config={"CACHE_KEY_PREFIX": "P:", "CACHE_KEY_HASH_MIN_BYTES": 16})
+    long_key = "k" * 64
+    assert await backend.set(long_key, "long") is True
+    assert await backend.set(b"raw", "bytes") is True
+    assert await backend.set("raw", "str") is True
+    assert await backend.get(long_key) == "long"
+    assert await backend.get(b"raw") == "bytes"
+    assert await backend.get_many(long_key, b"raw", "raw") == ["long", "bytes", "str"]
+    assert backend.make_key(long_key) in backend.get_cache_context().cache_dict
+    assert sorted(await backend.scan_keys(), key=str) == sorted([backend.make_key(long_key)[2:], b"raw", "raw"],
+                                                                key=str)
+    assert await backend.delete_many(long_key, b"raw") is True
+    assert await backend.get_many(long_key, b"raw", "raw") == [None, None, "str"]
+
+
+@pytest.mark.asyncio
+async def test_aredis_backend_keys(event_loop):
+    backend = aredis_hash_backend
+    long_key = "composite:" + "x" * 64
+    assert await backend.set_many((long_key, "long"), (b"raw", "bytes")) is True
+    assert await backend.get(long_key) == "long"
+    assert await backend.get_many(long_key, b"raw") == ["long", "bytes"]
+    with backend.get_async_context() as conn:
+        assert await conn.exists(backend.make_key(long_key))
+        assert len(backend.make_key(long_key)) < len(backend.key_prefix) + len(long_key)
+    assert await backend.delete_many(long_key, b"raw") is True
+    assert await backend.get_many(long_key, b"raw") == [None, None]
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__)])
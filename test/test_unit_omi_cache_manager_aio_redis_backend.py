@@ -181,7 +181,8 @@ async def test_backend_set_redis(event_loop):
     assert val is True
     val = await get_cache().get("redis")
     assert val == "redis"  # this key exsit
-    time.sleep(1)
+    # 连接池常驻后get不再重新建立连接，留出余量避免恰好在过期边界读取
+    time.sleep(1.5)
     val = await get_cache().get("redis")
     assert val is None  # this key is gone
     val = await get_cache().set("redis", "redis", pexpire=5)  # set a very short expire in millseconds
@@ -463,5 +464,20 @@ async def test_backend_clear(event_loop):
     assert val == [None]
 
 
+@pytest.mark.asyncio
+async def test_warm_up(event_loop):
+    stats = await get_cache().warm_up(size=4)
+    assert stats["connections"] == 4
+    assert stats["ok"] == 4
+    assert stats["errors"] == []
+    assert 0 < stats["latency_ms"]["min"] <= stats["latency_ms"]["p50"] <= stats["latency_ms"]["max"]
+    assert stats["latency_ms"]["max"] <= stats["elapsed_ms"]
+    val = await get_cache().set("foo", "bar")
+    assert val is True
+    val = await get_cache().get("foo")
+    assert val == "bar"
+    await get_cache().delete("foo")
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__)])
@@ -15,6 +15,7 @@ limitations under the License.
 
 """
 
+import asyncio
 import os
 import sys
 
@@ -23,6 +24,7 @@ import pytest
 sys.path.append("../")
 
 from omi_cache_manager.async_cache_manager import AsyncCacheManager
+from omi_cache_manager.envelope import NOT_FOUND
 
 import time
 
@@ -468,5 +470,180 @@ async def test_backend_clear(event_loop):
     assert val == [None]
 
 
+@pytest.mark.asyncio
+async def test_warm_up(event_loop):
+    stats = await get_cache().warm_up(size=4)
+    assert stats["connections"] == 4
+    assert stats["ok"] == 4
+    assert stats["errors"] == []
+    assert 0 < stats["latency_ms"]["min"] <= stats["latency_ms"]["p50"] <= stats["latency_ms"]["max"]
+    assert stats["latency_ms"]["max"] <= stats["elapsed_ms"]
+    # 超过CACHE_REDIS_POOL_MAXSIZE时只建立max_connections个连接，全部归还到连接池
+    stats = await get_cache().warm_up(size=100)
+    assert stats["connections"] == 50
+    assert stats["ok"] == 50
+    stats = await get_cache().warm_up(size=100)
+    assert stats["ok"] == 50
+    val = await get_cache().set("foo", "bar")
+    assert val is True
+    val = await get_cache().get("foo")
+    assert val == "bar"
+    await get_cache().delete("foo")
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate(event_loop):
+    try:
+        await get_cache().set("swr", "stale", expire=10, soft_expire=1)
+    except ValueError as err:
+        # list value can not be saved without a serializer
+        assert isinstance(err, ValueError)
+    swr_cache = AsyncCacheManager(
+        None,
+        cache_backend="aredis",
+        config={
+            "CACHE_REDIS_HOST": "192.168.201.169",
+            "CACHE_REDIS_PORT": 6379,
+            "CACHE_REDIS_DATABASE": 8,
+            "CACHE_SERIALIZER": "json",
+            "CACHE_KEY_PREFIX": "A_REDIS_MANAGER_UNIT_TEST_SWR:"
+        }
+    )
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return {"fresh": key}
+
+    swr_cache.register_loader(loader)
+    assert await swr_cache.set("swr", {"stale": True}, expire=10, soft_expire=0.05) is True
+    await asyncio.sleep(0.06)
+    values = await asyncio.gather(*[swr_cache.get("swr") for _ in range(5)])
+    assert values == [{"stale": True}] * 5
+    await asyncio.sleep(0.1)
+    assert calls == ["swr"]
+    assert await swr_cache.get("swr") == {"fresh": "swr"}
+    # 硬过期时间保持不变
+    val = await swr_cache.execute("TTL", "swr")
+    assert 0 < val <= 10
+    await swr_cache.delete("swr")
+    await swr_cache.destroy_backend_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute(event_loop):
+    try:
+        await get_cache().get_or_compute("xfetch", lambda: "value", ttl=10)
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+    xfetch_cache = AsyncCacheManager(
+        None,
+        cache_backend="aredis",
+        config={
+            "CACHE_REDIS_HOST": "192.168.201.169",
+            "CACHE_REDIS_PORT": 6379,
+            "CACHE_REDIS_DATABASE": 8,
+            "CACHE_SERIALIZER": "pickle",
+            "CACHE_KEY_PREFIX": "A_REDIS_MANAGER_UNIT_TEST_XFETCH:"
+        }
+    )
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return {"value": len(calls)}
+
+    await xfetch_cache.delete_many("xfetch")
+    val = await xfetch_cache.get_or_compute("xfetch", loader, ttl=10)
+    assert val == {"value": 1}
+    val = await xfetch_cache.get_or_compute("xfetch", loader, ttl=10)
+    assert val == {"value": 1}
+    assert calls == [1]
+    val = await xfetch_cache.execute("PTTL", "xfetch")
+    assert 0 < val <= 10000
+    await xfetch_cache.delete("xfetch")
+    await xfetch_cache.destroy_backend_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_get_many_or_set(event_loop):
+    backend = get_cache().cache_backend
+    calls = []
+    get_many, set_many = backend.get_many, backend.set_many
+
+    async def counting_get_many(*args, **kwargs):
+        calls.append("get_many")
+        return await get_many(*args, **kwargs)
+
+    async def counting_set_many(*args, **kwargs):
+        calls.append("set_many")
+        return await set_many(*args, **kwargs)
+
+    async def batch_loader(keys):
+        calls.append(keys)
+        return {key: "loaded_%s" % key for key in keys}
+
+    await get_cache().delete_many("many1", "many2", "many3")
+    await get_cache().set("many2", "cached")
+    backend.get_many, backend.set_many = counting_get_many, counting_set_many
+    try:
+        # manager在构造时绑定backend的set_many，替换backend的方法后需要重新创建manager
+        cache = AsyncCacheManager(None, cache_backend=backend)
+        val = await cache.get_many_or_set(["many1", "many2", "many3"], batch_loader, expire=10)
+    finally:
+        backend.get_many, backend.set_many = get_many, set_many
+    assert val == {"many1": "loaded_many1", "many2": "cached", "many3": "loaded_many3"}
+    assert calls == ["get_many", ["many1", "many3"], "set_many"]
+    val = await get_cache().execute("TTL", "many3")
+    assert 0 < val <= 10
+    val = await get_cache().get_or_set("many1", lambda: "unused")
+    assert val == "loaded_many1"
+    await get_cache().delete_many("many1", "many2", "many3")
+
+
+@pytest.mark.asyncio
+async def test_negative_cache(event_loop):
+    await get_cache().delete_many("absent")
+    val = await get_cache().lookup("absent")
+    assert val is NOT_FOUND
+    assert await get_cache().set_missing("absent", expire=10) is True
+    val = await get_cache().lookup("absent")
+    assert val is None
+    val = await get_cache().get("absent")
+    assert val is None
+    val = await get_cache().execute("TTL", "absent")
+    assert 0 < val <= 10
+    await get_cache().delete("absent")
+
+
+@pytest.mark.asyncio
+async def test_bloom_filter_bytes_keys(event_loop):
+    bloom_cache = AsyncCacheManager(None, cache_backend="aredis", config={
+        "CACHE_REDIS_HOST": "192.168.201.169",
+        "CACHE_REDIS_DATABASE": 8,
+        'CACHE_REDIS_ENCODING': 'utf-8',
+        "CACHE_KEY_PREFIX": "A_REDIS_BLOOM_UNIT_TEST:",
+        "CACHE_BLOOM_ENABLED": True,
+    })
+    await bloom_cache.clear()
+    # str和bytes的key对应同一个Redis key
+    assert await bloom_cache.set("x", "1") is True
+    assert await bloom_cache.get(b"x") == "1"
+    assert await bloom_cache.set(b"y", "2") is True
+    assert await bloom_cache.get("y") == "2"
+    assert await bloom_cache.get_many(b"x", "y", b"absent") == ["1", "2", None]
+    # 重建后scan_keys返回str的key，bytes的key仍然可以读取
+    assert await bloom_cache.rebuild_bloom_filter() == 2
+    assert await bloom_cache.get(b"y") == "2"
+    assert await bloom_cache.get(b"x") == "1"
+    assert await bloom_cache.get_many([b"x", "y", "absent"]) == {b"x": "1", "y": "2"}
+    stats = bloom_cache.get_bloom_stats()
+    assert stats["skipped"] == 2
+    assert stats["passed_misses"] == 0
+    await bloom_cache.clear()
+    await bloom_cache.destroy_backend_cache_context()
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__)])
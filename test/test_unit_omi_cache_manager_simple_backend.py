@@ -15,6 +15,7 @@ limitations under the License.
 
 """
 
+import asyncio
 import os
 import sys
 
@@ -22,8 +23,12 @@ import pytest
 
 sys.path.append("../")
 
+from omi_cache_manager._decorators import cached
 from omi_cache_manager.async_cache_manager import AsyncCacheManager
+from omi_cache_manager.batching import BatchLoader
 from omi_cache_manager.backends import NullCacheBackend, SimpleCacheBackend
+from omi_cache_manager.bloom import BloomFilter
+from omi_cache_manager.envelope import Envelope, NOT_FOUND
 
 # =======================================
 # install nest_asyncio for unit test when 
@@ -319,5 +324,542 @@ async def test_backend_clear(event_loop):
     assert val == [None]
 
 
+@pytest.mark.asyncio
+async def test_cached_single_flight(event_loop):
+    calls = []
+
+    @cached(get_cache(), expire=60)
+    async def load_user(user_id, detail=False):
+        calls.append(user_id)
+        await asyncio.sleep(0.05)
+        return {"id": user_id, "detail": detail}
+
+    results = await asyncio.gather(*[load_user(1, detail=True) for _ in range(20)])
+    assert len(calls) == 1
+    assert all(val == {"id": 1, "detail": True} for val in results)
+    assert len(load_user.single_flight) == 0
+    # cached
+    val = await load_user(1, detail=True)
+    assert val == {"id": 1, "detail": True}
+    assert len(calls) == 1
+    # different arguments use different keys
+    val = await load_user(2)
+    assert val == {"id": 2, "detail": False}
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_sync_function(event_loop):
+    calls = []
+
+    @cached(get_cache(), pexpire=50, key_builder=lambda name: f"sync:{name}")
+    def load_name(name):
+        calls.append(name)
+        return name.upper()
+
+    val = await load_name("foo")
+    assert val == "FOO"
+    val = await get_cache().get("sync:foo")
+    assert val == "FOO"
+    val = await load_name("foo")
+    assert val == "FOO"
+    assert len(calls) == 1
+    await asyncio.sleep(0.06)
+    val = await load_name("foo")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_error(event_loop):
+    calls = []
+
+    @cached(get_cache())
+    async def load_error():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise KeyError("not found")
+
+    results = await asyncio.gather(*[load_error() for _ in range(5)], return_exceptions=True)
+    assert len(calls) == 1
+    assert all(isinstance(ex, KeyError) for ex in results)
+    try:
+        await load_error()
+    except KeyError as err:
+        assert isinstance(err, KeyError)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_get(event_loop):
+    batch_cache_manager = AsyncCacheManager(
+        None,
+        cache_backend="simple_cache",
+        config={
+            "CACHE_KEY_PREFIX": "BATCH_PREFIX:",
+            "CACHE_BATCH_ENABLED": True,
+            "CACHE_BATCH_MAX_SIZE": 8,
+        }
+    )
+    backend = batch_cache_manager.cache_backend
+    calls = []
+    get_many = backend.get_many
+
+    async def counting_get_many(*args, **kwargs):
+        calls.append(len(args))
+        return await get_many(*args, **kwargs)
+
+    backend.get_many = counting_get_many
+    await backend.set_many(*[("key%d" % i, "val%d" % i) for i in range(5)])
+    values = await asyncio.gather(*[batch_cache_manager.get("key%d" % i) for i in range(6)])
+    assert values == ["val0", "val1", "val2", "val3", "val4", None]
+    assert calls == [6]
+    # 超过CACHE_BATCH_MAX_SIZE时拆分为多批
+    values = await asyncio.gather(*[batch_cache_manager.get("key%d" % (i % 5)) for i in range(10)])
+    assert values == ["val%d" % (i % 5) for i in range(10)]
+    assert calls == [6, 5, 2]
+    stats = batch_cache_manager.get_batch_stats()
+    assert stats["calls"] == 16
+    assert stats["batches"] == 3
+    assert stats["max_seen_batch_size"] == 8
+    # 使用kwargs的get不合并
+    assert await batch_cache_manager.get(key="key1") == "val1"
+    assert calls == [6, 5, 2]
+    assert simple_cache_manager.get_batch_stats() is None
+
+
+@pytest.mark.asyncio
+async def test_warm_up(event_loop):
+    # 不需要连接的backend不做处理
+    val = await get_cache().warm_up()
+    assert val is None
+
+
+@pytest.mark.asyncio
+async def test_batch_writes(event_loop):
+    batch_cache_manager = AsyncCacheManager(
+        None,
+        cache_backend="simple_cache",
+        config={
+            "CACHE_BATCH_ENABLED": True,
+            "CACHE_BATCH_WINDOW_US": 2000,
+            "CACHE_BATCH_WRITES": True,
+        }
+    )
+    results = await asyncio.gather(
+        batch_cache_manager.set("foo", "bar"),
+        batch_cache_manager.set("foo2", "bar2"),
+        batch_cache_manager.get("foo"),
+        batch_cache_manager.delete("foo2"),
+        batch_cache_manager.get("foo2"),
+    )
+    # 不同类的操作保持提交顺序
+    assert results == [True, True, "bar", True, None]
+    stats = batch_cache_manager.get_batch_stats()
+    assert stats["batches"] == 4
+    assert stats["calls"] == 5
+    assert stats["avg_wait_us"] >= 1000
+    # 带有expire参数的set不合并
+    assert await batch_cache_manager.set("foo3", "bar3", expire=10) is True
+    assert batch_cache_manager.get_batch_stats()["calls"] == 5
+
+
+@pytest.mark.asyncio
+async def test_batch_flush_order(event_loop):
+    backend = SimpleCacheBackend(config={"CACHE_KEY_PREFIX": "BATCH_ORDER:"})
+    set_many = backend.set_many
+
+    async def slow_set_many(*args, **kwargs):
+        await asyncio.sleep(0.02)
+        return await set_many(*args, **kwargs)
+
+    backend.set_many = slow_set_many
+    loader = BatchLoader(backend, max_batch_size=1)
+    # 每个操作单独成批立即执行，后面的get等待前面的set执行完成
+    results = await asyncio.gather(loader.store("foo", "bar"), loader.load("foo"))
+    assert results == [True, "bar"]
+    assert loader.get_stats()["batches"] == 2
+    await loader.flush()
+
+
+@pytest.mark.asyncio
+async def test_compression(event_loop):
+    compress_cache_manager = AsyncCacheManager(
+        None,
+        cache_backend="simple_cache",
+        config={
+            "CACHE_SERIALIZER": "pickle",
+            "CACHE_COMPRESS_MIN_BYTES": 1024,
+        }
+    )
+    value = {"rows": [{"id": i, "name": "user%d" % i} for i in range(200)]}
+    assert await compress_cache_manager.set("large", value) is True
+    assert await compress_cache_manager.set("small", {"id": 1}) is True
+    assert await compress_cache_manager.get("large") == value
+    assert await compress_cache_manager.get_many("small", "large") == [{"id": 1}, value]
+    stats = compress_cache_manager.get_compression_stats()
+    assert stats["compressor"] == "zlib"
+    assert stats["compressed"] == 1
+    assert stats["decompressed"] == 2
+    assert stats["ratio"] > 2
+    assert stats["avg_compress_us"] > 0
+    assert simple_cache_manager.get_compression_stats() is None
+    # compression without a serializer is rejected
+    try:
+        AsyncCacheManager(None, cache_backend="simple_cache", config={"CACHE_COMPRESS_MIN_BYTES": 1024})
+        assert False
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate(event_loop):
+    swr_cache_manager = AsyncCacheManager(
+        None,
+        cache_backend="simple_cache",
+        config={
+            "CACHE_KEY_PREFIX": "SWR:"
+        }
+    )
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.02)
+        return "fresh_%s" % key
+
+    swr_cache_manager.register_loader(loader)
+    assert await swr_cache_manager.set("hot", "stale", expire=10, soft_expire=0.1) is True
+    assert await swr_cache_manager.get("hot") == "stale"
+    assert calls == []
+    await asyncio.sleep(0.11)
+    # 超过软过期时间后立即返回旧的value，只刷新一次
+    values = await asyncio.gather(*[swr_cache_manager.get("hot") for _ in range(10)])
+    assert values == ["stale"] * 10
+    assert await swr_cache_manager.get_many("hot") == ["stale"]
+    await asyncio.sleep(0.05)
+    assert calls == ["hot"]
+    assert await swr_cache_manager.get("hot") == "fresh_hot"
+    stats = swr_cache_manager.get_refresh_stats()
+    assert stats["stale_hits"] == 11
+    assert stats["refreshes"] == 1
+    assert stats["refreshing"] == 0
+    # 刷新失败时继续返回旧的value
+
+    async def failing_loader(key):
+        raise RuntimeError(key)
+
+    swr_cache_manager.register_loader(failing_loader)
+    await asyncio.sleep(0.11)
+    assert await swr_cache_manager.get("hot") == "fresh_hot"
+    await swr_cache_manager.destroy_backend_cache_context()
+    assert swr_cache_manager.get_refresh_stats()["refresh_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute(event_loop):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": len(calls)}
+
+    val = await get_cache().get_or_compute("xfetch", loader, ttl=10)
+    assert val == {"value": 1}
+    val = await get_cache().get_or_compute("xfetch", loader, ttl=10)
+    assert val == {"value": 1}
+    assert calls == [1]
+    # 普通的get返回保存的value
+    val = await get_cache().get("xfetch")
+    assert val == {"value": 1}
+    # 同步函数
+    val = await get_cache().get_or_compute("xfetch_sync", lambda: "sync", ttl=10)
+    assert val == "sync"
+    # 过期后重新计算
+    val = await get_cache().get_or_compute("xfetch_short", loader, ttl=0.05)
+    assert val == {"value": 2}
+    await asyncio.sleep(0.06)
+    val = await get_cache().get_or_compute("xfetch_short", loader, ttl=0.05)
+    assert val == {"value": 3}
+    try:
+        await get_cache().get_or_compute("xfetch", loader, ttl=0)
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+def test_xfetch_probability():
+    # 距离过期很远时不会提前计算，delta=0.1时需要random() <= e^-90
+    envelope = Envelope("value", ttl=10, delta=0.1, created_at=0)
+    assert not any(envelope.should_recompute(now=1) for _ in range(1000))
+    envelope = Envelope("value", ttl=10, delta=1, created_at=0)
+    # 越接近过期，提前计算的概率越高
+    early = sum(envelope.should_recompute(now=8) for _ in range(10000))
+    later = sum(envelope.should_recompute(now=9.5) for _ in range(10000))
+    assert 0 < early < later < 10000
+    assert envelope.should_recompute(now=10)
+    # beta越大越早重新计算
+    eager = sum(envelope.should_recompute(beta=4, now=8) for _ in range(10000))
+    assert eager > early
+    # 没有delta时只在过期后重新计算
+    envelope = Envelope("value", ttl=10, created_at=0)
+    assert not envelope.should_recompute(now=9.99)
+    assert Envelope.loads(envelope.dumps()).ttl == 10
+    assert Envelope.loads(["value"]) is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_set(event_loop):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "loaded"
+
+    await get_cache().delete_many("read_through")
+    values = await asyncio.gather(*[get_cache().get_or_set("read_through", loader, expire=10) for _ in range(5)])
+    assert values == ["loaded"] * 5
+    assert calls == [1]
+    val = await get_cache().get("read_through")
+    assert val == "loaded"
+    # loader返回None时不写入
+    val = await get_cache().get_or_set("read_through_none", lambda: None)
+    assert val is None
+    val = await get_cache().get("read_through_none")
+    assert val is None
+
+
+@pytest.mark.asyncio
+async def test_get_many_or_set(event_loop):
+    calls = []
+
+    async def batch_loader(keys):
+        calls.append(keys)
+        return {key: "loaded_%s" % key for key in keys if key != "absent"}
+
+    await get_cache().delete_many("many1", "many2", "many3", "absent")
+    await get_cache().set("many2", "cached")
+    val = await get_cache().get_many_or_set(["many1", "many2", "many3", "absent"], batch_loader, expire=10)
+    assert val == {"many1": "loaded_many1", "many2": "cached", "many3": "loaded_many3", "absent": None}
+    assert list(val.keys()) == ["many1", "many2", "many3", "absent"]
+    assert calls == [["many1", "many3", "absent"]]
+    val = await get_cache().get_many("many1", "many3")
+    assert val == ["loaded_many1", "loaded_many3"]
+    # 全部命中时不调用batch_loader
+    val = await get_cache().get_many_or_set(["many1", "many2"], batch_loader)
+    assert val == {"many1": "loaded_many1", "many2": "cached"}
+    assert len(calls) == 1
+    try:
+        await get_cache().get_many_or_set(["absent"], lambda keys: None)
+    except TypeError as err:
+        assert isinstance(err, TypeError)
+
+
+@pytest.mark.asyncio
+async def test_negative_cache(event_loop):
+    negative_cache_manager = AsyncCacheManager(
+        None,
+        cache_backend="simple_cache",
+        config={
+            "CACHE_NEGATIVE_TTL": 0.05
+        }
+    )
+    val = await negative_cache_manager.lookup("absent")
+    assert val is NOT_FOUND
+    assert not val
+    assert await negative_cache_manager.set_missing("absent") is True
+    val = await negative_cache_manager.lookup("absent")
+    assert val is None
+    val = await negative_cache_manager.get("absent")
+    assert val is None
+    val = await negative_cache_manager.get_many("absent")
+    assert val == [None]
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None
+
+    # 缓存的未命中结果有效期内不调用loader
+    val = await negative_cache_manager.get_or_set("absent", loader)
+    assert val is None
+    assert calls == []
+    await asyncio.sleep(0.06)
+    val = await negative_cache_manager.lookup("absent")
+    assert val is NOT_FOUND
+    val = await negative_cache_manager.get_or_set("absent", loader)
+    assert val is None
+    assert calls == [1]
+    val = await negative_cache_manager.get_or_set("absent", loader)
+    assert calls == [1]
+    val = await negative_cache_manager.get_many_or_set(["absent", "absent2"], lambda keys: {})
+    assert val == {"absent": None, "absent2": None}
+    val = await negative_cache_manager.lookup("absent2")
+    assert val is None
+
+
+def test_bloom_filter_bits():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    assert bloom.hashes == 7
+    assert bloom.size == 9586
+    assert bloom.memory_bytes == 1199
+    for i in range(1000):
+        bloom.add("key%d" % i)
+    assert all("key%d" % i in bloom for i in range(1000))
+    false_positives = sum("miss%d" % i in bloom for i in range(10000))
+    assert false_positives < 300
+    assert 0.005 < bloom.get_stats()["estimated_error_rate"] < 0.02
+    bloom.clear()
+    assert "key2" not in bloom
+    assert len(bloom) == 0
+    try:
+        BloomFilter(capacity=1000, error_rate=1)
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_bloom_filter(event_loop):
+    bloom_cache_manager = AsyncCacheManager(
+        None,
+        cache_backend="simple_cache",
+        config={
+            "CACHE_KEY_PREFIX": "BLOOM:",
+            "CACHE_BLOOM_ENABLED": True,
+            "CACHE_BLOOM_CAPACITY": 1000,
+        }
+    )
+    backend = bloom_cache_manager.cache_backend
+    calls = []
+    get_many = backend.get_many
+
+    async def counting_get_many(*args, **kwargs):
+        calls.append(list(args))
+        return await get_many(*args, **kwargs)
+
+    backend.get_many = counting_get_many
+    assert await bloom_cache_manager.set("foo", "bar") is True
+    assert await bloom_cache_manager.set_many(("foo1", "bar1"), foo2="bar2") is True
+    assert await bloom_cache_manager.get("foo") == "bar"
+    assert await bloom_cache_manager.get("absent") is None
+    assert await bloom_cache_manager.lookup("absent") is NOT_FOUND
+    val = await bloom_cache_manager.get_many("foo1", "absent", "foo2")
+    assert val == ["bar1", None, "bar2"]
+    assert calls == [["foo1", "foo2"]]
+    val = await bloom_cache_manager.get_many("absent", "absent2")
+    assert val == [None, None]
+    assert len(calls) == 1
+    assert await bloom_cache_manager.delete("foo") is True
+    # 删除的key保留在Bloom Filter中，由rebuild_bloom_filter清除
+    assert await bloom_cache_manager.get("foo") is None
+    stats = bloom_cache_manager.get_bloom_stats()
+    assert stats["lookups"] == 9
+    assert stats["skipped"] == 5
+    assert stats["passed_misses"] == 1
+    assert stats["memory_bytes"] > 0
+    # 其他方式写入的key通过重建加入
+    await backend.set("external", "value")
+    assert await bloom_cache_manager.get("external") is None
+    assert await bloom_cache_manager.rebuild_bloom_filter() == 3
+    assert await bloom_cache_manager.get("external") == "value"
+    assert "foo" not in bloom_cache_manager.bloom_filter
+    # 删除其他进程写入的key不会减去Bloom Filter中其他key的计数
+    await backend.set("external2", "value")
+    assert await bloom_cache_manager.delete("external2") is True
+    assert all(key in bloom_cache_manager.bloom_filter for key in ["foo1", "foo2", "external"])
+    # execute写入的key同样加入Bloom Filter
+    assert await bloom_cache_manager.execute("SET", exec1="bar") is True
+    assert await bloom_cache_manager.execute("SET", "exec2", "bar") is True
+    assert await bloom_cache_manager.execute("MSET", ("exec3", "v3"), ("exec4", "v4")) is True
+    assert await bloom_cache_manager.execute("MSET", exec5="v5") is True
+    val = await bloom_cache_manager.get_many("exec1", "exec2", "exec3", "exec4", "exec5")
+    assert val == ["bar", "bar", "v3", "v4", "v5"]
+    assert ("exec3", "v3") not in bloom_cache_manager.bloom_filter
+    assert bloom_cache_manager.parse_execute_keys(("INCR", "counter"), {}) == ["counter"]
+    assert bloom_cache_manager.parse_execute_keys(("GET", "exec1"), {}) == []
+    # 被摘要的长key重建后仍然可以读取
+    hashed_cache_manager = AsyncCacheManager(None, cache_backend="simple_cache", config={
+        "CACHE_KEY_PREFIX": "BLOOM_HASHED:",
+        "CACHE_KEY_HASH_MIN_BYTES": 16,
+        "CACHE_BLOOM_ENABLED": True,
+    })
+    long_key = "long" * 10
+    assert await hashed_cache_manager.set(long_key, "value") is True
+    assert await hashed_cache_manager.set("short", "value") is True
+    assert await hashed_cache_manager.rebuild_bloom_filter() == 2
+    assert await hashed_cache_manager.get(long_key) == "value"
+    assert await hashed_cache_manager.get_many(long_key, "short", "absent") == ["value", "value", None]
+    assert hashed_cache_manager.get_bloom_stats()["skipped"] == 1
+    assert await bloom_cache_manager.clear() is True
+    assert "foo1" not in bloom_cache_manager.bloom_filter
+    assert get_cache().get_bloom_stats() is None
+
+
+@pytest.mark.asyncio
+async def test_proxy_dispatch(event_loop):
+    cache = AsyncCacheManager(None, cache_backend="null_cache", config={})
+    # 全部代理方法都是coroutine function
+    for name in ["get", "set", "add", "delete", "delete_many", "get_many", "set_many", "execute", "clear"]:
+        assert asyncio.iscoroutinefunction(getattr(cache, name))
+    coro = cache.set_many(("foo", "bar"))
+    assert asyncio.iscoroutine(coro)
+    assert await coro is True
+    assert await cache.add("foo", "bar") is True
+    assert await cache.delete_many("foo") is True
+    assert await cache.get("foo") is None
+    assert await cache.async_method_call(cache.cache_backend.get, "foo") is None
+    try:
+        await cache.async_method_call(None)
+    except TypeError as err:
+        assert isinstance(err, TypeError)
+    # 没有开启Bloom Filter和批量操作时直接使用backend的方法
+    assert cache.set_many == cache.cache_backend.set_many
+    assert cache.delete_many == cache.cache_backend.delete_many
+    assert cache.get != cache.cache_backend.get
+    raw_cache = AsyncCacheManager(None, cache_backend="simple_cache",
+                                  config={"CACHE_KEY_PREFIX": "RAW:", "CACHE_UNWRAP_VALUES": False})
+    assert raw_cache.get == raw_cache.cache_backend.get
+    assert raw_cache.get_many == raw_cache.cache_backend.get_many
+    assert await raw_cache.set("foo", ["bar"]) is True
+    assert await raw_cache.get("foo") == ["bar"]
+    assert await raw_cache.lookup("foo") == ["bar"]
+    try:
+        await raw_cache.set("foo", "bar", soft_expire=10)
+        assert False
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+    try:
+        await raw_cache.set_missing("foo")
+        assert False
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+    try:
+        AsyncCacheManager(None, cache_backend="simple_cache",
+                          config={"CACHE_NEGATIVE_TTL": 10, "CACHE_UNWRAP_VALUES": False})
+        assert False
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+    await raw_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_get_many_mapping(event_loop):
+    cache = get_cache()
+    await cache.set("mapping1", "bar1")
+    await cache.set("mapping_soft", "soft", soft_expire=60)
+    await cache.set_missing("mapping_missing")
+    keys = ["mapping1", "mapping_soft", "mapping_missing", "mapping_absent"]
+    assert await cache.get_many(keys) == {"mapping1": "bar1", "mapping_soft": "soft"}
+    val = await cache.get_many(tuple(keys), default=NOT_FOUND)
+    assert list(val.values()) == ["bar1", "soft", NOT_FOUND, NOT_FOUND]
+    assert await NullCacheBackend().get_many(keys) == {}
+    # 开启Bloom Filter时只读取可能存在的key
+    bloom_cache_manager = AsyncCacheManager(None, cache_backend="simple_cache",
+                                            config={"CACHE_KEY_PREFIX": "MAPPING_BLOOM:", "CACHE_BLOOM_ENABLED": True})
+    await bloom_cache_manager.set("mapping1", "bar1")
+    assert await bloom_cache_manager.get_many(key for key in keys) == {"mapping1": "bar1"}
+    assert bloom_cache_manager.get_bloom_stats()["skipped"] == 3
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__)])
@@ -0,0 +1,91 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append("../")
+
+from omi_cache_manager.async_cache_manager import AsyncCacheManager
+from omi_cache_manager.backends import NullCacheBackend, SimpleCacheBackend
+from omi_cache_manager.registry import BackendRegistry, import_path, register_backend, registry
+
+
+class CustomBackend(SimpleCacheBackend):
+    pass
+
+
+def test_builtin_aliases():
+    assert registry.resolve("simple_cache") is SimpleCacheBackend
+    assert registry.resolve("SimpleCacheBackend") is SimpleCacheBackend
+    assert registry.resolve("omi_cache_manager.backends.NullCacheBackend") is NullCacheBackend
+    assert registry.resolve("omi_cache_manager.backends:NullCacheBackend") is NullCacheBackend
+    assert import_path("omi_cache_manager.backends.SimpleCacheBackend.make_ttl") is SimpleCacheBackend.make_ttl
+    try:
+        registry.resolve("foo.bar")
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+    try:
+        registry.resolve("omi_cache_manager.backends.UnknownBackend")
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+def test_register_backend():
+    register_backend("custom_cache", CustomBackend)
+    try:
+        cache = AsyncCacheManager(None, cache_backend="Custom_Cache", config={})
+        assert isinstance(cache.cache_backend, CustomBackend)
+        register_backend("custom_path", __name__ + ":CustomBackend")
+        assert registry.resolve("custom_path") is CustomBackend
+    finally:
+        registry.unregister("custom_cache")
+        registry.unregister("custom_path")
+    assert "custom_cache" not in registry
+    try:
+        register_backend("", CustomBackend)
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+def test_entry_points(tmp_path):
+    # 模拟一个安装了entry point的第三方包
+    dist_info = tmp_path / "omi_cache_plugin-0.1.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text("Metadata-Version: 2.1\nName: omi-cache-plugin\nVersion: 0.1\n")
+    (dist_info / "entry_points.txt").write_text(
+        "[omi_cache_manager.backends]\nplugin_cache = omi_cache_plugin:PluginBackend\n")
+    (tmp_path / "omi_cache_plugin.py").write_text(
+        "from omi_cache_manager.backends import SimpleCacheBackend\n\n\n"
+        "class PluginBackend(SimpleCacheBackend):\n    pass\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        plugins = BackendRegistry()
+        assert "plugin_cache" not in plugins
+        backend = plugins.resolve("plugin_cache")
+        assert backend.__name__ == "PluginBackend"
+        assert "plugin_cache" in plugins.aliases()
+        # 解析结果被缓存
+        assert plugins.resolve("PLUGIN_CACHE") is backend
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("omi_cache_plugin", None)
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__)])
@@ -15,15 +15,21 @@ limitations under the License.
 
 """
 
+import asyncio
 import os
 import sys
+import threading
 
 import pytest
 
 sys.path.append("../")
 
+from omi_cache_manager._decorators import async_method_inline
 from omi_cache_manager.async_cache_manager import AsyncCacheManager
 from omi_cache_manager.backends import NullCacheBackend, SimpleCacheBackend
+from omi_cache_manager.expiry import ExpiryHeap
+from omi_cache_manager.eviction import LFUPolicy, LRUPolicy, TinyLFUPolicy
+from omi_cache_manager.serializers import FLAG_COMPRESSED, HEADER_MARK, HEADER_MASK, Serializer
 
 # =======================================
 # install nest_asyncio for unit test when 
@@ -144,6 +150,39 @@ async def test_backend_set(event_loop):
     assert val == "mapping"
 
 
+@pytest.mark.asyncio
+async def test_backend_set_exist(event_loop):
+    await get_cache().delete_many("nx", "xx", "nx_many1", "nx_many2")
+    # 同时执行的两个NX set只有一个成功
+    val = await asyncio.gather(get_cache().set("nx", "first", exist="SET_IF_NOT_EXIST"),
+                               get_cache().set("nx", "second", exist="SET_IF_NOT_EXIST"))
+    assert val == [True, False]
+    val = await get_cache().get("nx")
+    assert val == "first"
+    val = await get_cache().set("xx", "xx", exist="SET_IF_EXIST")
+    assert val is False
+    val = await get_cache().get("xx")
+    assert val is None
+    val = await get_cache().set("nx", "third", exist="SET_IF_EXIST")
+    assert val is True
+    val = await get_cache().get("nx")
+    assert val == "third"
+    # 过期的key视为不存在
+    val = await get_cache().set("xx", "xx", pexpire=1)
+    assert val is True
+    await asyncio.sleep(0.01)
+    val = await get_cache().set("xx", "xx", exist="SET_IF_NOT_EXIST")
+    assert val is True
+    val = await get_cache().set_many(("nx", "many"), ("nx_many1", "many1"), exist="SET_IF_NOT_EXIST")
+    assert val == {"nx": False, "nx_many1": True}
+    val = await get_cache().set_many(("nx", "many"), ("nx_many2", "many2"),
+                                     exist={"nx": "SET_IF_EXIST", "nx_many2": "SET_IF_EXIST"})
+    assert val == {"nx": True, "nx_many2": False}
+    val = await get_cache().get_many("nx", "nx_many1", "nx_many2")
+    assert val == ["many", "many1", None]
+    await get_cache().delete_many("nx", "xx", "nx_many1", "nx_many2")
+
+
 @pytest.mark.asyncio
 async def test_backend_set_error(event_loop):
     try:
@@ -353,5 +392,323 @@ async def test_backend_clear(event_loop):
     assert val == [None]
 
 
+@pytest.mark.asyncio
+async def test_backend_inline(event_loop):
+    @async_method_inline
+    def current_thread():
+        return threading.get_ident()
+
+    val = await current_thread()
+    assert val == threading.get_ident()
+    val = await get_cache().set("inline", "inline")
+    assert val is True
+    val = await get_cache().get("inline")
+    assert val == "inline"
+
+
+@pytest.mark.asyncio
+async def test_backend_expire(event_loop):
+    val = await get_cache().set("expire", "expire", expire=1)
+    assert val is True
+    val = await get_cache().set("pexpire", "pexpire", pexpire=50)
+    assert val is True
+    val = await get_cache().set(mapping="mapping", pexpire=50)
+    assert val is True
+    val = await get_cache().get("expire")
+    assert val == "expire"
+    val = await get_cache().ttl("expire")
+    assert 0 < val <= 1
+    val = await get_cache().get("pexpire")
+    assert val == "pexpire"
+    await asyncio.sleep(0.06)
+    # lazy expire on read
+    val = await get_cache().get("pexpire")
+    assert val is None
+    val = await get_cache().get("mapping")
+    assert val is None
+    val = await get_cache().get("expire")
+    assert val == "expire"
+    # set without expire will clear ttl
+    val = await get_cache().set("expire", "expire")
+    assert val is True
+    val = await get_cache().ttl("expire")
+    assert val == -1
+    val = await get_cache().ttl("pexpire")
+    assert val == -2
+
+
+@pytest.mark.asyncio
+async def test_backend_expire_sweep(event_loop):
+    cache = SimpleCacheBackend(config={
+        "CACHE_KEY_PREFIX": "SWEEP:",
+        "CACHE_EXPIRE_SWEEP_INTERVAL": 0.01
+    })
+    val = await cache.set_many(("alpha", "Alpha"), ("bravo", "Bravo"), pexpire=20)
+    assert val is True
+    val = await cache.set("charlie", "Charlie")
+    assert val is True
+    assert "SWEEP:alpha" in cache.get_cache()
+    await asyncio.sleep(0.1)
+    # removed by sweeper without reading
+    assert "SWEEP:alpha" not in cache.get_cache()
+    assert "SWEEP:bravo" not in cache.get_cache()
+    assert "SWEEP:charlie" in cache.get_cache()
+    await cache.destroy_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_backend_sweeper_stop(event_loop):
+    cache = SimpleCacheBackend(config={"CACHE_KEY_PREFIX": "SWEEP_STOP:"})
+    await cache.set("alpha", "Alpha", expire=10)
+    context = cache.get_cache_context()
+    assert context._sweeper is not None
+    assert await cache.clear() is True
+    assert context._sweeper is None
+    await cache.set("alpha", "Alpha", expire=10)
+    assert context._sweeper is not None
+    await cache.destroy_cache_context()
+    assert context._sweeper is None
+
+
+def test_expiry_heap_mixed_keys():
+    heap = ExpiryHeap()
+    # deadline相同时不比较不同类型的key
+    heap.push("alpha", 1.0)
+    heap.push(b"alpha", 1.0)
+    heap.push(1, 1.0)
+    heap.push("bravo", 2.0)
+    assert heap.pop_expired(now=1.5) == ["alpha", b"alpha", 1]
+    assert heap.next_deadline() == 2.0
+
+
+@pytest.mark.asyncio
+async def test_backend_set_many_key_expire(event_loop):
+    val = await get_cache().set_many(("alpha", "Alpha"), ("bravo", "Bravo"), ("charlie", "Charlie"),
+                                     expire={"alpha": 10}, pexpire={"bravo": 20})
+    assert val is True
+    assert 9 < await get_cache().ttl("alpha") <= 10
+    assert 0 < await get_cache().ttl("bravo") <= 0.02
+    assert await get_cache().ttl("charlie") == -1
+    await asyncio.sleep(0.05)
+    val = await get_cache().get_many("alpha", "bravo", "charlie")
+    assert val == ["Alpha", None, "Charlie"]
+    await get_cache().delete_many("alpha", "charlie")
+
+
+def test_backend_expire_error(setup_module):
+    try:
+        SimpleCacheBackend.make_ttl(expire=-1)
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+    assert SimpleCacheBackend.make_ttl() is None
+    assert SimpleCacheBackend.make_ttl(expire=2) == 2.0
+    assert SimpleCacheBackend.make_ttl(expire=2, pexpire=500) == 0.5
+
+
+def test_eviction_policy(setup_module):
+    policy = LRUPolicy()
+    for key in ["a", "b", "c"]:
+        policy.on_insert(key)
+    policy.on_access("a")
+    assert policy.evict() == "b"
+    assert policy.evict() == "c"
+    assert len(policy) == 1
+
+    policy = LFUPolicy()
+    for key in ["a", "b", "c"]:
+        policy.on_insert(key)
+    policy.on_access("a")
+    policy.on_access("a")
+    policy.on_access("b")
+    assert policy.evict() == "c"
+    policy.on_remove("b")
+    assert policy.evict() == "a"
+    assert policy.evict() is None
+
+    policy = TinyLFUPolicy(100)
+    for i in range(99):
+        policy.on_insert(i)
+        policy.on_access(i)
+        policy.on_access(i)
+    # a cold candidate can not replace hot keys
+    policy.on_insert("cold")
+    evicted = [policy.evict() for _ in range(2)]
+    assert "cold" in evicted
+    assert len(policy) == 98
+
+
+@pytest.mark.asyncio
+async def test_backend_max_entries(event_loop):
+    for policy in ["lru", "lfu", "w-tinylfu"]:
+        cache = SimpleCacheBackend(config={
+            "CACHE_KEY_PREFIX": "EVICTION:",
+            "CACHE_MAX_ENTRIES": 10,
+            "CACHE_EVICTION_POLICY": policy
+        })
+        for i in range(10):
+            await cache.set(f"hot{i}", i)
+            await cache.get(f"hot{i}")
+            await cache.get(f"hot{i}")
+        for i in range(30):
+            val = await cache.set(f"cold{i}", i)
+            assert val is True
+        stats = cache.get_stats()
+        assert stats["entries"] <= 10
+        assert stats["evictions"] == 30
+        assert stats["hits"] == 20
+        if policy != "lru":
+            # frequently used keys survive a scan of cold keys
+            val = await cache.get_many(*[f"hot{i}" for i in range(10)])
+            assert len([v for v in val if v is not None]) == 9
+        val = await cache.get("miss")
+        assert val is None
+        assert cache.get_stats()["misses"] >= 1
+        await cache.destroy_cache_context()
+
+    try:
+        SimpleCacheBackend(config={"CACHE_MAX_ENTRIES": 10, "CACHE_EVICTION_POLICY": "unknown"})
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_backend_max_bytes(event_loop):
+    cache = SimpleCacheBackend(config={
+        "CACHE_KEY_PREFIX": "BYTES:",
+        "CACHE_MAX_BYTES": 100,
+        "CACHE_SIZER": len
+    })
+    for i in range(5):
+        val = await cache.set(f"key{i}", "x" * 30)
+        assert val is True
+    stats = cache.get_stats()
+    assert stats["bytes"] == 90
+    assert stats["evictions"] == 2
+    val = await cache.get_many("key0", "key1", "key2", "key3", "key4")
+    assert val == [None, None, "x" * 30, "x" * 30, "x" * 30]
+    # replace a value with a larger one
+    val = await cache.set("key4", "x" * 70)
+    assert val is True
+    assert cache.get_stats()["bytes"] == 100
+    val = await cache.delete("key4")
+    assert val is True
+    assert cache.get_stats()["bytes"] == 30
+    # larger than the whole budget
+    val = await cache.set("huge", "x" * 101)
+    assert val is False
+    val = await cache.get("huge")
+    assert val is None
+    val = await cache.clear()
+    assert val is True
+    assert cache.get_stats()["bytes"] == 0
+    await cache.destroy_cache_context()
+
+    cache = SimpleCacheBackend(config={
+        "CACHE_KEY_PREFIX": "BYTES:",
+        "CACHE_MAX_BYTES": 1024,
+        "CACHE_SIZER": "omi_cache_manager.eviction.serialized_size"
+    })
+    val = await cache.set("dict", {"foo": "bar"})
+    assert val is True
+    assert 0 < cache.get_stats()["bytes"] < 1024
+    await cache.destroy_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_backend_serializer(event_loop):
+    cache = SimpleCacheBackend(config={
+        "CACHE_KEY_PREFIX": "SERIALIZER:",
+        "CACHE_SERIALIZER": "pickle"
+    })
+    value = {"foo": [1, 2, 3], "bar": {"baz": None}}
+    val = await cache.set("dict", value)
+    assert val is True
+    # stored as bytes, a new object is returned on every get
+    val = await cache.get("dict")
+    assert val == value
+    assert val is not value
+    val = await cache.set_many(("str", "foo"), ("bytes", b"\xff\x00"), ("int", 5))
+    assert val is True
+    val = await cache.get_many("str", "bytes", "int", "miss")
+    assert val == ["foo", b"\xff\x00", 5, None]
+    # values written by another codec are still readable
+    cache.serializer = Serializer("json")
+    val = await cache.get("dict")
+    assert val == value
+    val = await cache.set("json", {"foo": "bar"})
+    assert val is True
+    val = await cache.get("json")
+    assert val == {"foo": "bar"}
+    await cache.destroy_cache_context()
+
+    try:
+        SimpleCacheBackend(config={"CACHE_SERIALIZER": "unknown"})
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+def test_serializer_header():
+    serializer = Serializer("json")
+    data = serializer.dumps([1, "a"])
+    assert data[0] & HEADER_MASK == HEADER_MARK
+    assert serializer.loads(data) == [1, "a"]
+    assert serializer.loads(serializer.dumps("中文")) == "中文"
+    # values written before a serializer was configured
+    assert serializer.loads(b"legacy") == "legacy"
+    assert serializer.loads("legacy") == "legacy"
+    assert serializer.loads(b"\xff\xfe") == b"\xff\xfe"
+    assert serializer.loads(None) is None
+    # legacy binary values starting with 0xA0-0xBF are returned as is when the header is not valid
+    assert serializer.loads(bytes((HEADER_MARK | 0x0F,)) + b"x") == bytes((HEADER_MARK | 0x0F,)) + b"x"
+    assert serializer.loads(b"\xb0\x0fx") == b"\xb0\x0fx"
+    assert serializer.loads(b"\xb0") == b"\xb0"
+    # a valid header that fails to decode raises
+    for data in [bytes((HEADER_MARK | 2,)) + b"corrupt pickle", b"\xa3not json", b"\xb0\x00broken zlib"]:
+        try:
+            serializer.loads(data)
+            assert False
+        except Exception as err:
+            assert not isinstance(err, AssertionError)
+
+
+def test_serializer_compress():
+    serializer = Serializer("json", compress_min_bytes=100)
+    value = ["x" * 50] * 20
+    data = serializer.dumps(value)
+    assert data[0] & FLAG_COMPRESSED
+    assert len(data) < 100
+    assert serializer.loads(data) == value
+    # below the threshold
+    data = serializer.dumps(["x"])
+    assert not data[0] & FLAG_COMPRESSED
+    # incompressible data is stored as is
+    data = serializer.dumps(os.urandom(200))
+    assert not data[0] & FLAG_COMPRESSED
+    stats = serializer.get_stats()
+    assert stats["compressed"] == 1
+    assert stats["skipped"] == 1
+    assert stats["decompressed"] == 1
+    # compressed values are readable without compression enabled
+    assert Serializer("pickle").loads(serializer.dumps(value)) == value
+    try:
+        Serializer("pickle", compress_min_bytes=100, compressor="unknown")
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_backend_get_many_mapping(event_loop):
+    backend = get_cache()
+    assert await backend.set_many(("mapping1", "bar1"), ("mapping2", "bar2")) is True
+    val = await backend.get_many(["mapping1", "mapping_miss", "mapping2"])
+    assert val == {"mapping1": "bar1", "mapping2": "bar2"}
+    val = await backend.get_many(iter(["mapping_miss", "mapping2"]), default="-")
+    assert list(val.items()) == [("mapping_miss", "-"), ("mapping2", "bar2")]
+    assert await backend.get_many({"mapping1"}) == {"mapping1": "bar1"}
+    assert await backend.get_many([]) == {}
+    # 参数列表方式仍然返回list
+    assert await backend.get_many("mapping1", "mapping_miss") == ["bar1", None]
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__)])
@@ -0,0 +1,216 @@
+"""
+Copyright 2020 limc.cn All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append("../")
+
+from omi_cache_manager.async_cache_manager import AsyncCacheManager
+from omi_cache_manager.backends import SimpleCacheBackend
+from omi_cache_manager.tiered_backend import TieredCacheBackend
+
+# =======================================
+# install nest_asyncio for unit test when 
+# RuntimeError: This event loop is already running
+# pip install nest_asyncio
+import nest_asyncio
+
+nest_asyncio.apply()
+# =======================================
+
+tiered_cache = AsyncCacheManager(
+    None,
+    cache_backend="tiered_cache",
+    config={
+        "CACHE_TIERED_BACKEND": "simple_cache",
+        "CACHE_TIERED_L1_TTL": 0.05,
+        "CACHE_TIERED_L1_MAX_ENTRIES": 100,
+        "CACHE_KEY_PREFIX": "TIERED_UNIT_TEST:"
+    }
+)
+
+tiered_aredis_cache = AsyncCacheManager(
+    None,
+    cache_backend="TieredCacheBackend",
+    config={
+        "CACHE_TIERED_BACKEND": "aredis",
+        "CACHE_TIERED_L1_TTL": 1,
+        "CACHE_REDIS_SCHEME": "redis",
+        "CACHE_REDIS_HOST": "192.168.201.169",
+        "CACHE_REDIS_PORT": 6379,
+        "CACHE_REDIS_PASSWORD": "",
+        "CACHE_REDIS_DATABASE": 8,
+        'CACHE_REDIS_CONNECTION_TIMEOUT': 3,
+        'CACHE_REDIS_ENCODING': 'utf-8',
+        "CACHE_KEY_PREFIX": "TIERED_A_REDIS_UNIT_TEST:"
+    }
+)
+
+
+@pytest.fixture(scope='module')
+def setup_module(request):
+    def teardown_module():
+        print("teardown_module called.")
+
+    request.addfinalizer(teardown_module)
+    print('setup_module called.')
+
+
+def get_cache():
+    return tiered_cache
+
+
+def test_backend_implement(setup_module):
+    backend = get_cache().cache_backend
+    assert isinstance(backend, TieredCacheBackend)
+    assert isinstance(backend.l1, SimpleCacheBackend)
+    assert isinstance(backend.l2, SimpleCacheBackend)
+    try:
+        TieredCacheBackend(config={})
+    except ValueError as err:
+        assert isinstance(err, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_backend_read_through(event_loop):
+    backend = get_cache().cache_backend
+    await get_cache().clear()
+    val = await backend.l2.set("foo", "bar")
+    assert val is True
+    val = await get_cache().get("foo")
+    assert val == "bar"
+    val = await backend.l1.get("foo")
+    assert val == "bar"
+    val = await get_cache().get("foo")
+    assert val == "bar"
+    val = await get_cache().get("missing")
+    assert val is None
+    stats = backend.get_stats()
+    assert stats["l1_hits"] >= 1
+    assert stats["l2_hits"] >= 1
+    assert stats["misses"] >= 1
+    assert 0 < stats["l1_hit_ratio"] < 1
+    assert 0 < stats["l2_hit_ratio"] < 1
+    # L1 expires after CACHE_TIERED_L1_TTL
+    await asyncio.sleep(0.06)
+    val = await backend.l1.get("foo")
+    assert val is None
+
+
+@pytest.mark.asyncio
+async def test_backend_write_through(event_loop):
+    backend = get_cache().cache_backend
+    val = await get_cache().set("alpha", "Alpha")
+    assert val is True
+    val = await backend.l1.get("alpha")
+    assert val == "Alpha"
+    val = await backend.l2.get("alpha")
+    assert val == "Alpha"
+    val = await get_cache().set_many(("bravo", "Bravo"), charlie="Charlie")
+    assert val is True
+    val = await backend.l1.get_many("bravo", "charlie")
+    assert val == ["Bravo", "Charlie"]
+    val = await get_cache().get_many("alpha", "bravo", "delta")
+    assert val == ["Alpha", "Bravo", None]
+    val = await get_cache().delete("alpha")
+    assert val is True
+    val = await backend.l1.get("alpha")
+    assert val is None
+    val = await get_cache().delete_many("bravo", "charlie")
+    assert val is True
+    val = await get_cache().get_many("bravo", "charlie")
+    assert val == [None, None]
+    val = await get_cache().execute("SET", "echo", "Echo")
+    assert val is True
+    val = await get_cache().clear()
+    assert val is True
+    val = await backend.l1.get("echo")
+    assert val is None
+
+
+@pytest.mark.asyncio
+async def test_backend_l1_ttl_capped(event_loop):
+    cache = AsyncCacheManager(None, cache_backend="tiered_cache", config={
+        "CACHE_TIERED_BACKEND": "simple_cache",
+        "CACHE_TIERED_L1_TTL": 10,
+        "CACHE_KEY_PREFIX": "TIERED_TTL_UNIT_TEST:"
+    })
+    backend = cache.cache_backend
+    await backend.l2.set("short", "value", pexpire=50)
+    await backend.l2.set_many(("short1", "value1"), ("long1", "value1"), pexpire={"short1": 50})
+    assert await cache.get("short") == "value"
+    assert await cache.get_many("short1", "long1") == ["value1", "value1"]
+    # L1的有效期不超过L2中剩余的有效期
+    assert 0 < await backend.l1.ttl("short") <= 0.05
+    assert 0 < await backend.l1.ttl("short1") <= 0.05
+    assert 9 < await backend.l1.ttl("long1") <= 10
+    await asyncio.sleep(0.06)
+    assert await cache.get("short") is None
+    assert await cache.get_many(["short1", "long1"]) == {"long1": "value1"}
+    # L2删除失败时同样失效L1
+    await backend.l1.set("l1_only", "value")
+    try:
+        await cache.delete("l1_only")
+        assert False
+    except KeyError as err:
+        assert isinstance(err, KeyError)
+    assert await backend.l1.get("l1_only") is None
+    await cache.destroy_backend_cache_context()
+
+
+@pytest.mark.asyncio
+async def test_backend_aredis(event_loop):
+    cache = tiered_aredis_cache
+    val = await cache.clear()
+    assert val is True
+    val = await cache.set("foo", "bar", expire=10)
+    assert val is True
+    val = await cache.get("foo")
+    assert val == "bar"
+    val = await cache.cache_backend.l2.get("foo")
+    assert val == "bar"
+    val = await cache.add("foo", "foobar")
+    assert val is False
+    val = await cache.get("foo")
+    assert val == "bar"
+    val = await cache.delete("foo")
+    assert val is True
+    val = await cache.get("foo")
+    assert val is None
+
+
+@pytest.mark.asyncio
+async def test_get_many_mapping(event_loop):
+    cache = get_cache()
+    backend = cache.cache_backend
+    await cache.clear()
+    await backend.l2.set_many(("mapping1", "bar1"), ("mapping2", "bar2"))
+    await cache.get("mapping1")
+    backend.l1_hits, backend.l2_hits, backend.misses = 0, 0, 0
+    val = await cache.get_many(["mapping1", "mapping2", "mapping_miss"])
+    assert list(val.items()) == [("mapping1", "bar1"), ("mapping2", "bar2")]
+    assert (backend.l1_hits, backend.l2_hits, backend.misses) == (1, 1, 1)
+    # L2命中的key回填到L1
+    assert await backend.l1.get("mapping2") == "bar2"
+    assert await cache.get_many(["mapping_miss"], default=None) == {"mapping_miss": None}
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__)])